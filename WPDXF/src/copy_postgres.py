@@ -11,11 +11,59 @@ def main():
 
     parser = argparse.ArgumentParser(description="")
     parser.add_argument("--amount", type=check_gt_0, required=True)
+    parser.add_argument(
+        "--db", choices=["postgres", "sqlite", "index"], default="postgres"
+    )
+    parser.add_argument(
+        "--prune_rel_tf",
+        type=float,
+        default=None,
+        help="Prune postings of tokens with at least this relative term frequency (see prune_postgres.py).",
+    )
+    parser.add_argument("--archive_pruned", action="store_true")
+    parser.add_argument(
+        "--bigrams",
+        action="store_true",
+        help="Also index adjacent token pairs. Without it, the bigram index is incomplete until create_bigrams runs.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=int,
+        default=0,
+        help="Postgres only: load into this database of POSTGRES_CONFIG (a list of shards), each shard loads a disjoint part of the sample.",
+    )
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=0,
+        help="Postgres only: create token_uri_mapping with this number of hash partitions (if it does not exist).",
+    )
 
     logging.basicConfig(filename='copy.log', level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
     args = parser.parse_args()
-    conn = PostgresDBSession()
+    if args.db == "index":
+        from wpdxf.db.postingIndex import PostingIndexBuilder
+
+        PostingIndexBuilder().build_sample(args.amount)
+        return
+
+    if args.db == "sqlite":
+        from wpdxf.db.SQLiteDBSession import SQLiteDBSession
+
+        conn = SQLiteDBSession(
+            prune_rel_tf=args.prune_rel_tf,
+            archive_pruned=args.archive_pruned,
+            bigrams=args.bigrams,
+        )
+    else:
+        conn = PostgresDBSession(
+            prune_rel_tf=args.prune_rel_tf,
+            archive_pruned=args.archive_pruned,
+            bigrams=args.bigrams,
+            partitions=args.partitions,
+            shard=args.shard,
+        )
     conn.copy_from_sample(args.amount)
 
 
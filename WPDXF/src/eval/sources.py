@@ -10,9 +10,57 @@ from wpdxf.wrapping.models.basic.evaluate import PREPARED_XPATHS, BasicEvaluator
 from wpdxf.wrapping.models.nielandt.induce import NielandtInduction
 from wpdxf.wrapping.models.nielandt.reduce import NielandtReducer
 from wpdxf.wrapping.objects.pairs import tokenized
+from wpdxf.wrapping.objects.urlCache import URLCache
 from wpdxf.wrapping.wrapper import wrap
 
 
+def create_query_executor(
+    db: str = "postgres",
+    max_rel_tf: float = 0.01,
+    db_workers: int = 0,
+    max_uris_per_pair: int = 0,
+    max_uris: int = 0,
+    instrument_queries: bool = False,
+    explain_queries: bool = False,
+    use_bigrams: bool = False,
+    db_parallel_workers: int = None,
+) -> QueryExecutor:
+    """The query executor of the corpus database 'db' ("postgres", "sqlite", "index" or "shards")."""
+    if db == "index":
+        from wpdxf.db.postingIndex import PostingIndexExecutor
+
+        return PostingIndexExecutor(
+            max_rel_tf=max_rel_tf,
+            max_uris_per_pair=max_uris_per_pair,
+            max_uris=max_uris,
+            instrument=instrument_queries,
+        )
+    if db == "shards":
+        from wpdxf.db.shardedExecutor import ShardedQueryExecutor
+
+        return ShardedQueryExecutor(
+            max_rel_tf=max_rel_tf,
+            max_uris_per_pair=max_uris_per_pair,
+            max_uris=max_uris,
+            instrument=instrument_queries,
+            num_workers=db_workers,
+            explain=explain_queries,
+            use_bigrams=use_bigrams,
+            parallel_workers=db_parallel_workers,
+        )
+    return QueryExecutor(
+        session_type=db,
+        max_rel_tf=max_rel_tf,
+        num_workers=db_workers,
+        max_uris_per_pair=max_uris_per_pair,
+        max_uris=max_uris,
+        instrument=instrument_queries,
+        explain=explain_queries,
+        use_bigrams=use_bigrams,
+        parallel_workers=db_parallel_workers,
+    )
+
+
 class Source:
     def __init__(self, tau: int = 2) -> None:
         self.tau = tau
@@ -121,9 +169,34 @@ class WebPageSource(Source):
         enrich_predicates: bool = True,
         token_match: str = "eq",
         max_rel_tf: float = 0.01,
+        db_workers: int = 0,
+        prefilter_hosts: bool = False,
+        max_uris_per_pair: int = 0,
+        max_uris: int = 0,
+        instrument_queries: bool = False,
+        explain_queries: bool = False,
+        db: str = "postgres",
+        use_bigrams: bool = False,
+        db_parallel_workers: int = None,
+        url_cache_limit: int = 0,
+        url_cache_eviction: str = "lru",
+        html_workers: int = 8,
     ) -> None:
         super().__init__(tau)
-        self.query_executor = QueryExecutor(max_rel_tf=max_rel_tf)
+        self.html_workers = html_workers
+        self.prefilter_hosts = prefilter_hosts
+        self.query_executor = create_query_executor(
+            db,
+            max_rel_tf=max_rel_tf,
+            db_workers=db_workers,
+            max_uris_per_pair=max_uris_per_pair,
+            max_uris=max_uris,
+            instrument_queries=instrument_queries,
+            explain_queries=explain_queries,
+            use_bigrams=use_bigrams,
+            db_parallel_workers=db_parallel_workers,
+        )
+        self.url_cache = URLCache(limit=url_cache_limit, eviction=url_cache_eviction)
         self.evaluation = BasicEvaluator(
             output_xpath=PREPARED_XPATHS.get(token_match, "eq")
         )
@@ -155,5 +228,8 @@ class WebPageSource(Source):
             self.evaluation,
             self.reduction,
             self.induction,
+            self.prefilter_hosts,
+            self.url_cache,
+            self.html_workers,
         )
         return tables
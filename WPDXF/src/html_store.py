@@ -0,0 +1,35 @@
+import argparse
+import logging
+
+from wpdxf.corpus.retrieval.warc.htmlstore import HTMLStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance of the html store (WARC_FILES).")
+    parser.add_argument(
+        "--import_legacy",
+        action="store_true",
+        help="Import the per-page gzip files of the former layout, the imported files are removed.",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Merge all segments, must not run concurrently with retrievals.",
+    )
+    parser.add_argument("--stats", action="store_true", help="Print the size of the store.")
+
+    logging.basicConfig(filename='html_store.log', level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    args = parser.parse_args()
+    store = HTMLStore()
+    if args.import_legacy:
+        store.import_legacy(remove=True)
+    if args.compact:
+        store.compact()
+    if args.stats:
+        print(store.stats())
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -115,6 +115,74 @@ def parse_args():
     parser.add_argument("--enrich_predicates", action="store_true")
     parser.add_argument("-tm", "--token_match", choices=["eq", "cn"], default="cn")
     parser.add_argument("-tf", "--max_rel_tf", default=0.01, type=float)
+    parser.add_argument(
+        "--db",
+        choices=["postgres", "sqlite", "index", "shards"],
+        default="postgres",
+        help="Corpus database, 'sqlite' uses the embedded database at SQLITE_DB, 'index' the posting index at POSTING_INDEX, 'shards' all Postgres databases of POSTGRES_CONFIG.",
+    )
+    parser.add_argument(
+        "--db_workers",
+        default=0,
+        type=int,
+        help="Number of concurrent DB connections used for posting queries (0: single connection).",
+    )
+    parser.add_argument(
+        "--db_parallel_workers",
+        default=None,
+        type=int,
+        help="Postgres only: parallel workers per query, e.g. to scan the partitions of token_uri_mapping.",
+    )
+    parser.add_argument(
+        "--prefilter_hosts",
+        action="store_true",
+        help="Count example matches per host inside the DB and only retrieve uris of hosts that pass tau.",
+    )
+    parser.add_argument(
+        "--max_uris_per_pair",
+        default=0,
+        type=int,
+        help="Keep at most this many (best ranked) uris per pair (0: no limit).",
+    )
+    parser.add_argument(
+        "--max_uris",
+        default=0,
+        type=int,
+        help="Keep at most this many (best ranked) uris of the examples and of the queries (0: no limit).",
+    )
+    parser.add_argument(
+        "--use_bigrams",
+        action="store_true",
+        help="Restrict posting queries of multi-token pairs by the bigram index (see create_bigrams).",
+    )
+    parser.add_argument(
+        "--url_cache_limit",
+        default=0,
+        type=int,
+        help="Maximal number of entries (pairs and their uris) in the url cache (0: no limit).",
+    )
+    parser.add_argument(
+        "--url_cache_eviction",
+        choices=["lru", "lfu"],
+        default="lru",
+        help="Pairs evicted first from the url cache: least recently or least frequently used.",
+    )
+    parser.add_argument(
+        "--html_workers",
+        default=8,
+        type=int,
+        help="Number of threads retrieving the html of upcoming resources in the background (0: retrieve on demand).",
+    )
+    parser.add_argument(
+        "--instrument_queries",
+        action="store_true",
+        help="Record timings, rows and dropped tokens of each DB request in queries.jsonl.",
+    )
+    parser.add_argument(
+        "--explain_queries",
+        action="store_true",
+        help="Additionally record the query plan (on Postgres: EXPLAIN (ANALYZE, BUFFERS)) for each posting query.",
+    )
 
     args = parser.parse_args()
 
@@ -151,7 +219,22 @@ def run_single_experiment(filename, args):
 
     if args.mode is ModeArgs.WEBPAGE:
         source = WebPageSource(
-            args.tau, args.enrich_predicates, args.token_match, args.max_rel_tf
+            args.tau,
+            args.enrich_predicates,
+            args.token_match,
+            args.max_rel_tf,
+            args.db_workers,
+            args.prefilter_hosts,
+            args.max_uris_per_pair,
+            args.max_uris,
+            args.instrument_queries,
+            args.explain_queries,
+            args.db,
+            args.use_bigrams,
+            args.db_parallel_workers,
+            args.url_cache_limit,
+            args.url_cache_eviction,
+            args.html_workers,
         )
     elif args.mode is ModeArgs.WEBTABLE:
         source = WebTableSource(args.tau)
@@ -0,0 +1,102 @@
+import argparse
+import logging
+
+from wpdxf.db.PostgresDBSession import PostgresDBSession
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Maintenance of an existing database: deletion and deduplication of uris, pruning of high-frequency tokens and (re-)building of the bigram index."
+    )
+    parser.add_argument(
+        "-tf",
+        "--max_rel_tf",
+        type=float,
+        default=None,
+        help="Postings of tokens with at least this relative term frequency are pruned.",
+    )
+    parser.add_argument(
+        "--archive",
+        action="store_true",
+        help="Move pruned postings to 'token_uri_mapping_pruned' instead of deleting them.",
+    )
+    parser.add_argument(
+        "--delete_archive",
+        nargs="+",
+        default=[],
+        help="Unload archives (names of their term/mapping files) from the corpus.",
+    )
+    parser.add_argument(
+        "--delete_host", nargs="+", default=[], help="Delete all uris of these hosts."
+    )
+    parser.add_argument(
+        "--delete_prefix", nargs="+", default=[], help="Delete all uris with these prefixes."
+    )
+    parser.add_argument(
+        "--delete_uris",
+        type=str,
+        default=None,
+        help="Delete the uris listed in this file (one per line).",
+    )
+    parser.add_argument(
+        "--dedupe_uris",
+        action="store_true",
+        help="Keep a single copy of each uri (see wpdxf.db.uris.normalize_uri), the one of the newest archive.",
+    )
+    parser.add_argument(
+        "--recount",
+        action="store_true",
+        help="Recompute term_count from the postings first (databases loaded without term_count).",
+    )
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=None,
+        help="Postgres only: migrate token_uri_mapping to this number of hash partitions on tokenid.",
+    )
+    parser.add_argument(
+        "--bigrams",
+        action="store_true",
+        help="(Re-)build the bigram index from the remaining postings.",
+    )
+    parser.add_argument("--db", choices=["postgres", "sqlite"], default="postgres")
+    parser.add_argument(
+        "--shard", type=int, default=0, help="Postgres only: index of the database in POSTGRES_CONFIG."
+    )
+
+    logging.basicConfig(filename='prune.log', level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    args = parser.parse_args()
+    if args.db == "sqlite" and args.partitions is not None:
+        parser.error("--partitions is not supported by --db sqlite")
+    if args.db == "sqlite":
+        from wpdxf.db.SQLiteDBSession import SQLiteDBSession
+
+        conn = SQLiteDBSession()
+    else:
+        conn = PostgresDBSession(shard=args.shard)
+    if args.dedupe_uris:
+        # Keys all uris first, the deletions below match uris by their key.
+        conn.dedupe_uris()
+    for archive in args.delete_archive:
+        conn.delete_archive(archive)
+    for netloc in args.delete_host:
+        conn.delete_host(netloc)
+    for prefix in args.delete_prefix:
+        conn.delete_uri_prefix(prefix)
+    if args.delete_uris is not None:
+        with open(args.delete_uris, encoding="utf-8") as f:
+            conn.delete_uris([line.strip() for line in f if line.strip()])
+    if args.recount:
+        conn.update_term_counts()
+    if args.max_rel_tf is not None:
+        conn.prune_postings(args.max_rel_tf, args.archive)
+    if args.partitions is not None:
+        conn.partition_postings(args.partitions)
+    if args.bigrams:
+        conn.create_bigrams()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import gzip
+import json
+from os.path import join
+
+import pytest
+
+from wpdxf.corpus.retrieval.warc.cdx import CDXCache, CDXIndex, url_to_surt
+
+CAPTURES = [
+    ("http://example.com/", "20211016000000", "301"),
+    ("https://example.com/", "20211017000000", "200"),
+    ("http://example.com/a", "20211016000000", "200"),
+    ("http://example.com/a?x=1", "20211016000000", "200"),
+    ("http://example.com/b", "20211016000000", "200"),
+    ("http://example.com/dir/", "20211016000000", "200"),
+    ("http://other.org/", "20211016000000", "200"),
+    ("http://www.other.org/page", "20211016000000", "200"),
+]
+
+
+def create_index(index_dir, block_size=2):
+    """Writes CAPTURES as a ZipNum index: gzipped blocks of 'block_size' lines in two shards."""
+    lines = sorted(
+        f"{url_to_surt(url)} {ts} "
+        + json.dumps({"url": url, "status": status, "filename": f"{i}.warc.gz", "offset": str(i), "length": "10"})
+        for i, (url, ts, status) in enumerate(CAPTURES)
+    )
+    blocks = [lines[i : i + block_size] for i in range(0, len(lines), block_size)]
+    cluster = []
+    shards = {"cdx-00000.gz": b"", "cdx-00001.gz": b""}
+    for i, block in enumerate(blocks):
+        shard = "cdx-00000.gz" if i < len(blocks) // 2 else "cdx-00001.gz"
+        data = gzip.compress("".join(l + "\n" for l in block).encode())
+        cluster.append(f"{' '.join(block[0].split(' ', 2)[:2])}\t{shard}\t{len(shards[shard])}\t{len(data)}\t{i + 1}\n")
+        shards[shard] += data
+    for shard, data in shards.items():
+        with open(join(index_dir, shard), "wb") as f:
+            f.write(data)
+    with open(join(index_dir, "cluster.idx"), "w") as f:
+        f.writelines(cluster)
+
+
+def test_url_to_surt():
+    assert url_to_surt("https://www.Example.com:443/Path/?b=1&a=2#top") == "com,example)/path?a=2&b=1"
+    assert url_to_surt("http://sub.example.com:8080") == "com,example,sub:8080)/"
+    assert url_to_surt("http://example.com/a/?") == "com,example)/a"
+    assert url_to_surt(
+        "http://example.com/page?JSESSIONID=0123456789abcdef0123456789ABCDEF&id=2"
+    ) == "com,example)/page?id=2"
+
+
+# Urls and their keys in the cluster.idx / CDX files of the Common Crawl index.
+INDEX_KEYS = [
+    ("https://commoncrawl.org/faq/", "org,commoncrawl)/faq"),
+    ("https://commoncrawl.org/", "org,commoncrawl)/"),
+    ("http://www.example.com/index.html", "com,example)/index.html"),
+    ("https://en.wikipedia.org/wiki/Main_Page", "org,wikipedia,en)/wiki/main_page"),
+    ("https://www2.example.co.uk/path/to/dir/", "uk,co,example)/path/to/dir"),
+    ("http://example.com/search?q=Test&lang=en", "com,example)/search?lang=en&q=test"),
+]
+
+
+@pytest.mark.parametrize("url, key", INDEX_KEYS)
+def test_url_to_surt_index_keys(url, key):
+    assert url_to_surt(url) == key
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 3])
+def test_lookup(tmp_path, block_size):
+    # Captures of a url might span several blocks.
+    create_index(str(tmp_path), block_size)
+    index = CDXIndex(str(tmp_path))
+
+    # The successful capture is preferred over the redirect.
+    assert index.lookup("http://www.example.com")["status"] == "200"
+    assert index.lookup("http://example.com/a")["url"] == "http://example.com/a"
+    assert index.lookup("http://example.com/A?x=1")["url"] == "http://example.com/a?x=1"
+    assert index.lookup("http://other.org/page")["url"] == "http://www.other.org/page"
+    assert index.lookup("http://example.com/c") is None
+    # Trailing slashes are not part of the key.
+    assert index.lookup("https://example.com/dir")["url"] == "http://example.com/dir/"
+    assert len(index.captures("com,example)/")) == 2
+
+    output = index.lookup_many(url for url, *_ in CAPTURES + [("http://unknown.com/",)])
+    assert sorted(output) == sorted(set(url for url, *_ in CAPTURES))
+    assert output["http://example.com/b"]["filename"] == "4.warc.gz"
+
+
+def test_cdx_cache(tmp_path):
+    capture = {"filename": "0.warc.gz", "offset": "10", "length": "20", "status": "200"}
+    cache = CDXCache(str(tmp_path))
+    cache.put({"http://example.com/a": capture, "http://example.com/dead": None})
+    cache.put({"http://example.com/b": None}, status="fetch failed")
+
+    # Entries are shared by all instances (processes) using the same directory.
+    other = CDXCache(str(tmp_path))
+    assert other.get(["http://example.com/a", "http://example.com/dead", "http://example.com/c"]) == {
+        "http://example.com/a": dict(capture, offset=10, length=20),
+        "http://example.com/dead": None,
+    }
+    with other.connection:
+        assert other.connection.execute("SELECT status FROM captures WHERE uri = ?", ("http://example.com/b",)).fetchone() == ("fetch failed",)
+
+    # Negative entries expire, captures do not.
+    expired = CDXCache(str(tmp_path), negative_ttl=0)
+    assert list(expired.get(["http://example.com/a", "http://example.com/dead"])) == ["http://example.com/a"]
+    for c in (cache, other, expired):
+        c.close()
@@ -0,0 +1,138 @@
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+from wpdxf.corpus.retrieval.warc.fetch import FETCH_ERRORS, RangeError, RangeFetcher, coalesce
+
+PAGES = {
+    "http://example.com/a": b"<html><body>First page</body></html>",
+    "http://example.com/b": b"<html><body>Second page</body></html>",
+}
+
+
+def create_warc():
+    """A gzipped WARC file and the (offset, length) of each record."""
+    buffer = BytesIO()
+    writer = WARCWriter(buffer, gzip=True)
+    records = {}
+    for uri, html in PAGES.items():
+        offset = buffer.tell()
+        http_headers = StatusAndHeaders("200 OK", [("Content-Type", "text/html")], protocol="HTTP/1.1")
+        writer.write_record(
+            writer.create_warc_record(uri, "response", payload=BytesIO(html), http_headers=http_headers)
+        )
+        records[uri] = (offset, buffer.tell() - offset)
+    return buffer.getvalue(), records
+
+
+class WARCServer(BaseHTTPRequestHandler):
+    """Serves 'content' like a file server; 'mode' simulates servers that ignore the Range header
+    ("ignore") or close the connection early ("truncate")."""
+
+    content = b""
+    mode = "range"
+    requests = []
+
+    def do_GET(self):
+        WARCServer.requests.append(self.headers.get("Range"))
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if self.mode == "ignore" or match is None:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(self.content)))
+            self.end_headers()
+            self.wfile.write(self.content)
+            return
+        start, end = map(int, match.groups())
+        body = self.content[start : end + 1]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(self.content)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[: len(body) // 2] if self.mode == "truncate" else body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    WARCServer.content, records = create_warc()
+    WARCServer.mode = "range"
+    WARCServer.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), WARCServer)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}/", records
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_fetch_record(server):
+    base_url, records = server
+    fetcher = RangeFetcher(base_url)
+    for uri, (offset, length) in records.items():
+        record = fetcher.fetch_record("crawl.warc.gz", offset, length)
+        assert record.rec_headers.get_header("WARC-Target-URI") == uri
+        assert record.content_stream().read() == PAGES[uri]
+        assert WARCServer.requests[-1] == f"bytes={offset}-{offset + length - 1}"
+
+    offset, length = records["http://example.com/b"]
+    assert fetcher.fetch("crawl.warc.gz", offset, length) == WARCServer.content[offset:]
+    fetcher.close()
+
+
+def test_invalid_responses(server):
+    base_url, records = server
+    fetcher = RangeFetcher(base_url, retries=0)
+    offset, length = records["http://example.com/a"]
+
+    # The whole file is not accepted as the record.
+    WARCServer.mode = "ignore"
+    with pytest.raises(RangeError):
+        fetcher.fetch_record("crawl.warc.gz", offset, length)
+
+    # A range beyond the end of the file.
+    WARCServer.mode = "range"
+    with pytest.raises(RangeError):
+        fetcher.fetch("crawl.warc.gz", len(WARCServer.content) - 10, 20)
+
+    WARCServer.mode = "truncate"
+    with pytest.raises(FETCH_ERRORS):
+        fetcher.fetch("crawl.warc.gz", offset, length)
+    fetcher.close()
+
+
+def test_coalesce():
+    ranges = [("a", 100, 50), ("b", 0, 10), ("a", 0, 95), ("a", 170, 10), ("a", 100, 50)]
+    assert coalesce(ranges, max_gap=10) == [
+        (("a", 0, 150), [("a", 0, 95), ("a", 100, 50)]),
+        (("a", 170, 10), [("a", 170, 10)]),
+        (("b", 0, 10), [("b", 0, 10)]),
+    ]
+    assert coalesce(ranges, max_gap=20, max_size=160) == [
+        (("a", 0, 150), [("a", 0, 95), ("a", 100, 50)]),
+        (("a", 170, 10), [("a", 170, 10)]),
+        (("b", 0, 10), [("b", 0, 10)]),
+    ]
+    assert coalesce(ranges, max_gap=20)[0] == (("a", 0, 180), [("a", 0, 95), ("a", 100, 50), ("a", 170, 10)])
+
+
+def test_fetch_records(server):
+    base_url, records = server
+    fetcher = RangeFetcher(base_url, retries=0)
+    ranges = [("crawl.warc.gz", *records[uri]) for uri in PAGES]
+
+    # Both (adjacent) records are fetched by a single request.
+    output = fetcher.fetch_records(ranges)
+    assert len(WARCServer.requests) == 1
+    assert [output[r].content_stream().read() for r in ranges] == list(PAGES.values())
+
+    # A failed coalesced request is retried per record.
+    WARCServer.mode = "ignore"
+    assert fetcher.fetch_records(ranges) == {}
+    assert len(WARCServer.requests) == 4
+    fetcher.close()
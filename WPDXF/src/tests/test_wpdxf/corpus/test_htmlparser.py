@@ -0,0 +1,134 @@
+import pytest
+from lxml import etree
+from wpdxf.corpus.parsers.htmlparser import HTMLParser
+from wpdxf.wrapping.models.basic.evaluate import PREPARED_XPATHS, xpath
+
+CORPUS = {
+    "page": b"""<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <title>Cities</title>
+  <style>body { color: red; }</style>
+  <script>var end = "</body>";</script>
+</head>
+<body class="  main   page " lang="en">
+  <!-- navigation -->
+  <nav><ul>
+    <li><a href="/cities?name=K\xc3\xb6ln &amp; Bonn">K\xc3\xb6ln</a>
+    <li><a href="/cities?name=Berlin">Berlin</a>
+  </ul></nav>
+  <table id=cities>
+    <tr><th>City<th>Country
+    <tr><td>Berlin<td lang="en">Germany</td>
+    <tr><td>Paris <!-- capital --> <td lang="fr">France
+  </table>
+  <p>Population &gt; 1&nbsp;000&nbsp;000 <b>bold</b> <i>italic</i>
+  <p>Second   paragraph
+     spanning lines.
+</body>
+</html>
+""",
+    "whitespace": """<body>
+  <div> leading and trailing </div>
+  <span>a</span> <span>b</span>
+  <span>c</span><!-- x --> <!-- y --> <span>d</span>
+  text <!-- x -->
+  <pre>  keep
+     this  </pre>
+  <textarea>  and
+ this </textarea>
+</body>""",
+    "comments": """<body><!--[if lt IE 9]><p>Old browser</p><![endif]--><!--! kept -->
+  <div>a <!-- removed --> b</div><div>c<!----> d</div></body>""",
+    "nested": """<html><body><div>Outer</div>
+  <html lang="de"><head><title>Inner</title></head><body class="inner">Inner body</body></html>
+  <div>After</div></body></html><p>After the document</p>""",
+    "forms": """<body><form action="/süche">
+  <input type="checkbox" checked disabled=""> Checkbox
+  <select multiple><option value="ä b" selected>Ä</option><option value="a" selected>A<option value="b">B</select>
+  <a href=" /with spaces ">Link</a> <a name="änchor" rel=" nofollow  noopener ">Anchor</a>
+  <img src="/bild ä.png" alt="Bild"> <input type="image" src="/ä.png" disabled readonly="">
+</form></body>""",
+    "malformed": """<body><div><p>Unclosed <b>bold <i>both</b> italic</i>
+  <table><tr><td>Cell<div>in cell</table>
+  <ul><li>One<li>Two</ul><p>Para<div>Block</div>
+  <span>Entity &amp; &lt;tag&gt; &copy; &#8364;</span>
+  <br><hr/><img src=x.png></div>""",
+    "attributes": """<html><head><meta name="description" content="<body class='fake'>"></head>
+<body><div title="<body>" data-x='</body>'>Title</div><a href="/x?<html>" title=<head>>Link</a>
+  <input value="</html>"><p>After</p></body></html>""",
+    "script in body": """<body><script>
+  document.write("<body><p>Not markup</p></body>");
+</script>Text<style>p {}</style> after <noscript><p>No script</p></noscript></body>""",
+}
+TERMS = ["Berlin", "Germany", "France", "Inner", "After", "Checkbox", "Cell", "Two", "Text", "bold", "Title"]
+
+
+def legacy_clean_html(raw_html):
+    """The former cleaning pipeline (BeautifulSoup + htmlmin), the reference of HTMLParser."""
+    bs4 = pytest.importorskip("bs4")
+    htmlmin = pytest.importorskip("htmlmin")
+
+    soup = bs4.BeautifulSoup(raw_html, "html.parser")
+    for element in soup.find_all(lambda tag: tag.name in ["script", "style"]):
+        element.decompose()
+    body = soup.body
+    if body is None:
+        return ""
+    for element in body.find_all(lambda tag: tag.name in ("html", "body", "head")):
+        element.name = "div"
+    return htmlmin.minify(
+        str(soup.body), remove_comments=True, remove_empty_space=True, reduce_empty_attributes=False
+    )
+
+
+def dom(tree):
+    return [
+        (element.tag, sorted(element.attrib.items()), element.text, element.tail)
+        for element in tree.iter()
+    ]
+
+
+def evaluate(tree):
+    """The paths of all elements found by the initial evaluation of each term (see BasicEvaluator)."""
+    return {
+        term: [
+            tree.getroottree().getpath(e)
+            for e in xpath(PREPARED_XPATHS["cn"], {}, tree, term=term)
+            + xpath(PREPARED_XPATHS["eq"], {}, tree, term=term)
+        ]
+        for term in TERMS
+    }
+
+
+@pytest.mark.parametrize("name", CORPUS)
+def test_equivalence(name):
+    raw_html = CORPUS[name]
+    parser = HTMLParser(raw_html)
+    legacy_tree = etree.HTML(legacy_clean_html(raw_html))
+    html_tree = etree.HTML(parser.clean_html)
+
+    assert dom(html_tree) == dom(legacy_tree)
+    assert dom(parser.clean_tree) == dom(legacy_tree)
+    assert evaluate(parser.clean_tree) == evaluate(legacy_tree)
+
+
+def test_clean_html():
+    parser = HTMLParser(CORPUS["whitespace"])
+    assert parser.clean_html == (
+        "<body><div> leading and trailing </div><span>a</span> <span>b</span>"
+        "<span>c</span> <span>d</span> text "
+        "<pre>  keep\n     this  </pre><textarea>  and\n this </textarea></body>"
+    )
+    assert HTMLParser(CORPUS["forms"]).clean_html.startswith('<body><form action="/süche">')
+
+    # Pages without a body.
+    assert HTMLParser("<html><head><title>Title</title></head></html>").clean_html == ""
+    assert HTMLParser("<html><head><title>Title</title></head></html>").clean_tree is None
+
+
+def test_decode():
+    raw_html = '<meta charset="windows-1252"><body>Köln €</body>'
+    assert HTMLParser(raw_html.encode("windows-1252")).clean_html == "<body>Köln €</body>"
+    assert HTMLParser(raw_html.encode("utf-8")).clean_html == "<body>Köln €</body>"
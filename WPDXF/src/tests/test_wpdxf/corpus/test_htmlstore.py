@@ -0,0 +1,84 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+
+from wpdxf.corpus.retrieval.warc.htmlstore import HTMLStore, html_key
+from wpdxf.utils.utils import compress_file
+
+HTMLS = {f"http://example.com/{i}": f"<body>Page {i} äöü</body>" * (i + 1) for i in range(20)}
+
+
+def _write(store_dir, htmls):
+    store = HTMLStore(store_dir)
+    store.put_many(htmls)
+    store.close()
+
+
+def test_put_get(tmp_path):
+    store = HTMLStore(str(tmp_path), segment_size=200)
+    store.put("http://example.com/0", HTMLS["http://example.com/0"])
+    store.put_many(HTMLS)
+    assert "http://example.com/0" in store
+    assert store.get("http://example.com/1") == HTMLS["http://example.com/1"]
+    assert store.get("http://example.com/missing") is None
+    assert store.get_many(list(HTMLS) + ["http://example.com/missing"]) == HTMLS
+    # Pages are stored once, segments are started once they exceed segment_size.
+    assert store.stats()["pages"] == len(HTMLS)
+    assert store.stats()["segments"] > 1
+
+    # Pages written by this store are visible to other stores (and the other way round).
+    other = HTMLStore(str(tmp_path))
+    assert other.get_many(HTMLS) == HTMLS
+    other.put("http://example.com/other", "<body>Other</body>")
+    assert store.get("http://example.com/other") == "<body>Other</body>"
+    store.close()
+    other.close()
+
+
+def test_concurrent_processes(tmp_path):
+    uris = list(HTMLS)
+    chunks = [{uri: HTMLS[uri] for uri in uris[i::4]} for i in range(4)]
+    with get_context("spawn").Pool(4) as pool:
+        pool.starmap(_write, [(str(tmp_path), chunk) for chunk in chunks])
+    store = HTMLStore(str(tmp_path))
+    # Each process appended to its own segment.
+    assert store.stats() == {"pages": len(HTMLS), "segments": 4, "bytes": store.stats()["bytes"]}
+    assert store.get_many(uris) == HTMLS
+    store.close()
+
+
+def test_concurrent_threads(tmp_path):
+    reference = HTMLStore(str(tmp_path / "reference"))
+    reference.put_many(HTMLS)
+    store = HTMLStore(str(tmp_path / "store"))
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(store.put_many, [HTMLS] * 8))
+    # Each page is appended once.
+    assert store.stats() == reference.stats()
+    assert store.get_many(HTMLS) == HTMLS
+    store.close()
+    reference.close()
+
+
+def test_compact(tmp_path):
+    store = HTMLStore(str(tmp_path), segment_size=100)
+    store.put_many(HTMLS)
+    store.close()
+    # Unindexed data, e.g. of an interrupted write.
+    with open(os.path.join(tmp_path, "segment-0-0.pack"), "wb") as f:
+        f.write(b"\0" * 1000)
+
+    assert store.compact() >= 1000
+    assert store.stats()["segments"] < len(HTMLS)
+    assert store.get_many(HTMLS) == HTMLS
+    store.close()
+
+
+def test_import_legacy(tmp_path):
+    for uri, html in HTMLS.items():
+        compress_file(os.path.join(tmp_path, html_key(uri)), html)
+    store = HTMLStore(str(tmp_path))
+    assert store.import_legacy(remove=True) == len(HTMLS)
+    assert store.get_many(HTMLS) == HTMLS
+    assert not any(os.path.isfile(os.path.join(tmp_path, html_key(uri))) for uri in HTMLS)
+    store.close()
@@ -0,0 +1,106 @@
+import pytest
+import requests
+from lxml import etree
+import wpdxf.corpus.retrieval.warc.fetch as fetch
+import wpdxf.corpus.retrieval.warc.warcrecord as warcrecord
+from wpdxf.corpus.retrieval.warc.cdx import CDXCache
+from wpdxf.corpus.retrieval.warc.htmlstore import HTMLStore
+from wpdxf.corpus.retrieval.warc.prefetch import HTMLPrefetcher
+from wpdxf.wrapping.objects.resource import Resource
+
+from test_wpdxf.corpus.test_fetch import PAGES, WARCServer, server
+
+
+@pytest.fixture
+def corpus(server, tmp_path, monkeypatch):
+    """Retrieves the pages of the local WARC server, the index is resolved from 'records'."""
+    base_url, records = server
+    lookups = []
+
+    def search_index(uri):
+        lookups.append(uri)
+        offset, length = records[uri]
+        return {"filename": "crawl.warc.gz", "offset": offset, "length": length}
+
+    monkeypatch.setattr(fetch, "_default_fetcher", fetch.RangeFetcher(base_url, retries=0))
+    monkeypatch.setattr(warcrecord, "_cdx_cache", CDXCache(str(tmp_path)))
+    monkeypatch.setattr(warcrecord, "_local_index", False)
+    monkeypatch.setattr(warcrecord, "_html_store", HTMLStore(str(tmp_path)))
+    monkeypatch.setattr(warcrecord, "search_index", search_index)
+    return lookups
+
+
+def test_prefetch(corpus):
+    uris = list(PAGES)
+    trees = {}
+    with HTMLPrefetcher(num_workers=2, chunk_size=1) as prefetcher:
+        prefetcher.submit(uris + uris)
+        htmls = prefetcher.get_htmls(uris, trees)
+        # Consumed results are released.
+        assert prefetcher._futures == {}
+    assert htmls == {
+        "http://example.com/a": "<body>First page</body>",
+        "http://example.com/b": "<body>Second page</body>",
+    }
+    # The cleaned trees of prefetched pages are handed out as well.
+    assert {uri: tree.findtext("body") for uri, tree in trees.items()} == {
+        "http://example.com/a": "First page",
+        "http://example.com/b": "Second page",
+    }
+    # Each uri is retrieved once, by one request per chunk.
+    assert sorted(corpus) == sorted(uris)
+    assert len(WARCServer.requests) == 2
+
+    # Retrieved pages are cached.
+    with HTMLPrefetcher() as prefetcher:
+        assert prefetcher.get_htmls(uris) == htmls
+    assert len(corpus) == 2
+
+
+def test_get_htmls_same_record(corpus, monkeypatch):
+    # Both uris resolve to the record of the first page.
+    search_index = warcrecord.search_index
+    monkeypatch.setattr(warcrecord, "search_index", lambda uri: search_index(uri.rstrip("/")))
+    uris = ["http://example.com/a", "http://example.com/a/"]
+    assert warcrecord.get_htmls(uris) == dict.fromkeys(uris, "<body>First page</body>")
+    assert len(WARCServer.requests) == 1
+    assert warcrecord.html_store().get_many(uris) == dict.fromkeys(uris, "<body>First page</body>")
+
+
+def test_transient_failures(corpus, monkeypatch):
+    uris = list(PAGES)
+    search_index = warcrecord.search_index
+
+    def unavailable_index(uri):
+        raise requests.exceptions.ConnectionError("The index is not available.")
+
+    # Failed lookups are not cached.
+    monkeypatch.setattr(warcrecord, "search_index", unavailable_index)
+    assert warcrecord.get_htmls(uris) == dict.fromkeys(uris)
+    assert warcrecord.cdx_cache().get(uris) == {}
+
+    # Incomplete responses are not cached as failed.
+    monkeypatch.setattr(warcrecord, "search_index", search_index)
+    WARCServer.mode = "truncate"
+    assert warcrecord.get_htmls(uris) == dict.fromkeys(uris)
+    assert None not in warcrecord.cdx_cache().get(uris).values()
+    WARCServer.mode = "range"
+    assert warcrecord.get_htmls(uris[:1]) == {uris[0]: "<body>First page</body>"}
+
+    # Invalid records are.
+    WARCServer.content = b"\0" * len(WARCServer.content)
+    assert warcrecord.get_htmls(uris) == {uris[0]: "<body>First page</body>", uris[1]: None}
+    assert warcrecord.cdx_cache().get(uris[1:]) == {uris[1]: None}
+
+
+def test_fetch_html_trees(corpus):
+    resource = Resource("example.com", list(PAGES))
+    resource.fetch_html()
+    wp = resource.webpages[0]
+    assert wp.html == "<body>First page</body>"
+
+    # The cleaned tree of a retrieved page is handed out once, afterwards the html is parsed.
+    tree = wp.tree()
+    assert tree.findtext("body") == "First page"
+    assert wp.tree() is not tree
+    assert etree.tostring(wp.tree()) == etree.tostring(tree)
@@ -0,0 +1,73 @@
+from os.path import join
+
+import numpy as np
+from wpdxf.db.postingIndex import PostingIndex, PostingIndexBuilder, PostingIndexExecutor
+from wpdxf.utils.settings import Settings
+from wpdxf.utils.utils import compress_file
+from wpdxf.wrapping.objects.pairs import Example, Query
+
+WARCS = {
+    "a" * 47: ("http://www.exA.com/capitals", "berlin is in germany and paris is in france"),
+    "b" * 47: ("http://www.exA.com/other", "germany borders france germany"),
+    "c" * 47: ("https://exB.org:8080/list", "rome italy berlin germany"),
+}
+
+
+def build_index(tmp_path, run_size=4) -> str:
+    bname = "posting_index.wet.gz"
+    terms = join(Settings().TERM_STORE, bname)
+    compress_file(
+        terms,
+        "".join(
+            f"{warc} {pos} {token}\n"
+            for warc, (_, text) in WARCS.items()
+            for pos, token in enumerate(text.split())
+        ),
+    )
+    compress_file(
+        join(Settings().MAP_STORE, bname),
+        "".join(f"{warc} {uri}\n" for warc, (uri, _) in WARCS.items()),
+    )
+
+    index_dir = join(tmp_path, "index")
+    PostingIndexBuilder(index_dir, run_size=run_size).build([terms])
+    return index_dir
+
+
+def test_build(tmp_path):
+    index = PostingIndex(build_index(tmp_path))
+
+    tokens = sorted(set(" ".join(text for _, text in WARCS.values()).split()))
+    assert index.vocab.tolist() == [token.encode("utf-8") for token in tokens]
+    assert index.hosts == ["www.exA.com", "exB.org:8080"]
+    assert [index.uri(i) for i in range(3)] == [uri for uri, _ in WARCS.values()]
+
+    lookup = index.lookup(["germany", "rome", "unknown", "x" * 100])
+    assert sorted(lookup) == ["germany", "rome"]
+    tokenid, term_count = lookup["germany"]
+    assert term_count == 4
+    uriids, positions = index.postings(tokenid)
+    assert uriids.tolist() == [0, 1, 1, 2]
+    assert positions.tolist() == [3, 0, 3, 3]
+
+    # The result does not depend on the number of (sorted) runs.
+    other = PostingIndex(build_index(tmp_path, run_size=1000))
+    assert np.array_equal(index.posting_uris, other.posting_uris)
+    assert np.array_equal(index.posting_positions, other.posting_positions)
+
+
+def test_query_pairs(tmp_path):
+    query_executor = PostingIndexExecutor(build_index(tmp_path), max_rel_tf=1.0)
+
+    examples = [Example("berlin", "germany"), Example("paris", "france")]
+    output = query_executor.query_pairs(examples)
+    assert {uri: set(pairs) for uri, pairs in output.items()} == {
+        "http://www.exA.com/capitals": set(examples),
+        "https://exB.org:8080/list": {examples[0]},
+    }
+
+    assert query_executor.frequent_hosts(examples, 2) == {"www.exA.com"}
+    output = query_executor.query_pairs([Query("rome")], hosts={"www.exA.com"})
+    assert output == {}
+    output = query_executor.query_pairs([Query("rome")], hosts={"exB.org:8080"})
+    assert list(output) == ["https://exB.org:8080/list"]
@@ -0,0 +1,93 @@
+from os.path import join
+
+from wpdxf.db.queryGenerator import QueryExecutor
+from wpdxf.db.shardedExecutor import ShardedQueryExecutor
+from wpdxf.db.SQLiteDBSession import SQLiteDBSession
+from wpdxf.utils.utils import compress_file
+from wpdxf.wrapping.objects.pairs import Example, Query
+
+SHARDS = (
+    {
+        "a" * 47: ("http://www.exA.com/capitals", "berlin is in germany and paris is in france"),
+        "b" * 47: ("http://www.exA.com/other", "germany borders france"),
+    },
+    {
+        "c" * 47: ("https://exB.org:8080/list", "rome italy berlin germany"),
+        "d" * 47: ("http://www.exA.com/more", "paris france"),
+    },
+)
+
+
+def create_shard(tmp_path, i: int) -> QueryExecutor:
+    terms, mapping = join(tmp_path, f"terms{i}.wet.gz"), join(tmp_path, f"mapping{i}.wet.gz")
+    compress_file(
+        terms,
+        "".join(
+            f"{warc} {pos} {token}\n"
+            for warc, (_, text) in SHARDS[i].items()
+            for pos, token in enumerate(text.split())
+        ),
+    )
+    compress_file(mapping, "".join(f"{warc} {uri}\n" for warc, (uri, _) in SHARDS[i].items()))
+
+    shard = QueryExecutor("sqlite")
+    shard.session = SQLiteDBSession(join(tmp_path, f"shard{i}.sqlite"))
+    shard.session._copy_from(mapping, terms)
+    return shard
+
+
+def test_query_pairs(tmp_path):
+    shards = [create_shard(tmp_path, i) for i in range(len(SHARDS))]
+    query_executor = ShardedQueryExecutor(shards, max_rel_tf=1.0)
+
+    examples = [Example("berlin", "germany"), Example("paris", "france")]
+    output = query_executor.query_pairs(list(examples))
+    assert {uri: set(pairs) for uri, pairs in output.items()} == {
+        "http://www.exA.com/capitals": set(examples),
+        "https://exB.org:8080/list": {examples[0]},
+        "http://www.exA.com/more": {examples[1]},
+    }
+    assert query_executor.token_counts["france"] == 3
+
+    # Hosts are counted over all shards.
+    assert query_executor.frequent_hosts(examples, 2) == {"www.exA.com"}
+    output = query_executor.query_pairs([Query("paris")], hosts={"www.exA.com"})
+    assert sorted(output) == ["http://www.exA.com/capitals", "http://www.exA.com/more"]
+
+
+def test_global_term_count(tmp_path):
+    shards = [create_shard(tmp_path, i) for i in range(len(SHARDS))]
+    # MAX_CORPUS_FREQ is 1000, 'germany' occurs twice in the first and once in the second shard.
+    query_executor = ShardedQueryExecutor(shards, max_rel_tf=0.003)
+
+    output = query_executor.query_pairs([Query("rome germany"), Query("borders")])
+    assert query_executor.dropped_tokens == {"germany"}
+    assert all("germany" not in shard.token_dict for shard in shards)
+    assert sorted(output) == ["http://www.exA.com/other", "https://exB.org:8080/list"]
+
+
+def test_pruned_tokens(tmp_path):
+    shards = [create_shard(tmp_path, i) for i in range(len(SHARDS))]
+    # Tokens with at least 2 postings (e.g. 'germany') are pruned in the first shard only,
+    # they are dropped in all shards.
+    shards[0].session.prune_postings(0.002)
+    query_executor = ShardedQueryExecutor(shards, max_rel_tf=1.0)
+
+    output = query_executor.query_pairs([Example("berlin", "germany")])
+    assert sorted(output) == ["http://www.exA.com/capitals", "https://exB.org:8080/list"]
+    assert query_executor.dropped_tokens == {"germany"}
+    assert all("germany" not in shard.token_dict for shard in shards)
+
+
+def test_explain(tmp_path):
+    shards = [create_shard(tmp_path, i) for i in range(len(SHARDS))]
+    query_executor = ShardedQueryExecutor(shards, max_rel_tf=1.0, explain=True)
+    assert query_executor.instrument
+    assert all(shard.explain and shard.instrument for shard in shards)
+
+    examples = [Example("berlin", "germany")]
+    query_executor.update_token_dict(set.union(*(example.tokens for example in examples)))
+    stats = {"batches": []}
+    query_executor.query_resolved(examples, None, stats)
+    assert {batch["shard"] for batch in stats["batches"]} == {0, 1}
+    assert all("plan" in batch for batch in stats["batches"])
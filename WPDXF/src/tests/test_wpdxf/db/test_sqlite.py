@@ -0,0 +1,286 @@
+from os.path import join
+
+from wpdxf.db.queryGenerator import QueryExecutor
+from wpdxf.db.SQLiteDBSession import SQLiteDBPool, SQLiteDBSession
+from wpdxf.utils.utils import compress_file
+from wpdxf.wrapping.objects.pairs import Example, Query
+
+WARCS = {
+    "a" * 47: ("http://www.exA.com/capitals", "berlin is in germany and paris is in france"),
+    "b" * 47: ("http://www.exA.com/other", "germany borders france"),
+    "c" * 47: ("https://exB.org:8080/list", "rome italy berlin germany"),
+}
+
+
+def create_session(tmp_path, **kwargs) -> SQLiteDBSession:
+    terms, mapping = join(tmp_path, "terms.wet.gz"), join(tmp_path, "mapping.wet.gz")
+    compress_file(
+        terms,
+        "".join(
+            f"{warc} {pos} {token}\n"
+            for warc, (_, text) in WARCS.items()
+            for pos, token in enumerate(text.split())
+        ),
+    )
+    compress_file(mapping, "".join(f"{warc} {uri}\n" for warc, (uri, _) in WARCS.items()))
+
+    session = SQLiteDBSession(join(tmp_path, "corpus.sqlite"), **kwargs)
+    session._copy_from(mapping, terms)
+    return session
+
+
+def test_copy_from(tmp_path):
+    session = create_session(tmp_path)
+
+    with session.execute("SELECT uri, netloc FROM uris ORDER BY uriid") as cur:
+        assert cur.fetchall() == [
+            ("http://www.exA.com/capitals", "www.exA.com"),
+            ("http://www.exA.com/other", "www.exA.com"),
+            ("https://exB.org:8080/list", "exB.org:8080"),
+        ]
+    with session.execute(
+        "SELECT term_count FROM tokens WHERE token IN (%s, %s) ORDER BY token",
+        ("germany", "rome"),
+    ) as cur:
+        assert cur.fetchall() == [(3,), (1,)]
+
+    session.delete_entries_for_uri("http://www.exA.com/other")
+    with session.execute("SELECT COUNT(*) FROM token_uri_mapping") as cur:
+        assert cur.fetchone() == (13,)
+    session.close()
+
+
+def test_query_pairs(tmp_path):
+    query_executor = QueryExecutor("sqlite", max_rel_tf=1.0)
+    query_executor.session = create_session(tmp_path)
+
+    examples = [Example("berlin", "germany"), Example("paris", "france")]
+    output = query_executor.query_pairs(examples)
+    assert {uri: set(pairs) for uri, pairs in output.items()} == {
+        "http://www.exA.com/capitals": set(examples),
+        "https://exB.org:8080/list": {examples[0]},
+    }
+
+    assert query_executor.frequent_hosts(examples, 2) == {"www.exA.com"}
+    output = query_executor.query_pairs([Query("rome")], hosts={"www.exA.com"})
+    assert output == {}
+    output = query_executor.query_pairs([Query("rome")], hosts={"exB.org:8080"})
+    assert list(output) == ["https://exB.org:8080/list"]
+
+
+def test_query_pooled(tmp_path):
+    query_executor = QueryExecutor("sqlite", max_rel_tf=1.0, num_workers=2)
+    query_executor.session = create_session(tmp_path)
+    query_executor.session.connection.commit()
+    query_executor.pool = SQLiteDBPool(2, join(tmp_path, "corpus.sqlite"))
+
+    examples = [Example("berlin", "germany"), Example("paris", "france")]
+    output = query_executor.query_pairs(list(examples))
+    assert {uri: set(pairs) for uri, pairs in output.items()} == {
+        "http://www.exA.com/capitals": set(examples),
+        "https://exB.org:8080/list": {examples[0]},
+    }
+    # The batch of the second pair has no rows.
+    output = query_executor.query_pairs(list(examples), hosts={"exB.org:8080"})
+    assert output == {"https://exB.org:8080/list": examples[:1]}
+    query_executor.pool.close()
+
+
+def test_cap_uris(tmp_path):
+    query_executor = QueryExecutor("sqlite", max_rel_tf=1.0, max_uris_per_pair=1, max_uris=1)
+    query_executor.session = create_session(tmp_path)
+
+    # The uris of a pair do not depend on the other pairs of the batch.
+    examples = [Example("berlin", "germany"), Example("paris", "france")]
+    output = query_executor.query_pairs(list(examples))
+    assert output == {"http://www.exA.com/capitals": examples}
+    assert query_executor.query_pairs(examples[:1]) == {"http://www.exA.com/capitals": examples[:1]}
+    # Uris of hosts with more uris of the pair first.
+    assert list(query_executor.query_pairs([Query("germany")])) == ["http://www.exA.com/capitals"]
+
+    # The total cap is not applied by 'query_pairs' (see ResourceCollector.collect_pairs).
+    query_executor.max_uris_per_pair = 0
+    output = query_executor.query_pairs([Query("germany")])
+    assert len(output) == 3
+    assert list(query_executor.cap_uris(output)) == ["http://www.exA.com/capitals"]
+
+
+def test_prune_postings(tmp_path):
+    query_executor = QueryExecutor("sqlite", max_rel_tf=0.003)
+    query_executor.session = session = create_session(tmp_path)
+    queries = [Query("germany"), Query("france"), Query("rome")]
+    target = query_executor.query_pairs(list(queries))
+    assert sorted(target) == [
+        "http://www.exA.com/capitals",
+        "http://www.exA.com/other",
+        "https://exB.org:8080/list",
+    ]
+
+    # MAX_CORPUS_FREQ is 1000, 'germany' (3 postings) is dropped by the query executor.
+    assert session.prune_postings(0.003, archive=True) == 3
+    with session.execute("SELECT token, term_count FROM tokens WHERE pruned") as cur:
+        assert cur.fetchall() == [("germany", 3)]
+    with session.execute("SELECT COUNT(*) FROM token_uri_mapping_pruned") as cur:
+        assert cur.fetchone() == (3,)
+    assert session.prune_postings(0.003) == 0
+
+    query_executor.token_dict.clear()
+    query_executor.dropped_tokens.clear()
+    assert query_executor.query_pairs(list(queries)) == target
+
+    # Pruned tokens are dropped for any max_rel_tf, their postings are incomplete.
+    query_executor = QueryExecutor("sqlite", max_rel_tf=1.0)
+    query_executor.session = session
+    assert query_executor.query_pairs([Query("germany")]) == {}
+    assert query_executor.dropped_tokens == {"germany"}
+    output = query_executor.query_pairs([Example("berlin", "germany")])
+    assert sorted(output) == ["http://www.exA.com/capitals", "https://exB.org:8080/list"]
+
+
+def test_bigrams(tmp_path):
+    query_executor = QueryExecutor("sqlite", max_rel_tf=1.0, use_bigrams=True)
+    query_executor.session = session = create_session(tmp_path, bigrams=True)
+
+    stmt = "SELECT token, bigram_count FROM bigrams JOIN tokens ON first_tokenid = tokenid WHERE second_tokenid = (SELECT tokenid FROM tokens WHERE token = %s) ORDER BY token"
+    with session.execute(stmt, ("germany",)) as cur:
+        target = cur.fetchall()
+    assert target == [("berlin", 1), ("in", 1)]
+    # Building the bigrams from the existing postings yields the same index.
+    session.create_bigrams()
+    with session.execute(stmt, ("germany",)) as cur:
+        assert cur.fetchall() == target
+
+    queries = [Query("berlin germany"), Query("germany berlin"), Query("rome")]
+    output = query_executor.query_pairs(list(queries))
+    assert {uri: set(pairs) for uri, pairs in output.items()} == {
+        "https://exB.org:8080/list": {queries[0], queries[2]},
+    }
+    masks = query_executor.create_masks(queries)
+    stmt, _ = query_executor.create_query(masks)
+    # 'germany berlin' does not occur and 'rome' has no bigram.
+    assert stmt.count("bigram_uri_mapping") == 1
+    assert "p1" not in stmt
+
+
+def test_bigrams_incomplete(tmp_path):
+    query_executor = QueryExecutor("sqlite", max_rel_tf=1.0, use_bigrams=True)
+    # Copied without bigrams, the index is incomplete and not used.
+    query_executor.session = session = create_session(tmp_path)
+    assert not session.bigrams_complete()
+    queries = [Query("berlin germany"), Query("germany borders")]
+    output = query_executor.query_pairs(list(queries))
+    assert {uri: set(pairs) for uri, pairs in output.items()} == {
+        "http://www.exA.com/other": {queries[1]},
+        "https://exB.org:8080/list": {queries[0]},
+    }
+    stmt, _ = query_executor.create_query(query_executor.create_masks(queries))
+    assert "bigram_uri_mapping" not in stmt
+
+    session.create_bigrams()
+    assert session.bigrams_complete()
+    assert query_executor.query_pairs(list(queries)) == output
+    stmt, _ = query_executor.create_query(query_executor.create_masks(queries))
+    assert stmt.count("bigram_uri_mapping") == 2
+
+    # A copy without bigrams invalidates the index.
+    terms, mapping = join(tmp_path, "terms2.wet.gz"), join(tmp_path, "mapping2.wet.gz")
+    compress_file(terms, f"{'d' * 47} 0 berlin\n{'d' * 47} 1 germany\n")
+    compress_file(mapping, f"{'d' * 47} http://www.exC.com/new\n")
+    session._copy_from(mapping, terms)
+    assert not session.bigrams_complete()
+    output = query_executor.query_pairs(list(queries))
+    assert "http://www.exC.com/new" in output
+
+
+def test_dedupe_uris(tmp_path):
+    session = create_session(tmp_path, bigrams=True)
+
+    # A newer archive with variants of stored uris replaces the older copies.
+    terms, mapping = join(tmp_path, "terms2.wet.gz"), join(tmp_path, "mapping2.wet.gz")
+    compress_file(terms, f"{'d' * 47} 0 rome\n{'e' * 47} 0 rome\n{'e' * 47} 1 paris\n")
+    compress_file(
+        mapping,
+        f"{'d' * 47} https://www.exa.com/capitals/\n{'e' * 47} http://WWW.exA.com:80/capitals#top\n",
+    )
+    session._copy_from(mapping, terms)
+
+    with session.execute("SELECT uriid, uri, uri_key FROM uris ORDER BY uriid") as cur:
+        assert cur.fetchall() == [
+            (1, "http://WWW.exA.com:80/capitals#top", "www.exa.com/capitals"),
+            (2, "http://www.exA.com/other", "www.exa.com/other"),
+            (3, "https://exB.org:8080/list", "exb.org:8080/list"),
+        ]
+    stmt = "SELECT token, term_count FROM tokens WHERE token IN (%s, %s, %s) ORDER BY token"
+    with session.execute(stmt, ("germany", "paris", "rome")) as cur:
+        assert cur.fetchall() == [("germany", 2), ("paris", 1), ("rome", 2)]
+    with session.execute(
+        "SELECT token FROM token_uri_mapping NATURAL JOIN tokens WHERE uriid = 1 ORDER BY position"
+    ) as cur:
+        assert cur.fetchall() == [("rome",), ("paris",)]
+    with session.execute(
+        "SELECT SUM(bigram_count), (SELECT COUNT(*) FROM bigram_uri_mapping) FROM bigrams"
+    ) as cur:
+        assert cur.fetchone() == (6, 6)
+
+    # Re-loading the older archive does not overwrite the newer copy.
+    session._copy_from(join(tmp_path, "mapping.wet.gz"), join(tmp_path, "terms.wet.gz"))
+    with session.execute("SELECT uri FROM uris WHERE uriid = 1") as cur:
+        assert cur.fetchone() == ("http://WWW.exA.com:80/capitals#top",)
+    with session.execute(stmt, ("germany", "paris", "rome")) as cur:
+        assert cur.fetchall() == [("germany", 2), ("paris", 1), ("rome", 2)]
+
+    # Copies stored before the uri_key existed are removed by 'dedupe_uris'.
+    with session.execute(
+        "INSERT INTO uris(uri, netloc) VALUES (%s, %s)", ("https://exB.org:8080/list/", "exB.org:8080")
+    ):
+        pass
+    assert session.dedupe_uris() == 1
+    with session.execute("SELECT COUNT(*) FROM uris WHERE uri_key IS NULL") as cur:
+        assert cur.fetchone() == (0,)
+    session.close()
+
+
+def test_bulk_delete(tmp_path):
+    session = create_session(tmp_path, bigrams=True)
+    stmt = """SELECT (SELECT COUNT(*) FROM uris), (SELECT SUM(term_count) FROM tokens),
+        (SELECT COUNT(*) FROM token_uri_mapping), (SELECT SUM(bigram_count) FROM bigrams),
+        (SELECT COUNT(*) FROM bigram_uri_mapping)"""
+
+    assert session.delete_uri_prefix("http://www.exA.com/oth") == 1
+    with session.execute(stmt) as cur:
+        assert cur.fetchone() == (2, 13, 13, 11, 11)
+    assert session.delete_uris(["HTTPS://www.exa.com/capitals/", "http://unknown.com"]) == 1
+    assert session.delete_host("www.exA.com") == 0
+    with session.execute(stmt) as cur:
+        assert cur.fetchone() == (1, 4, 4, 3, 3)
+
+    assert session.delete_archive(join(tmp_path, "terms.wet.gz")) == 1
+    with session.execute(stmt) as cur:
+        assert cur.fetchone() == (0, 0, 0, 0, 0)
+    session.close()
+
+
+def test_delete_unkeyed_uris(tmp_path):
+    session = create_session(tmp_path)
+    # Corpora loaded before uri_key was introduced.
+    with session.execute("UPDATE uris SET uri_key = NULL"):
+        pass
+
+    assert session.delete_uris(["HTTPS://www.exa.com/capitals/", "http://unknown.com"]) == 1
+    session.delete_entries_for_uri("http://www.exA.com/other")
+    with session.execute("SELECT uri FROM uris") as cur:
+        assert cur.fetchall() == [("https://exB.org:8080/list",)]
+    session.close()
+
+
+def test_corpus_version(tmp_path):
+    query_executor = QueryExecutor("sqlite", max_rel_tf=0.01)
+    query_executor.session = session = create_session(tmp_path)
+    namespace = query_executor.cache_namespace()
+    assert namespace.endswith("corpus.sqlite@1?max_rel_tf=0.01&max_abs_tf=1000&max_uris_per_pair=0")
+
+    # Any change of the stored postings invalidates cached results.
+    session.delete_host("exB.org:8080")
+    assert query_executor.cache_namespace() != namespace
+    assert session.corpus_version().endswith("@2")
+    session.close()
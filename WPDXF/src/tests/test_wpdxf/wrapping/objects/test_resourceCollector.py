@@ -0,0 +1,78 @@
+from wpdxf.db.queryGenerator import QueryExecutor
+from wpdxf.wrapping.objects.pairs import Example
+from wpdxf.wrapping.objects import resourceCollector
+from wpdxf.wrapping.objects.resourceCollector import ResourceCollector
+from wpdxf.wrapping.objects.uritree import URITree
+from wpdxf.wrapping.objects.urlCache import URLCache
+
+
+def create_uritree() -> URITree:
+    uritree = URITree()
+    uritree.add_uri("http://www.exA.com/stepA", [0, 1], [0])
+    uritree.add_uri("http://www.exB.com/stepA/stepC", [0, 1], [0, 1])
+    uritree.add_uri("http://www.exB.com/stepB/stepD", [2, 3], [2, 3, 4])
+    uritree.add_uri("http://www.exC.com/stepA", [0, 1], [0, 1])
+    uritree.add_uri("http://www.exD.com/stepA", [0, 1], [5])
+    return uritree
+
+
+def test_group_uritree(tmp_path):
+    collector = ResourceCollector(None, tau=2, limit=0, cache=URLCache(str(tmp_path)))
+    groups = collector.group_uritree(create_uritree())
+    assert groups == [
+        ("www.exB.com", ["http://www.exB.com/stepB/stepD", "http://www.exB.com/stepA/stepC"]),
+        ("www.exC.com/stepA", ["http://www.exC.com/stepA"]),
+        ("www.exA.com/stepA", ["http://www.exA.com/stepA"]),
+        ("www.exD.com/stepA", ["http://www.exD.com/stepA"]),
+    ]
+
+    # The best resources over all hosts are selected, not the first ones.
+    collector.limit = 2
+    assert collector.group_uritree(create_uritree()) == groups[:2]
+    collector.limit = 1
+    assert collector.group_uritree(create_uritree()) == groups[:1]
+
+
+class FixedQueryExecutor(QueryExecutor):
+    """Answers 'query_pairs' from a fixed result, records the queried pairs."""
+
+    def __init__(self, url_dict, **kwargs) -> None:
+        super().__init__("sqlite", **kwargs)
+        self.url_dict = url_dict
+        self.queried = []
+
+    def corpus_version(self) -> str:
+        return "fixed@1"
+
+    def query_pairs(self, pairs, hosts=None):
+        self.queried.extend(pairs)
+        url_dict = {uri: [p for p in uri_pairs if p in pairs] for uri, uri_pairs in self.url_dict.items()}
+        return {uri: uri_pairs for uri, uri_pairs in url_dict.items() if uri_pairs}
+
+
+class NoReportWriter:
+    def start_timer(self, key):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def test_collect_pairs_max_uris(tmp_path, monkeypatch):
+    monkeypatch.setattr(resourceCollector, "ReportWriter", NoReportWriter)
+    ex0, ex1 = Example("berlin", "germany"), Example("paris", "france")
+    query_executor = FixedQueryExecutor(
+        {"http://a.com/x": [ex0, ex1], "http://b.com/y": [ex0]}, max_uris=1
+    )
+    collector = ResourceCollector(query_executor, cache=URLCache(str(tmp_path)))
+
+    assert collector.collect_pairs([ex0, ex1]) == {"http://a.com/x": {ex0, ex1}}
+    # The cache holds the uncapped result of each pair.
+    assert collector.cache.get(collector.namespace, [ex0]) == {"http://a.com/x": {ex0}, "http://b.com/y": {ex0}}
+
+    # Cached results are capped as well.
+    assert collector.collect_pairs([ex0]) == {"http://a.com/x": {ex0}}
+    assert query_executor.queried == [ex0, ex1]
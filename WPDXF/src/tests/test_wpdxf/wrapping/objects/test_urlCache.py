@@ -0,0 +1,94 @@
+from os.path import join
+
+from wpdxf.utils.utils import compress_file
+from wpdxf.wrapping.objects.pairs import Example, Query
+from wpdxf.wrapping.objects.urlCache import URLCache, pair_to_cache_key
+
+NS = "sqlite:///corpus.sqlite@1?max_rel_tf=0.01"
+
+
+def test_put_get(tmp_path):
+    cache = URLCache(str(tmp_path))
+    ex0, ex1, q0 = Example("berlin", "germany"), Example("paris", "france"), Query("rome")
+    cache.put(NS, [ex0, ex1, q0], {"http://a.com/x": [ex0, ex1], "http://b.com/y": [ex0]})
+    cache.close()
+
+    cache = URLCache(str(tmp_path))
+    # 'q0' did not match any uri, but it is cached.
+    assert cache.cached(NS, [ex0, q0, Query("madrid")]) == {ex0, q0}
+    assert cache.get(NS, [ex0, ex1, q0]) == {"http://a.com/x": {ex0, ex1}, "http://b.com/y": {ex0}}
+    assert cache.get(NS, [ex1]) == {"http://a.com/x": {ex1}}
+
+    # Cached pairs are not changed.
+    cache.put(NS, [ex1], {"http://c.com/z": [ex1]})
+    assert cache.get(NS, [ex1]) == {"http://a.com/x": {ex1}}
+
+    # Results of another corpus version are never returned.
+    new_ns = NS.replace("@1", "@2")
+    assert cache.cached(new_ns, [ex0, ex1]) == set()
+    assert cache.get(new_ns, [ex0]) == {}
+    assert cache.stats() == {"hits": 2, "misses": 3, "hit_rate": 0.4, "pairs": 3, "entries": 6}
+
+    cache.put(new_ns, [ex0], {})
+    assert cache.purge(new_ns) == 3
+    assert cache.cached(new_ns, [ex0]) == {ex0}
+
+
+def test_eviction(tmp_path):
+    ex0, ex1, ex2 = Example("berlin", "germany"), Example("paris", "france"), Example("rome", "italy")
+    for eviction, evicted in (("lru", ex1), ("lfu", ex0)):
+        cache = URLCache(join(tmp_path, eviction), limit=5, eviction=eviction)
+        cache.put(NS, [ex0], {"http://a.com/x": [ex0]})
+        cache.put(NS, [ex1], {"http://a.com/x": [ex1]})
+        # 'ex1' is used more often, 'ex0' more recently.
+        cache.get(NS, [ex1])
+        cache.get(NS, [ex1])
+        cache.get(NS, [ex0])
+        assert cache.size() == 4
+
+        cache.put(NS, [ex2], {"http://b.com/y": [ex2]})
+        assert cache.size() == 4
+        assert cache.cached(NS, [ex0, ex1, ex2]) == {ex0, ex1, ex2} - {evicted}
+        cache.close()
+
+
+def test_concurrent_put(tmp_path):
+    ex0, ex1 = Example("berlin", "germany"), Example("paris", "france")
+    cache, other = URLCache(str(tmp_path), limit=3), URLCache(str(tmp_path))
+    assert cache.size() == 0
+
+    # 'other' stores 'ex0' after 'cache' looked it up.
+    lookup = cache._pairids
+    cache._pairids = lambda namespace, keys: {}
+    other.put(NS, [ex0], {"http://b.com/y": [ex0]})
+    cache.put(NS, [ex0, ex1], {"http://a.com/x": [ex0, ex1]})
+    cache._pairids = lookup
+
+    assert cache.get(NS, [ex0, ex1]) == {"http://b.com/y": {ex0}, "http://a.com/x": {ex1}}
+    assert cache.size() == 4
+    cache.close()
+    other.close()
+
+
+def test_unlimited(tmp_path, monkeypatch):
+    cache = URLCache(str(tmp_path))
+
+    # Without a limit, storing pairs never scans the cache's size.
+    def size():
+        raise AssertionError
+
+    monkeypatch.setattr(cache, "size", size)
+    cache.put(NS, [Query("rome")], {"http://a.com/x": [Query("rome")]})
+    assert cache.evict() == 0
+    cache.close()
+
+
+def test_import_legacy(tmp_path):
+    ex0, q0 = Example("berlin", "germany"), Query("rome")
+    compress_file(join(tmp_path, pair_to_cache_key(ex0)), "http://a.com/x\nhttp://b.com/y\n")
+    compress_file(join(tmp_path, pair_to_cache_key(q0)), "")
+
+    cache = URLCache(str(tmp_path))
+    assert cache.import_legacy(NS) == 2
+    assert cache.cached(NS, [ex0, q0]) == {ex0, q0}
+    assert cache.get(NS, [ex0, q0]) == {"http://a.com/x": {ex0}, "http://b.com/y": {ex0}}
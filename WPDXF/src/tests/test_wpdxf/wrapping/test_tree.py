@@ -124,3 +124,35 @@ def test_group_uris():
     for t_name, t_uris in target:
         assert t_name in output
         assert sorted(output[t_name]) == sorted(t_uris)
+
+
+def test_match_bitsets():
+    uritree = URITree()
+    uritree.add_uri("http://www.exA.com/stepA/stepC", ["a", "b"], ["q"])
+    uritree.add_uri("http://www.exA.com/stepB", ["c"], [])
+    uritree.add_uri("http://www.exB.com/stepA", ["b"], ["q"])
+
+    # Pairs are numbered in the order they are added, shared by all trees.
+    assert uritree.pair_ids.pairs == ["a", "b", "q", "c"]
+    root = uritree.root_nodes["www.exA.com"]
+    assert (root.ex_bits, root.q_bits) == (0b1011, 0b100)
+    assert root.ex_matches == {"a", "b", "c"}
+    assert uritree.root_nodes["www.exB.com"].children["stepA"].ex_matches == {"b"}
+
+    uritree.reduce(2)
+    assert list(uritree.root_nodes) == ["www.exA.com"]
+
+
+def test_leaves_and_paths():
+    uritree = URITree()
+    uritree.add_uri("http://www.exA.com/stepA/stepC", [0], [])
+    uritree.add_uri("http://www.exA.com/stepA/stepD", [1], [])
+    root = uritree.root_nodes["www.exA.com"]
+    step_a = root.children["stepA"]
+    assert [l.uri for l in step_a.leaves()] == [l.uri for l in step_a.bfs_filter(lambda n: not n.children)]
+    assert step_a.children["stepD"].path() == "www.exA.com/stepA/stepD"
+
+    # Leaves are updated after a path was added.
+    uritree.add_uri("http://www.exA.com/stepB", [0], [])
+    assert len(root.leaves()) == 3
+    assert len(step_a.leaves()) == 2
@@ -0,0 +1,92 @@
+import argparse
+import logging
+
+from pandas import read_csv
+
+from eval.sources import create_query_executor
+from main import parse_benchmarks, select_cols
+from wpdxf.utils.report import ReportWriter
+from wpdxf.wrapping.objects.pairs import Example, Query, tokenized
+from wpdxf.wrapping.objects.resourceCollector import ResourceCollector
+from wpdxf.wrapping.objects.urlCache import URLCache
+
+
+def warm(collector: ResourceCollector, filename: str, input, output):
+    """Caches the uris of each row of a benchmark, used as example and as query."""
+    benchmark = read_csv(filename, encoding="utf-8", encoding_errors="strict").astype(str)
+    data_inp = select_cols(input, benchmark).values.tolist()
+    data_out = select_cols(output, benchmark).values.tolist()
+
+    examples = set(Example(*tokenized(x, y)) for x, y in zip(data_inp, data_out))
+    queries = set(Query(tokenized(x)) for x in data_inp)
+    collector.collect_pairs(list(examples))
+    collector.collect_pairs(list(queries))
+    logging.info(f"Warmed the url cache for {filename}: {collector.cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance of the url cache (URL_CACHE).")
+    parser.add_argument(
+        "--import_legacy",
+        action="store_true",
+        help="Import the per-pair gzip files of the former cache layout (as results of the current corpus).",
+    )
+    parser.add_argument(
+        "--warm",
+        type=str,
+        default=None,
+        help="Benchmark file or directory (see main.py), the uris of all its rows are cached.",
+    )
+    parser.add_argument("--input", default=0, help="Index (int) or header (str) considered as input.")
+    parser.add_argument("--output", default=-1, help="Index (int) or header (str) considered as output.")
+    parser.add_argument(
+        "--purge",
+        action="store_true",
+        help="Remove all entries of other corpus versions or query parameters.",
+    )
+    parser.add_argument("--stats", action="store_true", help="Print the size of the cache.")
+    parser.add_argument(
+        "--limit",
+        default=0,
+        type=int,
+        help="Maximal number of entries (pairs and their uris) in the url cache (0: no limit).",
+    )
+    parser.add_argument("--eviction", choices=["lru", "lfu"], default="lru")
+    # Query parameters, must match the ones of the experiments (see main.py).
+    parser.add_argument(
+        "--db", choices=["postgres", "sqlite", "index", "shards"], default="postgres"
+    )
+    parser.add_argument("-tf", "--max_rel_tf", default=0.01, type=float)
+    parser.add_argument("--db_workers", default=0, type=int)
+    parser.add_argument("--max_uris_per_pair", default=0, type=int)
+    parser.add_argument("--max_uris", default=0, type=int)
+
+    logging.basicConfig(filename='url_cache.log', level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    args = parser.parse_args()
+    cache = URLCache(limit=args.limit, eviction=args.eviction)
+    query_executor = create_query_executor(
+        args.db,
+        max_rel_tf=args.max_rel_tf,
+        db_workers=args.db_workers,
+        max_uris_per_pair=args.max_uris_per_pair,
+        max_uris=args.max_uris,
+    )
+    namespace = query_executor.cache_namespace()
+
+    if args.import_legacy:
+        cache.import_legacy(namespace)
+    if args.purge:
+        cache.purge(namespace)
+    if args.warm:
+        ReportWriter("url_cache-warm")
+        collector = ResourceCollector(query_executor, cache=cache)
+        for filename in parse_benchmarks(args.warm):
+            warm(collector, filename, args.input, args.output)
+    if args.stats:
+        print(cache.stats())
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
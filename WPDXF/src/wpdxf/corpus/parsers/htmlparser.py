@@ -1,70 +1,260 @@
-import bs4
-from htmlmin import minify
+import re
+import threading
+from typing import Union
+from uuid import uuid4
+
+from lxml import etree
+
+# The attributes of a tag, quoted values may contain any character but the quote (e.g. "<body>").
+_ATTRIBUTES = r"""(?:[^>"'=]|=\s*(?:"[^"]*"|'[^']*'|[^\s>]*))*>?"""
+# Comments, script and style elements (their content is not markup), html, body or head tags
+# and any other tag (skipped as a whole, so that attribute values are not matched).
+_TAG_RE = re.compile(
+    r"<!--.*?(?:-->|\Z)|<(script|style)\b.*?(?:</\1\s*>|\Z)"
+    rf"|<(/?)(html|body|head)(?=[\s/>]){_ATTRIBUTES}|</?[a-z][^\s/>]*{_ATTRIBUTES}",
+    re.I | re.S,
+)
+_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w:.-]+)""", re.I)
+# Whitespace as defined by HTML (and htmlmin).
+_SPACE_RE = re.compile("[\x20\x09\x0a\x0c\x0d]+")
+_ALL_SPACE_RE = re.compile("^[\x20\x09\x0a\x0c\x0d]+$")
+# Whitespace inside these tags is preserved.
+_PRE_TAGS = ("pre", "textarea")
+
+# Comments kept by htmlmin (conditional comments and comments starting with "!").
+_KEPT_COMMENT_RE = re.compile(r"^(?:!|\[if\s)")
+# Attributes holding whitespace-separated lists (normalized by BeautifulSoup).
+_LIST_ATTRIBUTES = (
+    "//@class | //@accesskey | //@dropzone | //a/@rel | //a/@rev | //link/@rel | //link/@rev"
+    " | //td/@headers | //th/@headers | //form/@accept-charset | //object/@archive | //area/@rel"
+    " | //icon/@sizes | //iframe/@sandbox | //output/@for"
+)
+# Attributes whose values are escaped as URIs by libxml2's html serializer.
+_URI_ATTRIBUTES = "//@href | //@src | //@action | //a/@name"
+# Boolean attributes, libxml2 sets the value of a valueless one to its name and serializes it without value.
+_BOOLEAN_NAMES = (
+    "checked", "compact", "declare", "defer", "disabled", "ismap", "multiple",
+    "nohref", "noresize", "noshade", "nowrap", "readonly", "selected",
+)
+_BOOLEAN_ATTRIBUTES = " | ".join(f"//@{name}" for name in _BOOLEAN_NAMES)
+
+_local = threading.local()
+
+
+def _parser() -> etree.HTMLParser:
+    """The parser of the calling thread (lxml parsers must not be shared between threads).
+    Comments are removed while minifying, the text around them is minified separately (as by htmlmin).
+    """
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = etree.HTMLParser(remove_pis=True)
+    return parser
+
+
+def _escape_attribute(value: str) -> str:
+    return value.replace("&", "&amp;").replace('"', "&quot;")
 
 
 class HTMLParser:
+    """Cleans the html of a webpage: only the body is kept, without scripts, styles and comments
+    and with minified whitespace (whitespace-only text containing a line break is removed,
+    other whitespace is collapsed to a single space, except inside pre and textarea).
+    html, body or head tags inside the body are renamed to div to preserve the structure.
+
+    The page is parsed once by lxml (libxml2), 'clean_tree' can be evaluated directly,
+    'clean_html' is its serialization. Both are DOM-equivalent to the former
+    BeautifulSoup + htmlmin pipeline (see tests/test_wpdxf/corpus/test_htmlparser.py).
+    """
+
+    _clean_tree = None
     _clean_html = None
 
-    def __init__(self, raw_html: str, charset: str = "utf-8") -> None:
-        # TODO: Handle charset
-        self.soup = bs4.BeautifulSoup(raw_html, "html.parser")
-        # if self.soup.contains_replacement_characters or charset != "utf-8":
-        #     print(charset, self.soup.original_encoding)
+    def __init__(self, raw_html: Union[str, bytes], charset: str = "utf-8") -> None:
+        """
+        Args:
+            raw_html (Union[str, bytes]): The html of the webpage.
+            charset (str, optional): The encoding of a raw_html given as bytes, the encoding declared
+                by the page and windows-1252 are tried if it does not apply. Defaults to "utf-8".
+        """
+        self.raw_html = raw_html if isinstance(raw_html, str) else self.decode(raw_html, charset)
+
+    @staticmethod
+    def decode(raw_html: bytes, charset: str = "utf-8") -> str:
+        encodings = [charset]
+        declared = _CHARSET_RE.search(raw_html, 0, 4096)
+        if declared:
+            encodings.append(declared.group(1).decode("ascii"))
+        for encoding in encodings:
+            try:
+                return raw_html.decode(encoding)
+            except (UnicodeDecodeError, LookupError):
+                continue
+        return raw_html.decode("windows-1252", errors="replace")
+
+    @staticmethod
+    def extract_body(html: str) -> str:
+        """The source of the first body element (None if there is none),
+        with nested html, body and head tags renamed to div (not inside attribute values).
+        Content after the body's end tag is dropped.
+        """
+        parts = []
+        pos = end = None
+        nested = {"html": 0, "body": 0, "head": 0}
+        for match in _TAG_RE.finditer(html):
+            closing, name = match.group(2, 3)
+            if name is None:
+                # A comment, script, style or any other tag.
+                continue
+            name = name.lower()
+            if pos is None:
+                if name == "body" and not closing:
+                    pos = match.start()
+                continue
+            # Only the name is replaced, the attributes are kept.
+            name_end = match.end(3)
+            if not closing:
+                nested[name] += 1
+                parts.extend((html[pos : match.start()], "<div"))
+            elif nested[name]:
+                nested[name] -= 1
+                parts.extend((html[pos : match.start()], "</div"))
+            elif name == "head":
+                continue
+            else:
+                # The end of the body (or the document).
+                end = match.start()
+                break
+            pos = name_end
+        if pos is None:
+            return None
+        parts.append(html[pos:end])
+        return "".join(parts)
+
+    @property
+    def clean_tree(self) -> etree._Element:
+        """The cleaned page (the root element), None if the page has no body."""
+        if self._clean_tree is None:
+            body_html = self.extract_body(self.raw_html)
+            if body_html is None:
+                return None
+            root = etree.fromstring(body_html, _parser())
+            if root is None or root.find("body") is None:
+                return None
+            etree.strip_elements(root, "script", "style", with_tail=False)
+            body = root.find("body")
+            HTMLParser.minify(body)
+            HTMLParser.normalize_attributes(body)
+            self._clean_tree = root
+        return self._clean_tree
 
     @property
-    def clean_html(self):
+    def clean_html(self) -> str:
         if self._clean_html is None:
-            for element in self.soup.find_all(HTMLParser.checkTags):
-                element.decompose()
-            # for element in self.soup.find_all(HTMLParser.checkSubtree):
-            #     element.decompose()
-
-            body = self.soup.body
-            if body is None:
-                # TODO: Handle webpages without a body tag
-                print("Value Error by:", self.soup.prettify())
-                #raise ValueError
+            tree = self.clean_tree
+            if tree is None:
                 return ""
-
-            # Avoid OpenTagNotFoundError which is caused by html, body or head tags inside tags that are not the main html tag.
-            # If such tags exist, rename them with a general tag to preserve the structure as accurate as possible.
-            # See: https://github.com/mankyd/htmlmin/blob/220b1d16442eb4b6fafed338ee3b61f698a01e63/htmlmin/parser.py#L254
-            for element in body.find_all(lambda t: t.name in ("html", "body", "head")):
-                element.name = "div"
-
-            self._clean_html = minify(
-                str(self.soup.body),
-                remove_comments=True,
-                remove_empty_space=True,
-                reduce_empty_attributes=False,
-            )
-
+            self._clean_html = HTMLParser.serialize(tree.find("body"))
         return self._clean_html
 
     @staticmethod
-    def checkTags(tag: bs4.element.Tag) -> bool:
-        return tag.name in ["script", "style"]
+    def serialize(element: etree._Element) -> str:
+        """The html of an element. Unlike lxml, URI attributes (e.g. href) are not percent-encoded
+        and boolean attributes keep their (empty) value: such attributes are replaced by placeholders
+        while the element is serialized."""
+        token = uuid4().hex
+        values, attributes = {}, {}
+        for value in element.xpath(_URI_ATTRIBUTES):
+            if value.isascii() and not any(c.isspace() for c in value):
+                continue
+            placeholder = f"{token}-{len(values)}"
+            values[placeholder] = (value.getparent(), value.attrname, str(value))
+            value.getparent().set(value.attrname, placeholder)
+        for value in element.xpath(_BOOLEAN_ATTRIBUTES):
+            # The value is not serialized, the name is replaced (keeping the order of the attributes).
+            parent = value.getparent()
+            if parent not in attributes:
+                attributes[parent] = parent.items()
+        for parent, items in attributes.items():
+            parent.attrib.clear()
+            for name, value in items:
+                if name in _BOOLEAN_NAMES:
+                    name = f"wpdxf-{token}-{name}"
+                parent.set(name, value)
+
+        html = etree.tostring(element, method="html", encoding="unicode", with_tail=False)
+
+        for parent, items in attributes.items():
+            parent.attrib.clear()
+            for name, value in items:
+                parent.set(name, value)
+        if attributes:
+            # Empty values are serialized without value, others are escaped already.
+            html = re.sub(
+                f'wpdxf-{token}-(\\w+)(="[^"]*")?', lambda m: m.group(1) + (m.group(2) or '=""'), html
+            )
+        for placeholder, (parent, name, value) in values.items():
+            parent.set(name, value)
+            html = html.replace(f'"{placeholder}"', f'"{_escape_attribute(value)}"', 1)
+        return html
 
     @staticmethod
-    def checkSubtree(tag: bs4.element.Tag) -> bool:
-        """Subtrees without text can be neglected. 
-        The subtree's root node is retained to keep the general structure. 
+    def normalize_attributes(body: etree._Element):
+        """Whitespace in list attributes (e.g. class) is collapsed and boolean attributes
+        without value are empty (as by BeautifulSoup), lang attributes that equal the lang
+        of the body are removed (as by htmlmin).
+        Note: libxml2 does not distinguish valueless boolean attributes from ones whose value
+        is their name (e.g. selected="selected"), both are empty afterwards.
+        """
+        for value in body.xpath(_LIST_ATTRIBUTES):
+            normalized = " ".join(value.split())
+            if normalized != value:
+                value.getparent().set(value.attrname, normalized)
+        for value in body.xpath(_BOOLEAN_ATTRIBUTES):
+            if value == value.attrname:
+                value.getparent().set(value.attrname, "")
+        lang = body.get("lang")
+        if lang is not None:
+            for element in body.iterdescendants():
+                if element.get("lang") == lang:
+                    del element.attrib["lang"]
 
-        Remove 'node' if the tree fulfills the following structure:        
-        pparent [contains text] --> parent [no text] --> node [no text]
+    @staticmethod
+    def minify(element: etree._Element, in_pre: bool = False):
+        """Minifies the whitespace of the element's subtree (as htmlmin with remove_comments and remove_empty_space)."""
+        in_pre = in_pre or element.tag in _PRE_TAGS
+        if not in_pre:
+            element.text = HTMLParser.minify_text(element.text)
+        for child in list(element):
+            is_comment = child.tag is etree.Comment
+            if not is_comment:
+                HTMLParser.minify(child, in_pre)
+            if not in_pre:
+                child.tail = HTMLParser.minify_text(child.tail)
+            if is_comment:
+                if child.text and _KEPT_COMMENT_RE.match(child.text):
+                    child.text = child.text[1:] if child.text[0] == "!" else child.text
+                else:
+                    HTMLParser.remove_comment(child, in_pre)
 
-        Args:
-            tag (bs4.element.Tag): The 'node'
+    @staticmethod
+    def remove_comment(comment: etree._Element, in_pre: bool):
+        """Removes a comment, its tail is appended to the preceding text (avoiding a double space)."""
+        parent, previous = comment.getparent(), comment.getprevious()
+        left = parent.text if previous is None else previous.tail
+        right = comment.tail
+        if not in_pre and left and right and left[-1] == " " and right[0] == " ":
+            right = right[1:]
+        text = (left or "") + (right or "") or None
+        if previous is None:
+            parent.text = text
+        else:
+            previous.tail = text
+        parent.remove(comment)
 
-        Returns:
-            bool: True, if the node fulfills the condition.
-        """
-        if len(tag.get_text()) > 0:
-            return False
-        parent = tag.parent
-        if parent is None or len(parent.get_text()) > 0:
-            return False
-        pparent = parent.parent
-        if pparent is None or len(pparent.get_text()) == 0:
-            return False
-        return True
+    @staticmethod
+    def minify_text(text: str) -> str:
+        if not text:
+            return text
+        if _ALL_SPACE_RE.match(text) and ("\n" in text or "\r" in text):
+            return None
+        return _SPACE_RE.sub(" ", text)
@@ -0,0 +1,245 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from os.path import isfile, join
+from time import time
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import urlsplit
+
+from wpdxf.utils.settings import Settings
+
+# Index of a ZipNum CDX index: the first key of each block and the block's location, e.g.
+# "com,example)/ 20211016153009\tcdx-00000.gz\t0\t187403\t1"
+CLUSTER_IDX = "cluster.idx"
+# Number of decompressed blocks kept in memory.
+BLOCK_CACHE_SIZE = 64
+
+CDX_CACHE_DB = "cdx_cache.sqlite"
+# Seconds after which a negative entry of the CDX cache expires (the uri is looked up again).
+NEGATIVE_TTL = 24 * 60 * 60
+# Maximal number of uris per statement (SQLite limits the number of parameters).
+CHUNK_SIZE = 500
+
+_www_pattern = re.compile(r"^www\d*\.")
+# Session ids are dropped from paths and queries (as by the IA canonicalizer of the 'surt' package).
+_path_session_patterns = [
+    re.compile(r"^(.*/)(\((?:[a-z]\([0-9a-z]{24}\))+\)/)([^?]+\.aspx.*)$", re.I),
+    re.compile(r"^(.*/)(\([0-9a-z]{24}\)/)([^?]+\.aspx.*)$", re.I),
+]
+_query_session_patterns = [
+    re.compile(r"^jsessionid=[0-9a-z]{32}$", re.I),
+    re.compile(r"^phpsessid=[0-9a-z]{32}$", re.I),
+    re.compile(r"^sid=[0-9a-z]{32}$", re.I),
+    re.compile(r"^aspsessionid[a-z]{8}=[a-z]{24}$", re.I),
+    re.compile(r"^(?:cfid|cftoken)=[^&]+$", re.I),
+]
+
+
+def url_to_surt(url: str) -> str:
+    """The SURT key of a url, as used by the Common Crawl index. Follows the default
+    canonicalization of the 'surt' package: the scheme, a 'www' prefix, userinfo, default ports,
+    session ids and the fragment are dropped, the url is lowercased, a trailing slash of the path
+    is removed (unless the path is "/") and query arguments are sorted.
+
+    Example:
+        "https://www.Example.com:443/Path/?b=1&a=2#top" -> "com,example)/path?a=2&b=1"
+    """
+    us = urlsplit(url if "://" in url else "http://" + url)
+    host = _www_pattern.sub("", (us.hostname or "").strip("."))
+    key = ",".join(reversed(host.split(".")))
+    if us.port and us.port not in (80, 443):
+        key += f":{us.port}"
+    path = us.path.lower() or "/"
+    for pattern in _path_session_patterns:
+        path = pattern.sub(r"\1\3", path)
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+    key += ")" + path
+    args = [
+        arg
+        for arg in us.query.lower().split("&")
+        if arg and not any(p.match(arg) for p in _query_session_patterns)
+    ]
+    if args:
+        key += "?" + "&".join(sorted(args, key=lambda arg: arg.split("=", 1)))
+    return key
+
+
+class CDXIndex:
+    """Local lookup of captures in a downloaded Common Crawl CDX index (ZipNum format):
+    the cdx-*.gz shards and their cluster.idx in 'index_dir'. The shards consist of independently
+    compressed blocks of sorted CDX lines ("<surt> <timestamp> <json>"), cluster.idx lists the
+    first key of each block. A lookup binary searches cluster.idx (held in memory) and
+    only decompresses the blocks that might contain the url.
+    """
+
+    def __init__(self, index_dir: str = None) -> None:
+        """
+        Args:
+            index_dir (str, optional): Directory of cluster.idx and the shards. Defaults to None (CDX_INDEX).
+        """
+        self.index_dir = index_dir or Settings().CDX_INDEX
+        self._keys: List[str] = None
+        self._blocks: List[Tuple[str, int, int]] = None
+        self._block_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return isfile(join(index_dir, CLUSTER_IDX))
+
+    def _load(self):
+        self._keys, self._blocks = [], []
+        with open(join(self.index_dir, CLUSTER_IDX)) as f:
+            for line in f:
+                key, filename, offset, length, *_ = line.rstrip("\n").split("\t")
+                self._keys.append(key)
+                self._blocks.append((filename, int(offset), int(length)))
+
+    def _read_block(self, i: int) -> List[str]:
+        lines = self._block_cache.get(i)
+        if lines is not None:
+            self._block_cache.move_to_end(i)
+            return lines
+        filename, offset, length = self._blocks[i]
+        with open(join(self.index_dir, filename), "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        # wbits=31: a single gzip member.
+        lines = zlib.decompress(data, wbits=31).decode("utf-8").splitlines()
+        self._block_cache[i] = lines
+        if len(self._block_cache) > BLOCK_CACHE_SIZE:
+            self._block_cache.popitem(last=False)
+        return lines
+
+    def captures(self, surt: str) -> List[dict]:
+        """All captures of a SURT key, in index order (by timestamp)."""
+        with self._lock:
+            return self._captures(surt)
+
+    def _captures(self, surt: str) -> List[dict]:
+        if self._keys is None:
+            self._load()
+        # Lines of the key are in [lo, hi), the blocks that might contain them start
+        # with the last block whose first key is at most 'lo'.
+        lo, hi = surt + " ", surt + "!"
+        captures = []
+        i = max(bisect_right(self._keys, lo) - 1, 0)
+        while i < len(self._keys) and self._keys[i] < hi:
+            lines = self._read_block(i)
+            for line in lines[bisect_left(lines, lo) : bisect_left(lines, hi)]:
+                captures.append(json.loads(line.split(" ", 2)[2]))
+            i += 1
+        return captures
+
+    def lookup(self, url: str) -> dict:
+        """The capture of a url (the first successful one, otherwise the first one).
+
+        Returns:
+            dict: The capture (e.g. url, filename, offset, length, status), None if the url is not indexed.
+        """
+        captures = self.captures(url_to_surt(url))
+        for capture in captures:
+            if capture.get("status") == "200":
+                return capture
+        return captures[0] if captures else None
+
+    def lookup_many(self, urls: Iterable[str]) -> Dict[str, dict]:
+        """Batch version of 'lookup', urls are resolved in key order (each block is decompressed once).
+
+        Returns:
+            Dict[str, dict]: url -> capture, for all indexed urls.
+        """
+        result = {}
+        for url in sorted(set(urls), key=url_to_surt):
+            capture = self.lookup(url)
+            if capture is not None:
+                result[url] = capture
+        return result
+
+
+class CDXCache:
+    """Persistent cache of the captures of uris (filename, offset, length and status of their record),
+    stored in a SQLite database (WAL mode) in WARC_FILES that is shared by all processes
+    (each thread uses its own connection).
+    Uris that are not indexed or whose record could not be fetched are cached as negative entries
+    (filename is NULL, status the reason), which expire after 'negative_ttl' seconds.
+    """
+
+    SCHEMA = """CREATE TABLE IF NOT EXISTS captures(
+        uri VARCHAR PRIMARY KEY, filename VARCHAR, offset INTEGER, length INTEGER,
+        status VARCHAR, checked REAL NOT NULL)"""
+
+    def __init__(self, cache_path: str = None, negative_ttl: float = NEGATIVE_TTL) -> None:
+        """
+        Args:
+            cache_path (str, optional): Directory of the cache. Defaults to None (WARC_FILES).
+            negative_ttl (float, optional): Seconds after which negative entries expire. Defaults to NEGATIVE_TTL.
+        """
+        self.cache_path = cache_path or Settings().WARC_FILES
+        self.negative_ttl = negative_ttl
+        self._local = threading.local()
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(self.cache_path, exist_ok=True)
+            # Other processes might write concurrently, wait for their locks.
+            connection = sqlite3.connect(join(self.cache_path, CDX_CACHE_DB), timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(self.SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        """Closes the connection of the calling thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def get(self, uris: Iterable[str]) -> Dict[str, dict]:
+        """The cached captures of the given uris.
+
+        Returns:
+            Dict[str, dict]: uri -> capture (filename, offset, length, status), 
+                None for uris known to be unavailable. Uncached uris and expired entries are missing.
+        """
+        uris = list(set(uris))
+        captures = {}
+        expired = time() - self.negative_ttl
+        for i in range(0, len(uris), CHUNK_SIZE):
+            chunk = uris[i : i + CHUNK_SIZE]
+            stmt = f"SELECT uri, filename, offset, length, status, checked FROM captures WHERE uri IN ({', '.join('?' * len(chunk))})"
+            for uri, filename, offset, length, status, checked in self.connection.execute(stmt, chunk):
+                if filename is not None:
+                    captures[uri] = {"filename": filename, "offset": offset, "length": length, "status": status}
+                elif checked > expired:
+                    captures[uri] = None
+        return captures
+
+    def put(self, captures: Dict[str, dict], status: str = "not indexed"):
+        """Caches (replaces) the captures of uris.
+
+        Args:
+            captures (Dict[str, dict]): uri -> capture, None for unavailable uris.
+            status (str, optional): Reason stored for unavailable uris. Defaults to "not indexed".
+        """
+        now = time()
+        rows = [
+            (uri, None, None, None, status, now)
+            if capture is None
+            else (uri, capture["filename"], int(capture["offset"]), int(capture["length"]), capture.get("status"), now)
+            for uri, capture in captures.items()
+        ]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO captures VALUES (?, ?, ?, ?, ?, ?)", rows)
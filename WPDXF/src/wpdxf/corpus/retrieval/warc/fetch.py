@@ -0,0 +1,230 @@
+from gzip import BadGzipFile, GzipFile
+from io import BytesIO
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from warcio.exceptions import ArchiveLoadFailed
+from warcio.recordloader import ArcWarcRecord, ArcWarcRecordLoader
+from wpdxf.utils.settings import Settings
+
+
+# Ranges of a file that are at most this many bytes apart are fetched by a single request (see 'coalesce').
+MAX_GAP = 1 << 16
+# Maximal number of bytes fetched by a single coalesced request.
+MAX_REQUEST_SIZE = 1 << 23
+
+# (filename, offset, length)
+Range = Tuple[str, int, int]
+
+
+class RangeError(requests.exceptions.HTTPError):
+    """The server did not answer a range request with exactly the requested bytes."""
+
+
+# Errors of a failed or truncated fetch, records are parsed while the response is received.
+FETCH_ERRORS = (
+    requests.exceptions.RequestException,
+    urllib3.exceptions.HTTPError,
+    ArchiveLoadFailed,
+    BadGzipFile,
+    EOFError,
+)
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a fetch error might not recur: connection errors, timeouts, server errors (5xx)
+    and incomplete responses. Client errors (4xx) and invalid records are definitive.
+    """
+    if isinstance(error, RangeError):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is None or error.response.status_code >= 500
+    return isinstance(error, (requests.exceptions.RequestException, urllib3.exceptions.HTTPError))
+
+
+class RangeFetcher:
+    """Fetches byte ranges (e.g. single records of a WARC file) from CC_DOMAIN.
+    Ranges are requested by 'Range' headers over a pooled session (keep-alive connections,
+    retries with backoff). Responses are only accepted if they hold exactly the requested range,
+    a server that ignores the header would otherwise send the whole file.
+    """
+
+    def __init__(
+        self, base_url: str = None, pool_size: int = 10, retries: int = 3, timeout: float = 60
+    ) -> None:
+        """
+        Args:
+            base_url (str, optional): Prefix of all filenames. Defaults to None (CC_DOMAIN).
+            pool_size (int, optional): Maximal number of concurrent connections per host. Defaults to 10.
+            retries (int, optional): Retries of failed connections and server errors (5xx). Defaults to 3.
+            timeout (float, optional): Timeout (seconds) to connect and between received bytes. Defaults to 60.
+        """
+        self.base_url = base_url if base_url is not None else Settings().CC_DOMAIN
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=("GET",),
+            raise_on_status=False,
+        )
+        # pool_block: at most 'pool_size' concurrent requests per host, further requests wait.
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry, pool_block=True
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def request(self, filename: str, offset: int, length: int) -> requests.Response:
+        """Requests bytes [offset, offset + length) of a file, the body is not read yet (stream).
+
+        Raises:
+            requests.exceptions.HTTPError: If the request failed,
+                RangeError if the response does not hold exactly the requested range.
+        """
+        end = offset + length - 1
+        response = self.session.get(
+            self.base_url + filename,
+            headers={"Range": f"bytes={offset}-{end}", "Accept-Encoding": "identity"},
+            stream=True,
+            timeout=self.timeout,
+        )
+        try:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise RangeError(
+                    f"Expected 206 for bytes {offset}-{end} of {filename}, got {response.status_code}.",
+                    response=response,
+                )
+            content_range = response.headers.get("Content-Range", "")
+            if not content_range.startswith(f"bytes {offset}-{end}/"):
+                raise RangeError(
+                    f"Expected bytes {offset}-{end} of {filename}, got '{content_range}'.",
+                    response=response,
+                )
+            content_length = response.headers.get("Content-Length")
+            if content_length is not None and int(content_length) != length:
+                raise RangeError(
+                    f"Expected {length} bytes of {filename}, got {content_length}.",
+                    response=response,
+                )
+        except requests.exceptions.HTTPError:
+            response.close()
+            raise
+        return response
+
+    def fetch(self, filename: str, offset: int, length: int) -> bytes:
+        """The bytes [offset, offset + length) of a file."""
+        with self.request(filename, offset, length) as response:
+            content = response.content
+        if len(content) != length:
+            raise RangeError(f"Expected {length} bytes of {filename}, got {len(content)}.")
+        return content
+
+    def fetch_record(self, filename: str, offset: int, length: int) -> ArcWarcRecord:
+        """The (gzipped) WARC record at [offset, offset + length) of a file."""
+        member = self.fetch(filename, offset, length)
+        return ArcWarcRecordLoader().parse_record_stream(GzipFile(fileobj=BytesIO(member)))
+
+    def fetch_records(
+        self,
+        ranges: Iterable[Range],
+        max_gap: int = MAX_GAP,
+        max_size: int = MAX_REQUEST_SIZE,
+        failed: Set[Range] = None,
+    ) -> Dict[Range, ArcWarcRecord]:
+        """The (gzipped) WARC records at the given ranges. Nearby records of the same file 
+        are fetched by a single request (see 'coalesce') and split into records afterwards.
+        If a coalesced request fails, its records are fetched one by one.
+
+        Args:
+            failed (Set[Range], optional): If given, the ranges that failed definitively 
+                (see 'is_transient') are added. Defaults to None.
+
+        Returns:
+            Dict[Range, ArcWarcRecord]: The fetched records, failed ranges are missing.
+        """
+        failed = set() if failed is None else failed
+        records = {}
+        for (filename, start, length), members in coalesce(ranges, max_gap, max_size):
+            try:
+                content = self.fetch(filename, start, length)
+            except FETCH_ERRORS as e:
+                if len(members) == 1:
+                    if not is_transient(e):
+                        failed.update(members)
+                    continue
+                contents = {}
+                for _range in members:
+                    try:
+                        contents[_range] = self.fetch(*_range)
+                    except FETCH_ERRORS as e:
+                        if not is_transient(e):
+                            failed.add(_range)
+                        continue
+            else:
+                contents = {
+                    _range: content[_range[1] - start : _range[1] - start + _range[2]]
+                    for _range in members
+                }
+            for _range, member in contents.items():
+                try:
+                    records[_range] = ArcWarcRecordLoader().parse_record_stream(
+                        GzipFile(fileobj=BytesIO(member))
+                    )
+                except FETCH_ERRORS:
+                    # The bytes were received completely, the record is invalid.
+                    failed.add(_range)
+        return records
+
+
+def coalesce(
+    ranges: Iterable[Range], max_gap: int = MAX_GAP, max_size: int = MAX_REQUEST_SIZE
+) -> List[Tuple[Range, List[Range]]]:
+    """Groups ranges into requests. The ranges are sorted by (filename, offset), 
+    a range is added to the preceding request if it is part of the same file, starts at most 
+    'max_gap' bytes after the request's end and the request does not exceed 'max_size' bytes.
+
+    Example (max_gap=10):
+        [("a", 100, 50), ("b", 0, 10), ("a", 0, 95)] -> [
+            (("a", 0, 150), [("a", 0, 95), ("a", 100, 50)]),
+            (("b", 0, 10), [("b", 0, 10)]),
+        ]
+
+    Returns:
+        List[Tuple[Range, List[Range]]]: The requested range and the ranges it contains.
+    """
+    groups = []
+    for _range in sorted(set(ranges)):
+        filename, offset, length = _range
+        if groups:
+            group = groups[-1]
+            end = max(group[2], offset + length)
+            if group[0] == filename and offset - group[2] <= max_gap and end - group[1] <= max_size:
+                group[2] = end
+                group[3].append(_range)
+                continue
+        groups.append([filename, offset, offset + length, [_range]])
+    return [((filename, start, end - start), members) for filename, start, end, members in groups]
+
+
+_default_fetcher = None
+_default_lock = threading.Lock()
+
+
+def default_fetcher() -> RangeFetcher:
+    """A RangeFetcher shared by all requests (and threads) of the process (its connections are reused)."""
+    global _default_fetcher
+    with _default_lock:
+        if _default_fetcher is None:
+            _default_fetcher = RangeFetcher()
+    return _default_fetcher
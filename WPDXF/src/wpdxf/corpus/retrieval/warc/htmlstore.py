@@ -0,0 +1,232 @@
+import logging
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from hashlib import sha1
+from os.path import getsize, isdir, join
+from time import time_ns
+from typing import Dict, Iterable, List, Tuple
+
+from wpdxf.utils.settings import Settings
+from wpdxf.utils.utils import decompress_file
+
+INDEX_DB = "html_store.sqlite"
+SEGMENT_PATTERN = re.compile(r"^segment-.+\.pack$")
+# A segment is closed (and a new one started) once it exceeds this size.
+SEGMENT_SIZE = 1 << 30
+# Maximal number of keys per statement (SQLite limits the number of parameters).
+CHUNK_SIZE = 500
+
+
+def html_key(uri: str) -> str:
+    """The key of a page, also the filename of the former one-file-per-page layout."""
+    return sha1(uri.encode()).hexdigest()
+
+
+class HTMLStore:
+    """Append-only store of the cleaned html of pages in WARC_FILES.
+    Pages are compressed (zlib) and appended to pack files (segments), an index (SQLite, WAL mode)
+    maps the key of each page to its segment, offset and length. Segments are read memory-mapped.
+
+    Each process appends to its own segment, concurrent processes (and threads) can therefore write
+    to the same store. A page is stored once, later writes of the same page are ignored.
+    'compact' merges all segments (e.g. many small segments of short runs), it must not run
+    concurrently with writers.
+    """
+
+    def __init__(self, store_dir: str = None, segment_size: int = SEGMENT_SIZE) -> None:
+        """
+        Args:
+            store_dir (str, optional): Directory of the index and the segments. Defaults to None (WARC_FILES).
+            segment_size (int, optional): Size (bytes) after which a new segment is started. Defaults to SEGMENT_SIZE.
+        """
+        self.store_dir = store_dir or Settings().WARC_FILES
+        self.segment_size = segment_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._segment = None
+        self._segment_file = None
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(self.store_dir, exist_ok=True)
+            # Other processes might write concurrently, wait for their locks.
+            connection = sqlite3.connect(join(self.store_dir, INDEX_DB), timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS pages(
+                    key VARCHAR PRIMARY KEY, segment VARCHAR NOT NULL,
+                    offset INTEGER NOT NULL, length INTEGER NOT NULL) WITHOUT ROWID"""
+            )
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        """Closes the segment written by this process, the memory maps and the connection of the calling thread."""
+        with self._lock:
+            if self._segment_file is not None:
+                self._segment_file.close()
+                self._segment = self._segment_file = None
+            for m in self._maps.values():
+                m.close()
+            self._maps.clear()
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _locations(self, keys: List[str]) -> Dict[str, Tuple[str, int, int]]:
+        locations = {}
+        for i in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[i : i + CHUNK_SIZE]
+            stmt = f"SELECT key, segment, offset, length FROM pages WHERE key IN ({', '.join('?' * len(chunk))})"
+            for key, *location in self.connection.execute(stmt, chunk):
+                locations[key] = tuple(location)
+        return locations
+
+    def _read(self, segment: str, offset: int, length: int) -> bytes:
+        with self._lock:
+            m = self._maps.get(segment)
+            if m is None or len(m) < offset + length:
+                # The segment was not mapped yet or it grew since (appended by a writer).
+                if m is not None:
+                    m.close()
+                with open(join(self.store_dir, segment), "rb") as f:
+                    m = self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return m[offset : offset + length]
+
+    def __contains__(self, uri: str) -> bool:
+        return bool(self._locations([html_key(uri)]))
+
+    def get(self, uri: str) -> str:
+        """The html of a page, None if it is not stored."""
+        return self.get_many([uri]).get(uri)
+
+    def get_many(self, uris: Iterable[str]) -> Dict[str, str]:
+        """The html of the given pages (a single index lookup per CHUNK_SIZE pages).
+
+        Returns:
+            Dict[str, str]: uri -> html, for all stored pages.
+        """
+        keys = {html_key(uri): uri for uri in uris}
+        locations = self._locations(list(keys))
+        # Read in segment order.
+        return {
+            keys[key]: zlib.decompress(self._read(*location)).decode("utf-8")
+            for key, location in sorted(locations.items(), key=lambda x: x[1])
+        }
+
+    def put(self, uri: str, html: str):
+        self.put_many({uri: html})
+
+    def put_many(self, htmls: Dict[str, str]):
+        """Stores the html of pages, pages that are stored already are not changed."""
+        self._put({html_key(uri): zlib.compress(html.encode("utf-8")) for uri, html in htmls.items()})
+
+    def _put(self, data: Dict[str, bytes]):
+        # The check, the append and the index update are a single step, otherwise threads writing
+        # the same page append it twice. Other processes may still append a page twice
+        # (the index keeps the first one, 'compact' drops the other).
+        with self._lock:
+            new_keys = set(data) - set(self._locations(list(data)))
+            if not new_keys:
+                return
+            rows = []
+            for key in new_keys:
+                if self._segment_file is None or self._segment_file.tell() >= self.segment_size:
+                    self._open_segment()
+                rows.append((key, self._segment, self._segment_file.tell(), len(data[key])))
+                self._segment_file.write(data[key])
+            # The data must be readable (by other processes) before it is indexed.
+            self._segment_file.flush()
+            with self.connection:
+                self.connection.executemany("INSERT OR IGNORE INTO pages VALUES (?, ?, ?, ?)", rows)
+
+    def _open_segment(self):
+        if self._segment_file is not None:
+            self._segment_file.close()
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._segment = f"segment-{os.getpid()}-{time_ns()}.pack"
+        self._segment_file = open(join(self.store_dir, self._segment), "ab")
+
+    def segments(self) -> List[str]:
+        if not isdir(self.store_dir):
+            return []
+        return sorted(f for f in os.listdir(self.store_dir) if SEGMENT_PATTERN.match(f))
+
+    def stats(self) -> dict:
+        """Number of stored pages, number of segments and their total size (bytes)."""
+        (num_pages,) = self.connection.execute("SELECT COUNT(*) FROM pages").fetchone()
+        segments = self.segments()
+        size = sum(getsize(join(self.store_dir, s)) for s in segments)
+        return {"pages": num_pages, "segments": len(segments), "bytes": size}
+
+    def compact(self) -> int:
+        """Rewrites all indexed pages into new segments (in key order) and removes the former segments,
+        including unindexed data (e.g. of interrupted writes).
+
+        Returns:
+            int: Number of removed bytes.
+        """
+        self.close()
+        old_segments = self.segments()
+        old_size = sum(getsize(join(self.store_dir, s)) for s in old_segments)
+
+        # Not guarded by the lock, 'compact' must not run concurrently with writers.
+        rows = []
+        stmt = "SELECT key, segment, offset, length FROM pages ORDER BY key"
+        for key, *location in self.connection.execute(stmt).fetchall():
+            data = self._read(*location)
+            if self._segment_file is None or self._segment_file.tell() >= self.segment_size:
+                self._open_segment()
+            rows.append((self._segment, self._segment_file.tell(), key))
+            self._segment_file.write(data)
+        if self._segment_file is not None:
+            self._segment_file.flush()
+        with self.connection:
+            self.connection.executemany("UPDATE pages SET segment = ?, offset = ? WHERE key = ?", rows)
+
+        new_segments = set(segment for segment, *_ in rows)
+        self.close()
+        for segment in old_segments:
+            if segment not in new_segments:
+                os.remove(join(self.store_dir, segment))
+        new_size = sum(getsize(join(self.store_dir, s)) for s in new_segments)
+        logging.info(f"Compacted {len(old_segments)} segments into {len(new_segments)}.")
+        return old_size - new_size
+
+    def import_legacy(self, remove: bool = False) -> int:
+        """Imports the pages of the former layout (a gzip file per page, named by 'html_key') in store_dir.
+
+        Args:
+            remove (bool, optional): If set, the imported files are removed. Defaults to False.
+
+        Returns:
+            int: Number of imported pages.
+        """
+        data, files = {}, []
+        num_pages = 0
+        for entry in os.scandir(self.store_dir):
+            if entry.is_file() and re.fullmatch(r"[0-9a-f]{40}", entry.name):
+                data[entry.name] = zlib.compress(decompress_file(entry.path, asStr=False))
+                files.append(entry.path)
+            if len(data) >= CHUNK_SIZE:
+                self._put(data)
+                num_pages += len(data)
+                data.clear()
+        self._put(data)
+        num_pages += len(data)
+        if remove:
+            for path in files:
+                os.remove(path)
+        logging.info(f"Imported {num_pages} pages into the html store.")
+        return num_pages
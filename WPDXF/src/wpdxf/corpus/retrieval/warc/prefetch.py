@@ -0,0 +1,85 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+from lxml import etree
+from wpdxf.corpus.retrieval.warc.fetch import MAX_GAP
+from wpdxf.corpus.retrieval.warc.warcrecord import get_htmls
+
+# Number of uris retrieved by a single task (their records are fetched by coalesced requests).
+CHUNK_SIZE = 16
+
+
+def _retrieve(uris: List[str], max_gap: int) -> Tuple[Dict[str, str], Dict[str, etree._Element]]:
+    """The html and the cleaned trees of the given uris (see get_htmls)."""
+    trees = {}
+    htmls = get_htmls(uris, max_gap, trees)
+    return htmls, trees
+
+
+class HTMLPrefetcher:
+    """Retrieves the html of webpages in the background (see get_htmls), while earlier webpages are processed.
+    Uris are retrieved by a bounded thread pool in the order they were submitted,
+    in chunks of 'chunk_size' uris. The requests per server are bounded by the
+    connection pool of the RangeFetcher. The result of a uri is handed out once (see 'get_htmls'),
+    a chunk is released once the results of all its uris were consumed.
+    """
+
+    def __init__(
+        self, num_workers: int = 8, chunk_size: int = CHUNK_SIZE, max_gap: int = MAX_GAP
+    ) -> None:
+        """
+        Args:
+            num_workers (int, optional): Number of concurrent tasks. Defaults to 8.
+            chunk_size (int, optional): Number of uris per task. Defaults to CHUNK_SIZE.
+            max_gap (int, optional): See get_htmls. Defaults to MAX_GAP.
+        """
+        self.chunk_size = chunk_size
+        self.max_gap = max_gap
+        self.executor = ThreadPoolExecutor(num_workers, thread_name_prefix="html-prefetch")
+        self._futures: Dict[str, Future] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stops the retrieval, pending tasks are cancelled (running ones are awaited)."""
+        # Cancelled by hand, shutdown(cancel_futures=True) requires Python 3.9.
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self.executor.shutdown(wait=True)
+
+    def submit(self, uris: Iterable[str]):
+        """Schedules the retrieval of all given uris that are not pending already."""
+        uris = [uri for uri in dict.fromkeys(uris) if uri not in self._futures]
+        for i in range(0, len(uris), self.chunk_size):
+            chunk = uris[i : i + self.chunk_size]
+            future = self.executor.submit(_retrieve, chunk, self.max_gap)
+            for uri in chunk:
+                self._futures[uri] = future
+
+    def get_htmls(self, uris: List[str], trees: Dict[str, etree._Element] = None) -> Dict[str, str]:
+        """The html of the given uris, waits for submitted uris to be retrieved,
+        other uris are retrieved directly. The cleaned trees of pages retrieved in the background
+        or by this call are added to 'trees' (see get_htmls).
+
+        Returns:
+            Dict[str, str]: uri -> html (None if the page could not be retrieved).
+        """
+        htmls = {}
+        missing = []
+        for uri in uris:
+            future = self._futures.pop(uri, None)
+            if future is None or future.cancelled():
+                missing.append(uri)
+            else:
+                chunk_htmls, chunk_trees = future.result()
+                htmls[uri] = chunk_htmls[uri]
+                if trees is not None and uri in chunk_trees:
+                    trees[uri] = chunk_trees[uri]
+        if missing:
+            htmls.update(get_htmls(missing, self.max_gap, trees))
+        return htmls
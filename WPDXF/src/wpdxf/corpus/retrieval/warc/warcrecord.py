@@ -1,50 +1,189 @@
-from gzip import GzipFile
-from hashlib import sha1
-from io import BytesIO
-from os.path import isfile, join
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, List
 
-import requests
-from warcio.recordloader import ArcWarcRecordLoader
+from lxml import etree
 from wpdxf.corpus.parsers.htmlparser import HTMLParser
+from wpdxf.corpus.retrieval.warc.cdx import CDXCache, CDXIndex
+from wpdxf.corpus.retrieval.warc.fetch import FETCH_ERRORS, MAX_GAP, default_fetcher, is_transient
+from wpdxf.corpus.retrieval.warc.htmlstore import HTMLStore
 from wpdxf.utils.settings import Settings
-from wpdxf.utils.utils import compress_file, decompress_file
+
+
+_local_index = None
+_cdx_cache = None
+_html_store = None
+# Guards the creation of the shared objects above (pages are retrieved by multiple threads, see HTMLPrefetcher).
+_lock = threading.Lock()
+
+
+def local_index() -> CDXIndex:
+    """The local CDX index in CDX_INDEX, None if there is none (the remote index server is used)."""
+    global _local_index
+    with _lock:
+        if _local_index is None:
+            try:
+                index_dir = Settings().CDX_INDEX
+            except KeyError:
+                index_dir = None
+            _local_index = CDXIndex(index_dir) if index_dir and CDXIndex.exists(index_dir) else False
+    return _local_index or None
 
 
 def search_index(url):
-    response = requests.get(
+    """The capture of a url, None if it is not indexed.
+
+    Raises:
+        FETCH_ERRORS: If the remote index could not be queried (e.g. a timeout).
+    """
+    index = local_index()
+    if index is not None:
+        return index.lookup(url)
+    response = default_fetcher().session.get(
         "https://index.commoncrawl.org/CC-MAIN-2021-43-index",
         params={"url": url, "limit": 1, "output": "json"},
+        timeout=default_fetcher().timeout,
     )
+    if response.status_code == 404:
+        # No captures.
+        return None
     response.raise_for_status()
     return response.json()
 
 
+def search_indices(urls: List[str]) -> Dict[str, dict]:
+    """Batch version of 'search_index'.
+
+    Returns:
+        Dict[str, dict]: url -> capture (None if the url is not indexed), 
+            urls whose lookup failed (e.g. a timeout of the remote index) are missing.
+    """
+    index = local_index()
+    if index is not None:
+        found = index.lookup_many(urls)
+        return {url: found.get(url) for url in urls}
+    captures = {}
+    for url in urls:
+        try:
+            captures[url] = search_index(url)
+        except FETCH_ERRORS as e:
+            logging.warning(f"Index lookup of {url} failed: {e}")
+    return captures
+
+
+def cdx_cache() -> CDXCache:
+    """The CDX cache shared by all lookups of the process."""
+    global _cdx_cache
+    with _lock:
+        if _cdx_cache is None:
+            _cdx_cache = CDXCache()
+    return _cdx_cache
+
+
+def resolve(uris: List[str]) -> Dict[str, dict]:
+    """The captures of the given uris, taken from the CDX cache or (for uncached uris) 
+    looked up in the index and cached, including the uris that are not indexed.
+    Failed lookups (e.g. timeouts) are not cached, these uris are looked up again by the next call.
+
+    Returns:
+        Dict[str, dict]: uri -> capture, None if the uri is unavailable (or its lookup failed).
+    """
+    captures = cdx_cache().get(uris)
+    missing = [uri for uri in uris if uri not in captures]
+    if missing:
+        found = search_indices(missing)
+        cdx_cache().put(found)
+        captures.update({uri: found.get(uri) for uri in missing})
+    return captures
+
+
 def fetch_warc(filename, offset, length):
-    response = requests.get(
-        Settings().CC_DOMAIN + filename,
-        params={"range": f"bytes={offset}-{offset + length - 1}"},
-    )
-    response.raise_for_status()
-    gz = GzipFile(fileobj=BytesIO(response.content))
-    return ArcWarcRecordLoader().parse_record_stream(gz)
+    return default_fetcher().fetch_record(filename, offset, length)
+
+
+def html_store() -> HTMLStore:
+    """The store of retrieved pages shared by all retrievals of the process."""
+    global _html_store
+    with _lock:
+        if _html_store is None:
+            _html_store = HTMLStore()
+    return _html_store
+
+
+def _store_html(uris: List[str], warc) -> HTMLParser:
+    """Cleans the html of a record and stores it for all uris that resolved to the record."""
+    raw_html = warc.content_stream().read()
+    parser = HTMLParser(raw_html)
+    html_store().put_many({uri: parser.clean_html for uri in uris})
+    return parser
 
 
 def get_html(uri):
-    uri_hash = sha1(uri.encode()).hexdigest()
-    filepath = join(Settings().WARC_FILES, uri_hash)
+    html = html_store().get(uri)
 
-    if isfile(filepath):
-        return decompress_file(filepath)
+    if html is not None:
+        return html
     else:
+        capture = resolve([uri])[uri]
+        if capture is None:
+            return None
         print(f"Retrieve HTML for {uri}")
         try:
-            response = search_index(uri)
             warc = fetch_warc(
-                response["filename"], int(response["offset"]), int(response["length"])
+                capture["filename"], int(capture["offset"]), int(capture["length"])
             )
-        except requests.exceptions.HTTPError as e:
+            return _store_html([uri], warc).clean_html
+        except FETCH_ERRORS as e:
+            if not is_transient(e):
+                cdx_cache().put({uri: None}, status="fetch failed")
             return None
-        raw_html = warc.content_stream().read()
-        clean_html = HTMLParser(raw_html).clean_html
-        compress_file(filepath, clean_html)
-        return clean_html
+
+
+def get_htmls(
+    uris: List[str], max_gap: int = MAX_GAP, trees: Dict[str, etree._Element] = None
+) -> Dict[str, str]:
+    """Batch version of 'get_html'. The captures of all uncached uris are resolved first (see 'resolve'),
+    then their records are fetched by coalesced requests (see RangeFetcher.fetch_records).
+
+    Args:
+        uris (List[str]): The uris of the requested pages.
+        max_gap (int, optional): Records of a WARC file that are at most 'max_gap' bytes apart 
+            are fetched by a single request. Defaults to MAX_GAP.
+        trees (Dict[str, etree._Element], optional): If given, the cleaned trees of the pages 
+            retrieved by this call are added (uri -> tree), they need not be parsed again. Defaults to None.
+
+    Returns:
+        Dict[str, str]: uri -> html (None if the page could not be retrieved).
+    """
+    stored = html_store().get_many(uris)
+    htmls = {uri: stored.get(uri) for uri in uris}
+
+    captures = resolve([uri for uri, html in htmls.items() if html is None])
+    # Distinct uris may resolve to the same record (e.g. equal SURT keys), it is fetched once.
+    ranges = defaultdict(list)
+    for uri, capture in captures.items():
+        if capture is not None:
+            ranges[(capture["filename"], int(capture["offset"]), int(capture["length"]))].append(uri)
+
+    if ranges:
+        print(f"Retrieve HTML for {sum(map(len, ranges.values()))} uris")
+    failed_ranges = set()
+    for _range, warc in default_fetcher().fetch_records(ranges, max_gap, failed=failed_ranges).items():
+        range_uris = ranges[_range]
+        try:
+            parser = _store_html(range_uris, warc)
+        except FETCH_ERRORS:
+            # The record was received completely, its content is invalid.
+            failed_ranges.add(_range)
+            continue
+        for uri in range_uris:
+            htmls[uri] = parser.clean_html
+        if trees is not None and parser.clean_tree is not None:
+            # A tree is handed out once, the pages of the other uris are parsed from their html.
+            trees[range_uris[0]] = parser.clean_tree
+    # Only definitive failures are cached, transient ones (e.g. timeouts) are retried by the next call.
+    failed = {uri: None for _range in failed_ranges for uri in ranges[_range]}
+    if failed:
+        cdx_cache().put(failed, status="fetch failed")
+    return htmls
@@ -1,21 +1,78 @@
 import logging
 import random
+from contextlib import contextmanager
 from glob import glob
 from os import path
+from typing import List
 
 random.seed(0)
 
 import psycopg2
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+from wpdxf.db.uris import URI_KEY_FUNCTION, normalize_uri
 from wpdxf.utils.settings import Settings
 from wpdxf.utils.utils import read_file
 
-POSTGRES_CONFIG = Settings().POSTGRES_CONFIG
+# Either the connection of a single database or a list of connections, 
+# each holding a subset of the archives (shards, see ShardedQueryExecutor).
+POSTGRES_SHARDS = Settings().POSTGRES_CONFIG
+if not isinstance(POSTGRES_SHARDS, list):
+    POSTGRES_SHARDS = [POSTGRES_SHARDS]
+POSTGRES_CONFIG = POSTGRES_SHARDS[0]
 DEL = " "
+# Equivalent to urllib.parse.urlsplit(uri).netloc, the host used as root by URITree.
+NETLOC_PATTERN = "^[A-Za-z][A-Za-z0-9+.-]*://([^/?#]*)"
+
+
+def _connect_kwargs(parallel_workers: int = None, shard: int = 0) -> dict:
+    config = POSTGRES_SHARDS[shard]
+    if parallel_workers is None:
+        return config
+    return {
+        **config,
+        "options": f"-c max_parallel_workers_per_gather={parallel_workers}",
+    }
 
 
 class PostgresDBSession:
-    def __init__(self):
-        self._connection = None
+    def __init__(
+        self,
+        connection=None,
+        prune_rel_tf: float = None,
+        archive_pruned: bool = False,
+        bigrams: bool = False,
+        partitions: int = 0,
+        parallel_workers: int = None,
+        shard: int = 0,
+    ):
+        """
+        Args:
+            connection (optional): An existing connection, e.g. borrowed from a PostgresDBPool. 
+                It is not closed by the session, but returned to its owner. Defaults to None.
+            prune_rel_tf (float, optional): If given, postings of tokens with a relative term frequency 
+                of at least prune_rel_tf are pruned after each copied file (see 'prune_postings'). 
+                Defaults to None.
+            archive_pruned (bool, optional): Move pruned postings to 'token_uri_mapping_pruned' 
+                instead of deleting them. Defaults to False.
+            bigrams (bool, optional): Also add the adjacent token pairs of each copied file 
+                to 'bigram_uri_mapping' (see 'create_bigrams'). Defaults to False.
+            partitions (int, optional): If greater than 0 and 'token_uri_mapping' does not exist yet, 
+                it is created with this number of hash partitions on tokenid (see 'partition_postings'). 
+                Defaults to 0.
+            parallel_workers (int, optional): max_parallel_workers_per_gather of the session's connection, 
+                e.g. to scan the partitions of 'token_uri_mapping' in parallel. Defaults to None (server setting).
+            shard (int, optional): Index of the database in POSTGRES_CONFIG, if it is a list of shards. 
+                copy_from and copy_from_sample load every len(POSTGRES_SHARDS)-th archive, starting at 'shard'. 
+                Defaults to 0.
+        """
+        self._connection = connection
+        self._borrowed = connection is not None
+        self.prune_rel_tf = prune_rel_tf
+        self.archive_pruned = archive_pruned
+        self.bigrams = bigrams
+        self.partitions = partitions
+        self.parallel_workers = parallel_workers
+        self.shard = shard
 
     def __del__(self):
         self.close()
@@ -23,14 +80,17 @@ class PostgresDBSession:
     @property
     def connection(self):
         if self._connection is None:
-            self._connection = psycopg2.connect(**POSTGRES_CONFIG)
+            self._connection = psycopg2.connect(
+                **_connect_kwargs(self.parallel_workers, self.shard)
+            )
         return self._connection
 
     def close(self, commit=True):
         if self._connection is not None:
             if commit:
                 self._connection.commit()
-            self.connection.close()
+            if not self._borrowed:
+                self._connection.close()
             self._connection = None
 
     @staticmethod
@@ -53,16 +113,34 @@ class PostgresDBSession:
         cursor.execute(operation, parameters)
         return cursor
 
+    def explain(self, operation, parameters=None) -> dict:
+        """Executes the statement with EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON).
+
+        Returns:
+            dict: Planning and execution time (ms) as reported by the DB and the full plan.
+        """
+        with self.execute(
+            "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + operation, parameters
+        ) as cur:
+            (plan,) = cur.fetchone()
+        plan = plan[0]
+        return {
+            "db_planning_time": plan.get("Planning Time"),
+            "db_execution_time": plan.get("Execution Time"),
+            "plan": plan["Plan"],
+        }
+
     def copy_from(self, limit=0, offset=0):
         terms = sorted(glob(path.join(Settings().TERM_STORE, "*.wet.gz")))
         if offset >= len(terms):
             return []
         u_idx = min(offset + limit, len(terms))
-        self._copy_iter(terms[offset:u_idx])
+        self._copy_iter(terms[offset:u_idx][self.shard :: len(POSTGRES_SHARDS)])
 
     def copy_from_sample(self, limit):
         terms = sorted(glob(path.join(Settings().TERM_STORE, "*.wet.gz")))
-        self._copy_iter(random.sample(terms, k=limit))
+        # The sample does not depend on the shard (random.seed(0)), each shard loads a disjoint part of it.
+        self._copy_iter(random.sample(terms, k=limit)[self.shard :: len(POSTGRES_SHARDS)])
 
     def _copy_iter(self, terms):
         for t in terms:
@@ -74,54 +152,535 @@ class PostgresDBSession:
             logging.info(f"Finished: Copy {bname} into Postgres DB.")
 
     def _copy_from(self, mapping, terms):
+        # Archives are named after their crawl (e.g. CC-MAIN-<timestamp>-...), 
+        # a greater name is a more recent crawl.
+        archive = path.basename(terms)
         mapping = f'zcat {mapping} | tr -d "\\0"'
         terms = f'zcat {terms} | tr -d "\\0"'
 
         cursor = self.connection.cursor()
-        cursor.execute(
-            "CREATE TABLE IF NOT EXISTS uris(uriid SERIAL PRIMARY KEY, uri VARCHAR)"
-        )
-        cursor.execute(
-            "CREATE TABLE IF NOT EXISTS tokens(token VARCHAR(200) PRIMARY KEY, tokenid SERIAL)"
-        )
-        cursor.execute(
-            "CREATE TABLE IF NOT EXISTS token_uri_mapping(uriid INT, position INT, tokenid INT);"
-        )
+        self.create_schema(cursor)
 
         cursor.execute("DROP TABLE IF EXISTS cp_tokens;")
         cursor.execute("DROP TABLE IF EXISTS cp_uris;")
+        cursor.execute("DROP TABLE IF EXISTS cp_docs;")
+        cursor.execute("DROP TABLE IF EXISTS cp_deleted;")
+        cursor.execute("DROP TABLE IF EXISTS cp_postings;")
 
         cursor.execute(
             "CREATE TEMP TABLE cp_tokens(warc CHAR(47), position INT, token VARCHAR(200));"
         )
-        cursor.execute("CREATE TEMP TABLE cp_uris(warc CHAR(47), uri VARCHAR);")
+        cursor.execute(
+            "CREATE TEMP TABLE cp_uris(warc CHAR(47), uri VARCHAR, lineno BIGSERIAL);"
+        )
+        cursor.execute(
+            "CREATE TEMP TABLE cp_postings(uriid INT, position INT, tokenid INT);"
+        )
 
         cursor.execute("COPY cp_tokens FROM PROGRAM %s DELIMITER ' ';", (terms,))
-        cursor.execute("COPY cp_uris FROM PROGRAM %s DELIMITER ' ';", (mapping,))
+        cursor.execute(
+            "COPY cp_uris(warc, uri) FROM PROGRAM %s DELIMITER ' ';", (mapping,)
+        )
 
         cursor.execute(
             "INSERT INTO tokens(token) SELECT DISTINCT token FROM cp_tokens ON CONFLICT DO NOTHING;"
         )
+        # A single document per uri_key: the last one of this archive,
+        # unless the uri_key is already stored from a more recent archive.
+        cursor.execute(
+            """ CREATE TEMP TABLE cp_docs AS
+                    SELECT DISTINCT ON (uri_key) warc, uri, uri_key 
+                    FROM (SELECT warc, uri, uri_key(uri) AS uri_key, lineno FROM cp_uris) u
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM uris 
+                        WHERE uris.uri_key = u.uri_key AND uris.archive > %(archive)s)
+                    ORDER BY uri_key, lineno DESC
+            """,
+            {"archive": archive},
+        )
+        # Older copies are replaced, their uriids are reused.
+        cursor.execute(
+            """ CREATE TEMP TABLE cp_deleted AS 
+                    SELECT uriid FROM uris WHERE uri_key IN (SELECT uri_key FROM cp_docs)
+            """
+        )
+        self._delete_postings("cp_deleted", cursor)
         cursor.execute(
             """ WITH 
-                    this_uris(uriid, uri) AS
-                        (INSERT INTO uris(uri) SELECT uri FROM cp_uris RETURNING *)
+                    this_uris(uriid, uri_key) AS
+                        (INSERT INTO uris(uri, uri_key, archive) 
+                            SELECT uri, uri_key, %(archive)s FROM cp_docs
+                        ON CONFLICT (uri_key) 
+                            DO UPDATE SET uri = EXCLUDED.uri, archive = EXCLUDED.archive
+                        RETURNING uriid, uri_key)
 
-                INSERT INTO token_uri_mapping 
+                INSERT INTO cp_postings 
                     SELECT uriid, position, tokenid 
                     FROM this_uris 
-                        JOIN cp_uris USING(uri) 
+                        JOIN cp_docs USING(uri_key) 
                         JOIN cp_tokens USING(warc) 
                         JOIN tokens USING(token)
+            """,
+            {"archive": archive},
+        )
+        # term_count covers all postings of a token, including pruned ones.
+        cursor.execute(
+            """ UPDATE tokens SET term_count = tokens.term_count + c.cnt
+                FROM (SELECT tokenid, COUNT(*) AS cnt FROM cp_postings GROUP BY tokenid) c
+                WHERE c.tokenid = tokens.tokenid
+            """
+        )
+        cursor.execute(
+            """ INSERT INTO token_uri_mapping 
+                    SELECT uriid, position, tokenid 
+                    FROM cp_postings JOIN tokens USING(tokenid) 
+                    WHERE NOT pruned
             """
         )
+        if self.archive_pruned:
+            cursor.execute(
+                """ INSERT INTO token_uri_mapping_pruned
+                        SELECT uriid, position, tokenid 
+                        FROM cp_postings JOIN tokens USING(tokenid) 
+                        WHERE pruned
+                """
+            )
+        if self.bigrams:
+            self._insert_bigrams("cp_postings", cursor)
+        else:
+            cursor.execute("UPDATE corpus_version SET bigrams_complete = FALSE")
+        self._bump_version(cursor)
         cursor.execute("DROP TABLE cp_tokens;")
         cursor.execute("DROP TABLE cp_uris;")
+        cursor.execute("DROP TABLE cp_docs;")
+        cursor.execute("DROP TABLE cp_deleted;")
+        cursor.execute("DROP TABLE cp_postings;")
+
+        if self.prune_rel_tf is not None:
+            self.prune_postings(self.prune_rel_tf, self.archive_pruned, cursor)
+
+    def create_schema(self, cursor=None):
+        cursor = cursor or self.connection.cursor()
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS uris(uriid SERIAL PRIMARY KEY, uri VARCHAR)"
+        )
+        self.create_netloc_column(cursor)
+        # uri_key (see wpdxf.db.uris.normalize_uri) identifies a document, archive the copy stored of it.
+        cursor.execute(URI_KEY_FUNCTION)
+        cursor.execute("ALTER TABLE uris ADD COLUMN IF NOT EXISTS uri_key VARCHAR")
+        cursor.execute("ALTER TABLE uris ADD COLUMN IF NOT EXISTS archive VARCHAR")
+        cursor.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uris_uri_key_idx ON uris(uri_key)"
+        )
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS tokens(token VARCHAR(200) PRIMARY KEY, tokenid SERIAL)"
+        )
+        cursor.execute(
+            "ALTER TABLE tokens ADD COLUMN IF NOT EXISTS term_count INT NOT NULL DEFAULT 0"
+        )
+        cursor.execute(
+            "ALTER TABLE tokens ADD COLUMN IF NOT EXISTS pruned BOOLEAN NOT NULL DEFAULT FALSE"
+        )
+        cursor.execute("SELECT to_regclass('token_uri_mapping') IS NULL")
+        if cursor.fetchone()[0] and self.partitions > 0:
+            self._create_partitioned_postings(self.partitions, cursor)
+            self._create_postings_index(cursor)
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS token_uri_mapping(uriid INT, position INT, tokenid INT);"
+        )
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS token_uri_mapping_pruned (LIKE token_uri_mapping);"
+        )
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS bigram_uri_mapping(
+                uriid INT, position INT, first_tokenid INT, second_tokenid INT)"""
+        )
+        cursor.execute(
+            """CREATE INDEX IF NOT EXISTS bigram_uri_mapping_idx 
+                ON bigram_uri_mapping(first_tokenid, second_tokenid, uriid)"""
+        )
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS bigrams(
+                first_tokenid INT, second_tokenid INT, bigram_count INT NOT NULL,
+                PRIMARY KEY(first_tokenid, second_tokenid))"""
+        )
+        cursor.execute("CREATE TABLE IF NOT EXISTS corpus_version(version INT NOT NULL)")
+        # Existing bigram indexes might be incomplete, until they are rebuilt (see 'create_bigrams').
+        cursor.execute(
+            "ALTER TABLE corpus_version ADD COLUMN IF NOT EXISTS bigrams_complete BOOLEAN NOT NULL DEFAULT FALSE"
+        )
+        # The bigram index of an empty corpus is complete.
+        cursor.execute(
+            """INSERT INTO corpus_version(version, bigrams_complete) 
+                SELECT 0, NOT EXISTS (SELECT FROM token_uri_mapping) 
+                WHERE NOT EXISTS (SELECT FROM corpus_version)"""
+        )
+
+    def corpus_version(self) -> str:
+        """Identifies the database and its content: the version is increased by each change 
+        of its uris, postings or term counts (see URLCache).
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT to_regclass('corpus_version') IS NOT NULL")
+        version = 0
+        if cursor.fetchone()[0]:
+            cursor.execute("SELECT version FROM corpus_version")
+            (version,) = cursor.fetchone()
+        cursor.close()
+        params = self.connection.info.dsn_parameters
+        return f"postgres://{params.get('host')}:{params.get('port')}/{params.get('dbname')}@{version}"
+
+    @staticmethod
+    def _bump_version(cursor):
+        cursor.execute("UPDATE corpus_version SET version = version + 1")
+
+    def bigrams_complete(self) -> bool:
+        """Whether the bigram index covers all postings (see 'create_bigrams'). 
+        It is complete after 'create_bigrams' and as long as all archives are copied with 'bigrams' set, 
+        a copy without bigrams invalidates it.
+        """
+        cursor = self.connection.cursor()
+        # Databases that were not migrated yet (see 'create_schema') have no complete index.
+        cursor.execute(
+            """SELECT EXISTS (SELECT FROM information_schema.columns 
+                WHERE table_name = 'corpus_version' AND column_name = 'bigrams_complete')"""
+        )
+        complete = False
+        if cursor.fetchone()[0]:
+            cursor.execute("SELECT bigrams_complete FROM corpus_version")
+            (complete,) = cursor.fetchone()
+        cursor.close()
+        return complete
+
+    def partition_postings(self, partitions: int, cursor=None):
+        """Migrates 'token_uri_mapping' (partitioned or not) into a table with 'partitions' hash partitions 
+        on tokenid. As each posting query selects the postings of a few tokenids, 
+        only their partitions are scanned (partition pruning), and in parallel if possible. 
+        Each partition has its own (smaller) index on (tokenid, uriid, position), which is built 
+        after the postings are copied.
+        """
+        cursor = cursor or self.connection.cursor()
+        cursor.execute(
+            """ SELECT COUNT(*) FROM pg_inherits 
+                WHERE inhparent = to_regclass('token_uri_mapping')
+            """
+        )
+        if cursor.fetchone()[0] == partitions:
+            logging.info(f"token_uri_mapping already has {partitions} partitions.")
+            return
+        cursor.execute("DROP TABLE IF EXISTS token_uri_mapping_old;")
+        cursor.execute("ALTER TABLE token_uri_mapping RENAME TO token_uri_mapping_old;")
+        self._create_partitioned_postings(partitions, cursor)
+        cursor.execute(
+            """ INSERT INTO token_uri_mapping(uriid, position, tokenid)
+                    SELECT uriid, position, tokenid FROM token_uri_mapping_old
+            """
+        )
+        cursor.execute("DROP TABLE token_uri_mapping_old;")
+        self._create_postings_index(cursor)
+        cursor.execute("ANALYZE token_uri_mapping;")
+        logging.info(f"Partitioned token_uri_mapping into {partitions} partitions.")
+
+    @staticmethod
+    def _create_partitioned_postings(partitions: int, cursor):
+        cursor.execute(
+            """ CREATE TABLE token_uri_mapping(uriid INT, position INT, tokenid INT)
+                PARTITION BY HASH (tokenid)
+            """
+        )
+        for i in range(partitions):
+            cursor.execute(
+                f""" CREATE TABLE token_uri_mapping_{i}_of_{partitions} PARTITION OF token_uri_mapping 
+                    FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i})
+                """
+            )
+
+    @staticmethod
+    def _create_postings_index(cursor):
+        # Created on each partition, partitions attached later are indexed automatically.
+        cursor.execute(
+            """ CREATE INDEX IF NOT EXISTS token_uri_mapping_tokenid_idx 
+                ON token_uri_mapping(tokenid, uriid, position)
+            """
+        )
+
+    def create_bigrams(self, cursor=None):
+        """(Re-)builds the adjacent token pair index from the existing postings. 
+        'bigram_uri_mapping' stores, for each position of a uri, the token at that position and the token 
+        at the next position, 'bigrams' the number of occurrences of each pair. 
+        QueryExecutor(use_bigrams=True) uses them to restrict the posting queries of multi-token pairs. 
+        Pairs of pruned tokens are not indexed, as these tokens are never part of a query.
+        """
+        cursor = cursor or self.connection.cursor()
+        self.create_schema(cursor)
+        cursor.execute("TRUNCATE bigram_uri_mapping, bigrams;")
+        self._insert_bigrams("token_uri_mapping", cursor)
+        cursor.execute("UPDATE corpus_version SET bigrams_complete = TRUE")
+
+    def _insert_bigrams(self, postings: str, cursor):
+        cursor.execute(
+            f""" WITH 
+                    new_bigrams AS 
+                        (INSERT INTO bigram_uri_mapping
+                            SELECT a.uriid, a.position, a.tokenid, b.tokenid
+                            FROM {postings} a 
+                                JOIN {postings} b ON a.uriid = b.uriid AND b.position = a.position + 1
+                                JOIN tokens ta ON ta.tokenid = a.tokenid
+                                JOIN tokens tb ON tb.tokenid = b.tokenid
+                            WHERE NOT ta.pruned AND NOT tb.pruned
+                        RETURNING first_tokenid, second_tokenid)
+
+                INSERT INTO bigrams 
+                    SELECT first_tokenid, second_tokenid, COUNT(*) 
+                    FROM new_bigrams 
+                    GROUP BY first_tokenid, second_tokenid
+                ON CONFLICT (first_tokenid, second_tokenid) 
+                    DO UPDATE SET bigram_count = bigrams.bigram_count + EXCLUDED.bigram_count
+            """
+        )
+
+    def dedupe_uris(self, cursor=None):
+        """Migrates 'uris' of databases that were loaded without uri_key: 
+        all uris are keyed and, for each key, only the most recent copy is kept 
+        (greatest archive, then greatest uriid). Postings of the other copies are deleted.
+        """
+        cursor = cursor or self.connection.cursor()
+        self.create_schema(cursor)
+        cursor.execute("DROP TABLE IF EXISTS cp_keys;")
+        cursor.execute("DROP TABLE IF EXISTS cp_deleted;")
+        cursor.execute(
+            """ CREATE TEMP TABLE cp_keys AS
+                    SELECT uriid, COALESCE(uri_key, uri_key(uri)) AS uri_key, archive FROM uris
+            """
+        )
+        cursor.execute(
+            """ CREATE TEMP TABLE cp_deleted AS
+                    SELECT uriid FROM (
+                        SELECT uriid, row_number() OVER (
+                            PARTITION BY uri_key ORDER BY archive DESC NULLS LAST, uriid DESC) AS rank
+                        FROM cp_keys) k
+                    WHERE rank > 1
+            """
+        )
+        cursor.execute("SELECT COUNT(*) FROM cp_deleted")
+        (num_deleted,) = cursor.fetchone()
+        self._delete_uriids("cp_deleted", cursor)
+        cursor.execute(
+            """ UPDATE uris SET uri_key = k.uri_key FROM cp_keys k 
+                WHERE k.uriid = uris.uriid AND uris.uri_key IS NULL
+            """
+        )
+        cursor.execute("DROP TABLE cp_keys;")
+        cursor.execute("DROP TABLE cp_deleted;")
+        logging.info(f"Deduplicated uris, removed {num_deleted} copies.")
+        return num_deleted
+
+    def _delete_postings(self, uriids: str, cursor):
+        """Deletes all postings (and bigrams) of the uriids in table 'uriids', 
+        term_count and bigram_count are decreased accordingly. 
+        Pruned postings are only counted if they were archived.
+        """
+        for mapping in ("token_uri_mapping", "token_uri_mapping_pruned"):
+            cursor.execute(
+                f""" WITH 
+                        deleted AS 
+                            (DELETE FROM {mapping} WHERE uriid IN (SELECT uriid FROM {uriids}) 
+                            RETURNING tokenid)
+
+                    UPDATE tokens SET term_count = tokens.term_count - c.cnt
+                    FROM (SELECT tokenid, COUNT(*) AS cnt FROM deleted GROUP BY tokenid) c
+                    WHERE c.tokenid = tokens.tokenid
+                """
+            )
+        cursor.execute(
+            f""" WITH 
+                    deleted AS 
+                        (DELETE FROM bigram_uri_mapping WHERE uriid IN (SELECT uriid FROM {uriids}) 
+                        RETURNING first_tokenid, second_tokenid)
+
+                UPDATE bigrams SET bigram_count = bigrams.bigram_count - c.cnt
+                FROM (
+                    SELECT first_tokenid, second_tokenid, COUNT(*) AS cnt 
+                    FROM deleted GROUP BY first_tokenid, second_tokenid) c
+                WHERE c.first_tokenid = bigrams.first_tokenid AND c.second_tokenid = bigrams.second_tokenid
+            """
+        )
+
+    def _delete_uriids(self, uriids: str, cursor):
+        """Deletes the uris (and all of their postings) of the uriids in table 'uriids'."""
+        self._delete_postings(uriids, cursor)
+        cursor.execute(f"DELETE FROM uris WHERE uriid IN (SELECT uriid FROM {uriids})")
+        self._bump_version(cursor)
+
+    def update_term_counts(self, cursor=None):
+        """Recomputes term_count of all (not pruned) tokens from their postings, 
+        e.g. for databases that were loaded before term_count was maintained by '_copy_from'.
+        """
+        cursor = cursor or self.connection.cursor()
+        self.create_schema(cursor)
+        cursor.execute(
+            """ UPDATE tokens SET term_count = c.cnt
+                FROM (SELECT tokenid, COUNT(*) AS cnt FROM token_uri_mapping GROUP BY tokenid) c
+                WHERE c.tokenid = tokens.tokenid AND NOT tokens.pruned
+            """
+        )
+        self._bump_version(cursor)
+
+    def prune_postings(self, max_rel_tf: float, archive: bool = False, cursor=None):
+        """Removes the postings of all tokens whose relative term frequency (term_count / MAX_CORPUS_FREQ) 
+        is at least max_rel_tf. QueryExecutor ignores these tokens for the same (or any lower) max_rel_tf, 
+        therefore query results do not change. The tokens themselves are kept (flagged as 'pruned'), 
+        QueryExecutor drops pruned tokens for any max_rel_tf (see 'add_token'), their postings are incomplete.
+
+        Args:
+            max_rel_tf (float): Relative term frequency at which postings are pruned.
+            archive (bool, optional): Move the postings to 'token_uri_mapping_pruned' instead of 
+                deleting them. Defaults to False.
+        """
+        cursor = cursor or self.connection.cursor()
+        self.create_schema(cursor)
+        stmt = """
+            WITH 
+                pruned_tokens(tokenid) AS 
+                    (UPDATE tokens SET pruned = TRUE
+                    WHERE NOT pruned AND term_count::float / %(max_abs_tf)s >= %(max_rel_tf)s
+                    RETURNING tokenid),
+                pruned_postings AS 
+                    (DELETE FROM token_uri_mapping 
+                    WHERE tokenid IN (SELECT tokenid FROM pruned_tokens) 
+                    RETURNING uriid, position, tokenid)
+        """
+        if archive:
+            stmt += "INSERT INTO token_uri_mapping_pruned SELECT * FROM pruned_postings"
+        else:
+            stmt += "SELECT COUNT(*) FROM pruned_postings"
+        params = {"max_abs_tf": Settings().MAX_CORPUS_FREQ, "max_rel_tf": max_rel_tf}
+        cursor.execute(stmt, params)
+        num_postings = cursor.rowcount if archive else cursor.fetchone()[0]
+        self._bump_version(cursor)
+        logging.info(f"Pruned {num_postings} postings (max_rel_tf: {max_rel_tf}).")
+        return num_postings
+
+    def create_netloc_column(self, cursor=None):
+        """Adds the (stored, generated) column 'netloc' to 'uris', 
+        which allows to aggregate matches per host inside the database.
+        Existing rows are filled automatically, this requires a rewrite of 'uris' once.
+        """
+        cursor = cursor or self.connection.cursor()
+        cursor.execute(
+            f"""ALTER TABLE uris ADD COLUMN IF NOT EXISTS netloc VARCHAR 
+                GENERATED ALWAYS AS (substring(uri from '{NETLOC_PATTERN}')) STORED"""
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS uris_netloc_idx ON uris(netloc, uriid)"
+        )
 
     def delete_entries_for_uri(self, uri):
+        self.delete_uris([uri])
+
+    def delete_uris(self, uris: List[str]) -> int:
+        """Deletes the given uris (and their variants, see normalize_uri) from the corpus.
+
+        Returns:
+            int: Number of deleted uris.
+        """
         cursor = self.connection.cursor()
-        cursor.execute("DELETE FROM uris WHERE uri = %s RETURNING uriid", (uri,))
-        # As uri is unique, this for-loop should iterate over a single uriid.
-        for uriid in cursor.fetchall():
-            cursor.execute("DELETE FROM token_uri_mapping WHERE uriid = %s", uriid)
-        cursor.close()
\ No newline at end of file
+        self.create_schema(cursor)
+        cursor.execute("DROP TABLE IF EXISTS cp_keys;")
+        cursor.execute("CREATE TEMP TABLE cp_keys(uri_key VARCHAR);")
+        cursor.execute(
+            "INSERT INTO cp_keys SELECT unnest(%s::VARCHAR[])",
+            ([normalize_uri(uri) for uri in uris],),
+        )
+        condition = "uri_key IN (SELECT uri_key FROM cp_keys)"
+        cursor.execute("SELECT EXISTS (SELECT FROM uris WHERE uri_key IS NULL)")
+        if cursor.fetchone()[0]:
+            # Uris loaded before uri_key was introduced (see 'dedupe_uris') are keyed on the fly.
+            condition = "COALESCE(uri_key, uri_key(uri)) IN (SELECT uri_key FROM cp_keys)"
+        num_deleted = self._delete_where(condition, cursor=cursor)
+        cursor.execute("DROP TABLE cp_keys;")
+        cursor.close()
+        return num_deleted
+
+    def delete_uri_prefix(self, prefix: str) -> int:
+        """Deletes all uris starting with 'prefix' (e.g. 'https://www.ex.com/archive/') from the corpus.
+
+        Returns:
+            int: Number of deleted uris.
+        """
+        return self._delete_where("left(uri, length(%(p)s)) = %(p)s", {"p": prefix})
+
+    def delete_host(self, netloc: str) -> int:
+        """Deletes all uris of a host (as in urlsplit(uri).netloc) from the corpus.
+
+        Returns:
+            int: Number of deleted uris.
+        """
+        return self._delete_where("netloc = %s", (netloc,))
+
+    def delete_archive(self, archive: str) -> int:
+        """Unloads an archive: deletes all uris that are stored from it (the file name of 
+        its term/mapping files). Uris that were replaced by a newer archive are not affected.
+
+        Returns:
+            int: Number of deleted uris.
+        """
+        return self._delete_where("archive = %s", (path.basename(archive),))
+
+    def _delete_where(self, condition: str, params=None, cursor=None) -> int:
+        """Deletes all uris that fulfill 'condition' (and their postings) set-based, 
+        term_count and bigram_count are maintained (see _delete_postings)."""
+        close = cursor is None
+        cursor = cursor or self.connection.cursor()
+        cursor.execute("DROP TABLE IF EXISTS cp_deleted;")
+        cursor.execute(
+            f"CREATE TEMP TABLE cp_deleted AS SELECT uriid FROM uris WHERE {condition}",
+            params,
+        )
+        cursor.execute("SELECT COUNT(*) FROM cp_deleted")
+        (num_deleted,) = cursor.fetchone()
+        self._delete_uriids("cp_deleted", cursor)
+        cursor.execute("DROP TABLE cp_deleted;")
+        if close:
+            cursor.close()
+        logging.info(f"Deleted {num_deleted} uris.")
+        return num_deleted
+
+
+class PostgresDBPool:
+    """A thread-safe pool of Postgres connections.
+    Each thread borrows its own connection through 'session()', 
+    which allows independent queries to run concurrently on the database.
+    """
+
+    def __init__(self, size: int, parallel_workers: int = None, shard: int = 0):
+        self.size = size
+        # Connections are opened lazily, on first demand.
+        self._pool = ThreadedConnectionPool(
+            0, size, **_connect_kwargs(parallel_workers, shard)
+        )
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def pool(self) -> ThreadedConnectionPool:
+        if self._pool is None:
+            raise PoolError("connection pool is closed")
+        return self._pool
+
+    @contextmanager
+    def session(self):
+        connection = self.pool.getconn()
+        session = PostgresDBSession(connection)
+        try:
+            yield session
+        finally:
+            # Detach the session before the connection can be handed out again.
+            session.close(commit=False)
+            self.pool.putconn(connection)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
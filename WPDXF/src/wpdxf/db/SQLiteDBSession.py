@@ -0,0 +1,552 @@
+import gzip
+import logging
+import random
+import re
+import sqlite3
+from contextlib import contextmanager
+from glob import glob
+from os import path
+from typing import List
+from urllib.parse import urlsplit
+
+random.seed(0)
+
+from wpdxf.db.uris import normalize_uri
+from wpdxf.utils.settings import Settings
+from wpdxf.utils.utils import make_dirs, read_file
+
+DEL = " "
+# Statements are written for psycopg2 ('format' and 'pyformat' paramstyle),
+# they are translated into sqlite3's 'qmark' and 'named' paramstyle.
+_PARAMETER = re.compile(r"%\((\w+)\)s|%s")
+
+# Columns added after the initial layout: (table, column, definition)
+COLUMNS = (
+    ("tokens", "pruned", "BOOLEAN NOT NULL DEFAULT FALSE"),
+    ("uris", "uri_key", "VARCHAR"),
+    ("uris", "archive", "VARCHAR"),
+    # Existing bigram indexes might be incomplete, until they are rebuilt (see 'create_bigrams').
+    ("corpus_version", "bigrams_complete", "BOOLEAN NOT NULL DEFAULT FALSE"),
+)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS tokens(
+        tokenid INTEGER PRIMARY KEY, token VARCHAR(200) UNIQUE,
+        term_count INTEGER NOT NULL DEFAULT 0, pruned BOOLEAN NOT NULL DEFAULT FALSE)""",
+    """CREATE TABLE IF NOT EXISTS uris(
+        uriid INTEGER PRIMARY KEY, uri VARCHAR, netloc VARCHAR, uri_key VARCHAR, archive VARCHAR)""",
+    "CREATE TABLE IF NOT EXISTS token_uri_mapping(uriid INT, position INT, tokenid INT)",
+    "CREATE TABLE IF NOT EXISTS token_uri_mapping_pruned(uriid INT, position INT, tokenid INT)",
+    "CREATE INDEX IF NOT EXISTS token_uri_mapping_idx ON token_uri_mapping(tokenid, uriid, position)",
+    "CREATE INDEX IF NOT EXISTS uris_netloc_idx ON uris(netloc, uriid)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uris_uri_key_idx ON uris(uri_key)",
+    """CREATE TABLE IF NOT EXISTS bigram_uri_mapping(
+        uriid INT, position INT, first_tokenid INT, second_tokenid INT)""",
+    """CREATE INDEX IF NOT EXISTS bigram_uri_mapping_idx
+        ON bigram_uri_mapping(first_tokenid, second_tokenid, uriid)""",
+    """CREATE TABLE IF NOT EXISTS bigrams(
+        first_tokenid INT, second_tokenid INT, bigram_count INT NOT NULL,
+        PRIMARY KEY(first_tokenid, second_tokenid))""",
+    """CREATE TABLE IF NOT EXISTS corpus_version(
+        version INTEGER NOT NULL, bigrams_complete BOOLEAN NOT NULL DEFAULT FALSE)""",
+    # The bigram index of an empty corpus is complete.
+    """INSERT INTO corpus_version(version, bigrams_complete)
+        SELECT 0, NOT EXISTS (SELECT 1 FROM token_uri_mapping)
+        WHERE NOT EXISTS (SELECT 1 FROM corpus_version)""",
+)
+
+
+class SQLiteCursor:
+    """Wraps sqlite3.Cursor, such that it can be used as context manager (like psycopg2 cursors)."""
+
+    def __init__(self, cursor: sqlite3.Cursor) -> None:
+        self._cursor = cursor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+
+class SQLiteDBSession:
+    """Embedded alternative to PostgresDBSession.
+    Builds the same schema (tokens, uris, token_uri_mapping) from TERM_STORE/MAP_STORE
+    and answers the same statements, without a database server.
+    """
+
+    def __init__(
+        self,
+        database: str = None,
+        prune_rel_tf: float = None,
+        archive_pruned: bool = False,
+        bigrams: bool = False,
+    ):
+        """
+        Args:
+            database (str, optional): Path of the database file. Defaults to SQLITE_DB.
+            prune_rel_tf (float, optional): See PostgresDBSession. Defaults to None.
+            archive_pruned (bool, optional): See PostgresDBSession. Defaults to False.
+            bigrams (bool, optional): See PostgresDBSession. Defaults to False.
+        """
+        self.database = database or Settings().SQLITE_DB
+        self.prune_rel_tf = prune_rel_tf
+        self.archive_pruned = archive_pruned
+        self.bigrams = bigrams
+        self._connection = None
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if self.database != ":memory:":
+                make_dirs(self.database)
+            self._connection = sqlite3.connect(self.database, check_same_thread=False)
+            if self.database != ":memory:":
+                # Allows concurrent readers (see SQLiteDBPool) next to a single writer.
+                self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.create_function(
+                "uri_key", 1, normalize_uri, deterministic=True
+            )
+            self.create_schema()
+        return self._connection
+
+    def create_schema(self):
+        connection = self._connection
+        tables = set(t for t, in connection.execute("SELECT name FROM sqlite_master"))
+        for table, column, definition in COLUMNS:
+            if table not in tables:
+                continue
+            columns = set(c for _, c, *_ in connection.execute(f"PRAGMA table_info({table})"))
+            if column not in columns:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        for stmt in SCHEMA:
+            connection.execute(stmt)
+
+    def corpus_version(self) -> str:
+        """See PostgresDBSession.corpus_version."""
+        (version,) = self.connection.execute("SELECT version FROM corpus_version").fetchone()
+        return f"sqlite://{path.abspath(self.database)}@{version}"
+
+    @staticmethod
+    def _bump_version(cursor):
+        cursor.execute("UPDATE corpus_version SET version = version + 1")
+
+    def bigrams_complete(self) -> bool:
+        """See PostgresDBSession.bigrams_complete."""
+        (complete,) = self.connection.execute("SELECT bigrams_complete FROM corpus_version").fetchone()
+        return bool(complete)
+
+    def close(self, commit=True):
+        if self._connection is not None:
+            if commit:
+                self._connection.commit()
+            self._connection.close()
+            self._connection = None
+
+    @staticmethod
+    def probeConnection():
+        c = sqlite3.connect(Settings().SQLITE_DB)
+        c.close()
+
+    def execute_from_file(self, filename):
+        cursor = self.connection.cursor()
+
+        stmts = read_file(filename)
+        while stmts:
+            stmt, _, stmts = stmts.partition(";")
+            if not stmt.startswith("--"):
+                self.execute(stmt, cursor=cursor)
+        cursor.close()
+
+    def execute(self, operation, parameters=None, cursor=None):
+        cursor = cursor or SQLiteCursor(self.connection.cursor())
+        operation = _PARAMETER.sub(
+            lambda m: "?" if m.group(1) is None else f":{m.group(1)}", operation
+        )
+        cursor.execute(operation, parameters or ())
+        return cursor
+
+    def explain(self, operation, parameters=None) -> dict:
+        with self.execute("EXPLAIN QUERY PLAN " + operation, parameters) as cur:
+            return {"plan": [detail for *_, detail in cur]}
+
+    def copy_from(self, limit=0, offset=0):
+        terms = sorted(glob(path.join(Settings().TERM_STORE, "*.wet.gz")))
+        if offset >= len(terms):
+            return []
+        u_idx = min(offset + limit, len(terms))
+        self._copy_iter(terms[offset:u_idx])
+
+    def copy_from_sample(self, limit):
+        terms = sorted(glob(path.join(Settings().TERM_STORE, "*.wet.gz")))
+        self._copy_iter(random.sample(terms, k=limit))
+
+    def _copy_iter(self, terms):
+        for t in terms:
+            bname = path.basename(t)
+            mapping = path.join(Settings().MAP_STORE, bname)
+
+            logging.info(f"Started: Copy {bname} into SQLite DB.")
+            self._copy_from(mapping, t)
+            self.connection.commit()
+            logging.info(f"Finished: Copy {bname} into SQLite DB.")
+
+    @staticmethod
+    def _read_rows(filename, maxsplit):
+        with gzip.open(filename, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n").replace("\0", "")
+                if line:
+                    yield line.split(DEL, maxsplit)
+
+    def _copy_from(self, mapping, terms):
+        # See PostgresDBSession._copy_from
+        archive = path.basename(terms)
+        cursor = self.connection.cursor()
+
+        cursor.execute("DROP TABLE IF EXISTS cp_tokens;")
+        cursor.execute("DROP TABLE IF EXISTS cp_uris;")
+        cursor.execute("DROP TABLE IF EXISTS cp_deleted;")
+        cursor.execute("DROP TABLE IF EXISTS cp_postings;")
+        cursor.execute(
+            "CREATE TEMP TABLE cp_tokens(warc CHAR(47), position INT, token VARCHAR(200));"
+        )
+        cursor.execute(
+            "CREATE TEMP TABLE cp_uris(warc CHAR(47) UNIQUE, uri VARCHAR, netloc VARCHAR, uri_key VARCHAR);"
+        )
+
+        # A single document per uri_key: the last one of this archive.
+        docs = {}
+        for warc, uri in self._read_rows(mapping, 1):
+            docs[normalize_uri(uri)] = (warc, uri)
+        cursor.executemany(
+            "INSERT OR IGNORE INTO cp_uris VALUES (?, ?, ?, ?)",
+            (
+                (warc, uri, urlsplit(uri).netloc, uri_key)
+                for uri_key, (warc, uri) in docs.items()
+            ),
+        )
+        cursor.executemany(
+            "INSERT INTO cp_tokens VALUES (?, ?, ?)", self._read_rows(terms, 2)
+        )
+
+        cursor.execute(
+            "INSERT OR IGNORE INTO tokens(token) SELECT DISTINCT token FROM cp_tokens;"
+        )
+        # Unless the uri_key is already stored from a more recent archive.
+        cursor.execute(
+            "DELETE FROM cp_uris WHERE uri_key IN (SELECT uri_key FROM uris WHERE archive > ?)",
+            (archive,),
+        )
+        # Older copies are replaced, their uriids are reused.
+        cursor.execute(
+            """ CREATE TEMP TABLE cp_deleted AS
+                    SELECT uriid FROM uris WHERE uri_key IN (SELECT uri_key FROM cp_uris)
+            """
+        )
+        self._delete_postings("cp_deleted", cursor)
+        # 'WHERE TRUE' resolves the ambiguity of INSERT ... SELECT ... ON CONFLICT in SQLite.
+        cursor.execute(
+            """ INSERT INTO uris(uri, netloc, uri_key, archive)
+                    SELECT uri, netloc, uri_key, ? FROM cp_uris WHERE TRUE
+                ON CONFLICT (uri_key) DO UPDATE
+                    SET uri = excluded.uri, netloc = excluded.netloc, archive = excluded.archive
+            """,
+            (archive,),
+        )
+        cursor.execute(
+            """ CREATE TEMP TABLE cp_postings AS
+                    SELECT uriid, position, tokenid
+                    FROM cp_uris
+                        JOIN uris USING(uri_key)
+                        JOIN cp_tokens USING(warc)
+                        JOIN tokens USING(token)
+            """
+        )
+        # term_count is the number of postings per token (including pruned ones),
+        # it is kept up to date with each file.
+        cursor.execute(
+            """ UPDATE tokens SET term_count = term_count + (
+                    SELECT COUNT(*) FROM cp_postings WHERE cp_postings.tokenid = tokens.tokenid)
+                WHERE tokenid IN (SELECT tokenid FROM cp_postings)
+            """
+        )
+        cursor.execute(
+            """ INSERT INTO token_uri_mapping
+                    SELECT uriid, position, tokenid
+                    FROM cp_postings JOIN tokens USING(tokenid)
+                    WHERE NOT pruned
+            """
+        )
+        if self.archive_pruned:
+            cursor.execute(
+                """ INSERT INTO token_uri_mapping_pruned
+                        SELECT uriid, position, tokenid
+                        FROM cp_postings JOIN tokens USING(tokenid)
+                        WHERE pruned
+                """
+            )
+        if self.bigrams:
+            self._insert_bigrams("cp_postings", cursor)
+        else:
+            cursor.execute("UPDATE corpus_version SET bigrams_complete = FALSE")
+        self._bump_version(cursor)
+        cursor.execute("DROP TABLE cp_tokens;")
+        cursor.execute("DROP TABLE cp_uris;")
+        cursor.execute("DROP TABLE cp_deleted;")
+        cursor.execute("DROP TABLE cp_postings;")
+        cursor.close()
+
+        if self.prune_rel_tf is not None:
+            self.prune_postings(self.prune_rel_tf, self.archive_pruned)
+
+    def create_bigrams(self):
+        """See PostgresDBSession.create_bigrams."""
+        cursor = self.connection.cursor()
+        cursor.execute("DELETE FROM bigram_uri_mapping;")
+        cursor.execute("DELETE FROM bigrams;")
+        self._insert_bigrams("token_uri_mapping", cursor)
+        cursor.execute("UPDATE corpus_version SET bigrams_complete = TRUE")
+        cursor.close()
+
+    def _insert_bigrams(self, postings: str, cursor):
+        cursor.execute("DROP TABLE IF EXISTS cp_bigrams;")
+        cursor.execute(
+            f""" CREATE TEMP TABLE cp_bigrams AS
+                    SELECT a.uriid, a.position, a.tokenid AS first_tokenid, b.tokenid AS second_tokenid
+                    FROM {postings} a
+                        JOIN {postings} b ON a.uriid = b.uriid AND b.position = a.position + 1
+                        JOIN tokens ta ON ta.tokenid = a.tokenid
+                        JOIN tokens tb ON tb.tokenid = b.tokenid
+                    WHERE NOT ta.pruned AND NOT tb.pruned
+            """
+        )
+        cursor.execute("INSERT INTO bigram_uri_mapping SELECT * FROM cp_bigrams")
+        # 'WHERE TRUE' resolves the ambiguity of INSERT ... SELECT ... ON CONFLICT in SQLite.
+        cursor.execute(
+            """ INSERT INTO bigrams
+                    SELECT first_tokenid, second_tokenid, COUNT(*)
+                    FROM cp_bigrams WHERE TRUE
+                    GROUP BY first_tokenid, second_tokenid
+                ON CONFLICT (first_tokenid, second_tokenid)
+                    DO UPDATE SET bigram_count = bigram_count + excluded.bigram_count
+            """
+        )
+        cursor.execute("DROP TABLE cp_bigrams;")
+
+    def dedupe_uris(self) -> int:
+        """See PostgresDBSession.dedupe_uris."""
+        cursor = self.connection.cursor()
+        cursor.execute("DROP TABLE IF EXISTS cp_keys;")
+        cursor.execute("DROP TABLE IF EXISTS cp_deleted;")
+        cursor.execute(
+            """ CREATE TEMP TABLE cp_keys AS
+                    SELECT uriid, COALESCE(uri_key, uri_key(uri)) AS uri_key, archive FROM uris
+            """
+        )
+        cursor.execute(
+            """ CREATE TEMP TABLE cp_deleted AS
+                    SELECT uriid FROM (
+                        SELECT uriid, row_number() OVER (
+                            PARTITION BY uri_key ORDER BY archive DESC NULLS LAST, uriid DESC) AS rank
+                        FROM cp_keys) k
+                    WHERE rank > 1
+            """
+        )
+        (num_deleted,) = cursor.execute("SELECT COUNT(*) FROM cp_deleted").fetchone()
+        self._delete_uriids("cp_deleted", cursor)
+        cursor.execute(
+            """ UPDATE uris SET uri_key = (SELECT uri_key FROM cp_keys k WHERE k.uriid = uris.uriid)
+                WHERE uri_key IS NULL
+            """
+        )
+        cursor.execute("DROP TABLE cp_keys;")
+        cursor.execute("DROP TABLE cp_deleted;")
+        cursor.close()
+        logging.info(f"Deduplicated uris, removed {num_deleted} copies.")
+        return num_deleted
+
+    def _delete_postings(self, uriids: str, cursor):
+        """See PostgresDBSession._delete_postings."""
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {uriids})")
+        if not cursor.fetchone()[0]:
+            return
+        cursor.execute("DROP TABLE IF EXISTS cp_counts;")
+        for mapping in ("token_uri_mapping", "token_uri_mapping_pruned"):
+            cursor.execute(
+                f""" CREATE TEMP TABLE cp_counts AS
+                        SELECT tokenid, COUNT(*) AS cnt FROM {mapping}
+                        WHERE uriid IN (SELECT uriid FROM {uriids})
+                        GROUP BY tokenid
+                """
+            )
+            cursor.execute(
+                """ UPDATE tokens SET term_count = term_count - (
+                        SELECT cnt FROM cp_counts c WHERE c.tokenid = tokens.tokenid)
+                    WHERE tokenid IN (SELECT tokenid FROM cp_counts)
+                """
+            )
+            cursor.execute(
+                f"DELETE FROM {mapping} WHERE uriid IN (SELECT uriid FROM {uriids})"
+            )
+            cursor.execute("DROP TABLE cp_counts;")
+        cursor.execute(
+            f""" CREATE TEMP TABLE cp_counts AS
+                    SELECT first_tokenid, second_tokenid, COUNT(*) AS cnt FROM bigram_uri_mapping
+                    WHERE uriid IN (SELECT uriid FROM {uriids})
+                    GROUP BY first_tokenid, second_tokenid
+            """
+        )
+        cursor.execute(
+            """ UPDATE bigrams SET bigram_count = bigram_count - (
+                    SELECT cnt FROM cp_counts c
+                    WHERE c.first_tokenid = bigrams.first_tokenid
+                        AND c.second_tokenid = bigrams.second_tokenid)
+                WHERE (first_tokenid, second_tokenid) IN (
+                    SELECT first_tokenid, second_tokenid FROM cp_counts)
+            """
+        )
+        cursor.execute(
+            f"DELETE FROM bigram_uri_mapping WHERE uriid IN (SELECT uriid FROM {uriids})"
+        )
+        cursor.execute("DROP TABLE cp_counts;")
+
+    def _delete_uriids(self, uriids: str, cursor):
+        """See PostgresDBSession._delete_uriids."""
+        self._delete_postings(uriids, cursor)
+        cursor.execute(f"DELETE FROM uris WHERE uriid IN (SELECT uriid FROM {uriids})")
+        self._bump_version(cursor)
+
+    def update_term_counts(self):
+        """Recomputes term_count of all (not pruned) tokens from their postings."""
+        self.connection.execute(
+            """ UPDATE tokens SET term_count = (
+                    SELECT COUNT(*) FROM token_uri_mapping M WHERE M.tokenid = tokens.tokenid)
+                WHERE NOT pruned
+            """
+        )
+        self._bump_version(self.connection)
+
+    def prune_postings(self, max_rel_tf: float, archive: bool = False) -> int:
+        """See PostgresDBSession.prune_postings."""
+        cursor = self.connection.cursor()
+        cursor.execute("DROP TABLE IF EXISTS cp_pruned;")
+        cursor.execute(
+            """ CREATE TEMP TABLE cp_pruned AS
+                    SELECT tokenid FROM tokens
+                    WHERE NOT pruned AND CAST(term_count AS REAL) / ? >= ?
+            """,
+            (Settings().MAX_CORPUS_FREQ, max_rel_tf),
+        )
+        cursor.execute(
+            "UPDATE tokens SET pruned = TRUE WHERE tokenid IN (SELECT tokenid FROM cp_pruned)"
+        )
+        if archive:
+            cursor.execute(
+                """ INSERT INTO token_uri_mapping_pruned
+                        SELECT * FROM token_uri_mapping
+                        WHERE tokenid IN (SELECT tokenid FROM cp_pruned)
+                """
+            )
+        cursor.execute(
+            "DELETE FROM token_uri_mapping WHERE tokenid IN (SELECT tokenid FROM cp_pruned)"
+        )
+        num_postings = cursor.rowcount
+        self._bump_version(cursor)
+        cursor.execute("DROP TABLE cp_pruned;")
+        cursor.close()
+        logging.info(f"Pruned {num_postings} postings (max_rel_tf: {max_rel_tf}).")
+        return num_postings
+
+    def delete_entries_for_uri(self, uri):
+        self.delete_uris([uri])
+
+    def delete_uris(self, uris: List[str]) -> int:
+        """See PostgresDBSession.delete_uris."""
+        cursor = self.connection.cursor()
+        cursor.execute("DROP TABLE IF EXISTS cp_keys;")
+        cursor.execute("CREATE TEMP TABLE cp_keys(uri_key VARCHAR);")
+        cursor.executemany(
+            "INSERT INTO cp_keys VALUES (?)", ((normalize_uri(uri),) for uri in uris)
+        )
+        condition = "uri_key IN (SELECT uri_key FROM cp_keys)"
+        if cursor.execute("SELECT EXISTS (SELECT 1 FROM uris WHERE uri_key IS NULL)").fetchone()[0]:
+            # Uris loaded before uri_key was introduced (see 'dedupe_uris') are keyed on the fly.
+            condition = "COALESCE(uri_key, uri_key(uri)) IN (SELECT uri_key FROM cp_keys)"
+        num_deleted = self._delete_where(condition, cursor=cursor)
+        cursor.execute("DROP TABLE cp_keys;")
+        cursor.close()
+        return num_deleted
+
+    def delete_uri_prefix(self, prefix: str) -> int:
+        """See PostgresDBSession.delete_uri_prefix."""
+        return self._delete_where("substr(uri, 1, length(:p)) = :p", {"p": prefix})
+
+    def delete_host(self, netloc: str) -> int:
+        """See PostgresDBSession.delete_host."""
+        return self._delete_where("netloc = ?", (netloc,))
+
+    def delete_archive(self, archive: str) -> int:
+        """See PostgresDBSession.delete_archive."""
+        return self._delete_where("archive = ?", (path.basename(archive),))
+
+    def _delete_where(self, condition: str, params=(), cursor=None) -> int:
+        """See PostgresDBSession._delete_where."""
+        close = cursor is None
+        cursor = cursor or self.connection.cursor()
+        cursor.execute("DROP TABLE IF EXISTS cp_deleted;")
+        cursor.execute(
+            f"CREATE TEMP TABLE cp_deleted AS SELECT uriid FROM uris WHERE {condition}",
+            params,
+        )
+        (num_deleted,) = cursor.execute("SELECT COUNT(*) FROM cp_deleted").fetchone()
+        self._delete_uriids("cp_deleted", cursor)
+        cursor.execute("DROP TABLE cp_deleted;")
+        if close:
+            cursor.close()
+        logging.info(f"Deleted {num_deleted} uris.")
+        return num_deleted
+
+
+class SQLiteDBPool:
+    """Counterpart of PostgresDBPool, each borrowed session uses its own connection.
+    Requires a database file, as in-memory databases can not be shared between connections.
+    Unlike PostgresDBPool, the pool is unbounded: a session is opened whenever all others are borrowed
+    (the concurrency is bounded by the caller, e.g. the 'num_workers' threads of QueryExecutor).
+    """
+
+    def __init__(self, size: int, database: str = None):
+        """
+        Args:
+            size (int): The expected number of concurrent sessions, not enforced (see above). 
+                Kept for the interface of PostgresDBPool.
+            database (str, optional): Path of the database file. Defaults to SQLITE_DB.
+        """
+        self.size = size
+        self.database = database or Settings().SQLITE_DB
+        self._sessions = []
+
+    @contextmanager
+    def session(self):
+        try:
+            session = self._sessions.pop()
+        except IndexError:
+            session = SQLiteDBSession(self.database)
+        try:
+            yield session
+        finally:
+            session.connection.rollback()
+            self._sessions.append(session)
+
+    def close(self):
+        while self._sessions:
+            self._sessions.pop().close(commit=False)
@@ -0,0 +1,385 @@
+import gzip
+import heapq
+import logging
+import os
+import random
+import shutil
+import tempfile
+from collections import defaultdict
+from glob import glob
+from os import path
+from time import perf_counter, time_ns
+from typing import Dict, Iterator, List, Set, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+from wpdxf.db.queryGenerator import QueryExecutor
+from wpdxf.db.uris import normalize_uri
+from wpdxf.utils.settings import Settings
+from wpdxf.utils.utils import read_json, write_json
+from wpdxf.wrapping.objects.pairs import Pair
+
+DEL = " "
+
+# Files of an index directory (see PostingIndexBuilder)
+VOCAB = "vocab.npy"  # Sorted tokens (utf-8, fixed width), the tokenid is a token's index.
+OFFSETS = "offsets.npy"  # Start of each token's posting list, offsets[tokenid + 1] is its end.
+POSTING_URIS = "posting_uris.bin"  # Delta-encoded uriids (per posting list).
+POSTING_POSITIONS = "posting_positions.bin"  # Delta-encoded positions (per uri of a posting list).
+URIS = "uris.bin"  # Concatenated (utf-8) uris, the uriid is a uri's index.
+URI_OFFSETS = "uri_offsets.npy"
+URI_HOSTS = "uri_hosts.npy"  # hostid of each uri
+META = "meta.json"  # Number of tokens and postings, the hosts (netloc of each hostid), the build's version.
+
+POSTING_DTYPE = np.uint32
+
+
+def _read_rows(filename: str, maxsplit: int) -> Iterator[List[str]]:
+    with gzip.open(filename, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n").replace("\0", "")
+            if line:
+                yield line.split(DEL, maxsplit)
+
+
+class PostingIndexBuilder:
+    """Builds a read-only posting index from the TERM_STORE/MAP_STORE files, without any database.
+    Postings (token, uriid, position) are sorted by an external merge sort:
+    sorted runs of at most 'run_size' postings are written to disk and merged afterwards,
+    therefore the memory usage does not depend on the size of the corpus (apart from the vocabulary
+    and the uri keys).
+    Each uri (see normalize_uri) is indexed once, from the newest archive (as PostgresDBSession._copy_from).
+    """
+
+    def __init__(self, index_dir: str = None, run_size: int = 5_000_000) -> None:
+        self.index_dir = index_dir or Settings().POSTING_INDEX
+        self.run_size = run_size
+
+    def build(self, terms: List[str] = None):
+        """Builds the index of the given term files (default: all files in TERM_STORE),
+        an existing index in index_dir is replaced.
+
+        Args:
+            terms (List[str], optional): Paths of term files, the mapping files of the same name
+                are expected in MAP_STORE. Defaults to None.
+        """
+        if terms is None:
+            terms = sorted(glob(path.join(Settings().TERM_STORE, "*.wet.gz")))
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.index_dir)
+        try:
+            runs, hosts = self._write_runs(terms, tmp_dir)
+            self._merge_runs(runs, hosts)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def build_sample(self, limit: int):
+        """Builds the index of a random sample of 'limit' term files (as PostgresDBSession.copy_from_sample)."""
+        terms = sorted(glob(path.join(Settings().TERM_STORE, "*.wet.gz")))
+        self.build(random.sample(terms, k=limit))
+
+    @staticmethod
+    def _select_documents(terms: List[str]) -> Dict[str, Set[str]]:
+        """The warcs to index per archive: the last document of each uri key in the newest archive."""
+        documents = {}
+        for t in sorted(terms, key=path.basename):
+            bname = path.basename(t)
+            for warc, uri in _read_rows(path.join(Settings().MAP_STORE, bname), 1):
+                documents[normalize_uri(uri)] = (bname, warc)
+        selected = defaultdict(set)
+        for bname, warc in documents.values():
+            selected[bname].add(warc)
+        return selected
+
+    def _write_runs(self, terms: List[str], tmp_dir: str) -> Tuple[List[str], List[str]]:
+        selected = self._select_documents(terms)
+        runs = []
+        buffer = []
+
+        def flush():
+            if buffer:
+                buffer.sort()
+                run = path.join(tmp_dir, f"run{len(runs)}")
+                with open(run, "w", encoding="utf-8") as f:
+                    f.writelines(f"{t}{DEL}{u}{DEL}{p}\n" for t, u, p in buffer)
+                runs.append(run)
+                buffer.clear()
+
+        hosts = {}
+        uri_hosts = []
+        uri_offsets = [0]
+        with open(path.join(self.index_dir, URIS), "wb") as uri_file:
+            for t in terms:
+                bname = path.basename(t)
+                logging.info(f"Started: Index {bname}.")
+                warcs = {}
+                for warc, uri in _read_rows(path.join(Settings().MAP_STORE, bname), 1):
+                    if warc in warcs or warc not in selected[bname]:
+                        continue
+                    warcs[warc] = len(uri_hosts)
+                    netloc = urlsplit(uri).netloc
+                    uri_hosts.append(hosts.setdefault(netloc, len(hosts)))
+                    uri = uri.encode("utf-8")
+                    uri_file.write(uri)
+                    uri_offsets.append(uri_offsets[-1] + len(uri))
+
+                for warc, position, token in _read_rows(t, 2):
+                    uriid = warcs.get(warc)
+                    if uriid is not None:
+                        buffer.append((token, uriid, int(position)))
+                    if len(buffer) >= self.run_size:
+                        flush()
+                logging.info(f"Finished: Index {bname}.")
+        flush()
+
+        np.save(path.join(self.index_dir, URI_OFFSETS), np.array(uri_offsets, np.int64))
+        np.save(path.join(self.index_dir, URI_HOSTS), np.array(uri_hosts, np.int32))
+        return runs, sorted(hosts, key=hosts.get)
+
+    @staticmethod
+    def _read_run(run: str) -> Iterator[Tuple[str, int, int]]:
+        with open(run, encoding="utf-8") as f:
+            for line in f:
+                token, uriid, position = line.split(DEL)
+                yield token, int(uriid), int(position)
+
+    def _merge_runs(self, runs: List[str], hosts: List[str]):
+        vocab = []
+        offsets = [0]
+        uriids, positions = [], []
+
+        with open(path.join(self.index_dir, POSTING_URIS), "wb") as uri_file, open(
+            path.join(self.index_dir, POSTING_POSITIONS), "wb"
+        ) as pos_file:
+
+            def write_posting_list():
+                u = np.array(uriids, np.int64)
+                p = np.array(positions, np.int64)
+                new_uri = np.diff(u, prepend=-1) != 0
+                d_pos = np.diff(p, prepend=0)
+                d_pos[new_uri] = p[new_uri]
+                np.diff(u, prepend=0).astype(POSTING_DTYPE).tofile(uri_file)
+                d_pos.astype(POSTING_DTYPE).tofile(pos_file)
+                offsets.append(offsets[-1] + len(u))
+                uriids.clear()
+                positions.clear()
+
+            for token, uriid, position in heapq.merge(*map(self._read_run, runs)):
+                if not vocab or vocab[-1] != token:
+                    if vocab:
+                        write_posting_list()
+                    vocab.append(token)
+                uriids.append(uriid)
+                positions.append(position)
+            if vocab:
+                write_posting_list()
+
+        vocab = [token.encode("utf-8") for token in vocab]
+        width = max(map(len, vocab), default=1)
+        np.save(path.join(self.index_dir, VOCAB), np.array(vocab, dtype=f"S{width}"))
+        np.save(path.join(self.index_dir, OFFSETS), np.array(offsets, np.int64))
+        write_json(
+            path.join(self.index_dir, META),
+            {
+                "tokens": len(vocab),
+                "postings": offsets[-1],
+                "hosts": hosts,
+                "version": time_ns(),
+            },
+        )
+        logging.info(f"Indexed {len(vocab)} tokens and {offsets[-1]} postings.")
+
+
+class PostingIndex:
+    """Read access to an index of PostingIndexBuilder, all arrays are memory-mapped."""
+
+    def __init__(self, index_dir: str = None) -> None:
+        self.index_dir = index_dir or Settings().POSTING_INDEX
+
+        def _load(filename):
+            return np.load(path.join(self.index_dir, filename), mmap_mode="r")
+
+        def _map(filename, dtype):
+            filename = path.join(self.index_dir, filename)
+            if path.getsize(filename) == 0:  # Empty files can not be mapped.
+                return np.zeros(0, dtype)
+            return np.memmap(filename, dtype=dtype, mode="r")
+
+        self.vocab = _load(VOCAB)
+        self.offsets = _load(OFFSETS)
+        self.posting_uris = _map(POSTING_URIS, POSTING_DTYPE)
+        self.posting_positions = _map(POSTING_POSITIONS, POSTING_DTYPE)
+        self.uris = _map(URIS, np.uint8)
+        self.uri_offsets = _load(URI_OFFSETS)
+        self.uri_hosts = _load(URI_HOSTS)
+        meta = read_json(path.join(self.index_dir, META))
+        self.hosts = meta["hosts"]
+        self.version = meta.get("version", 0)
+
+    def corpus_version(self) -> str:
+        """Identifies the index and its build (see PostgresDBSession.corpus_version)."""
+        return f"index://{path.abspath(self.index_dir)}@{self.version}"
+
+    def lookup(self, tokens: List[str]) -> Dict[str, Tuple[int, int]]:
+        """Binary search of tokens in the vocabulary.
+
+        Returns:
+            Dict[str, Tuple[int, int]]: token -> (tokenid, term_count) for all known tokens.
+        """
+        width = self.vocab.dtype.itemsize
+        encoded = [token.encode("utf-8") for token in tokens]
+        # Longer tokens would be truncated by the fixed width and can not be part of the vocabulary.
+        tokens = [t for t, e in zip(tokens, encoded) if len(e) <= width]
+        if not tokens or not len(self.vocab):
+            return {}
+        keys = np.array([t.encode("utf-8") for t in tokens], dtype=self.vocab.dtype)
+        indices = np.searchsorted(self.vocab, keys)
+        found = indices < len(self.vocab)
+        found[found] = self.vocab[indices[found]] == keys[found]
+        return {
+            token: (int(tokenid), self.term_count(tokenid))
+            for token, tokenid, f in zip(tokens, indices, found)
+            if f
+        }
+
+    def term_count(self, tokenid: int) -> int:
+        return int(self.offsets[tokenid + 1] - self.offsets[tokenid])
+
+    def postings(self, tokenid: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Decodes the posting list of a token.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: uriids and positions, ordered by (uriid, position).
+        """
+        start, end = self.offsets[tokenid], self.offsets[tokenid + 1]
+        d_uri = np.asarray(self.posting_uris[start:end], np.int64)
+        d_pos = np.asarray(self.posting_positions[start:end], np.int64)
+        uriids = np.cumsum(d_uri)
+        if not len(uriids):
+            return uriids, d_pos
+        new_uri = d_uri != 0
+        new_uri[0] = True
+        cum_pos = np.cumsum(d_pos)
+        starts = np.flatnonzero(new_uri)
+        # Positions restart with each uri, subtract the running sum at the start of each uri.
+        base = cum_pos[starts] - d_pos[starts]
+        lengths = np.diff(np.append(starts, len(d_pos)))
+        return uriids, cum_pos - np.repeat(base, lengths)
+
+    def uri(self, uriid: int) -> str:
+        start, end = self.uri_offsets[uriid], self.uri_offsets[uriid + 1]
+        return self.uris[start:end].tobytes().decode("utf-8")
+
+    def host_ids(self, hosts: Set[str]) -> np.ndarray:
+        return np.array([i for i, h in enumerate(self.hosts) if h in hosts], np.int32)
+
+
+class PostingIndexExecutor(QueryExecutor):
+    """Implements 'query_pairs' on top of a PostingIndex instead of a database.
+    For each pair, the uris that contain all of its tokens are found by intersecting
+    the tokens' posting lists, afterwards the usual window matching is applied.
+    """
+
+    def __init__(
+        self,
+        index_dir: str = None,
+        max_rel_tf: float = None,
+        max_uris_per_pair: int = 0,
+        max_uris: int = 0,
+        instrument: bool = False,
+    ) -> None:
+        self.index_dir = index_dir
+        super().__init__(
+            "index",
+            max_rel_tf=max_rel_tf,
+            max_uris_per_pair=max_uris_per_pair,
+            max_uris=max_uris,
+            instrument=instrument,
+        )
+
+    def open_session(self, session_type: str, num_workers: int):
+        self.index = PostingIndex(self.index_dir)
+
+    def corpus_version(self) -> str:
+        return self.index.corpus_version()
+
+    def update_token_dict(self, tokens: Set[str]) -> Set[str]:
+        tokens -= set(self.token_dict) | self.dropped_tokens
+        for token, (tokenid, cnt) in self.index.lookup(sorted(tokens)).items():
+            tokens.remove(token)
+            self.add_token(token, tokenid, cnt)
+        return tokens
+
+    def _candidates(self, tokenids: Set[int], host_ids: np.ndarray = None):
+        """Uris that contain all tokens, and the decoded postings of these tokens."""
+        postings = {t: self.index.postings(t) for t in tokenids}
+        candidates = None
+        for uriids, _ in postings.values():
+            uriids = np.unique(uriids)
+            candidates = (
+                uriids if candidates is None else np.intersect1d(candidates, uriids, True)
+            )
+        if host_ids is not None:
+            candidates = candidates[np.isin(self.index.uri_hosts[candidates], host_ids)]
+        return candidates, postings
+
+    def _partitions(self, pair_idx: int, tokenids: Set[int], host_ids: np.ndarray = None):
+        candidates, postings = self._candidates(tokenids, host_ids)
+        if not len(candidates):
+            return
+        t, u, p = [], [], []
+        for tokenid, (uriids, positions) in postings.items():
+            keep = np.isin(uriids, candidates)
+            t.append(np.full(np.count_nonzero(keep), tokenid, np.int64))
+            u.append(uriids[keep])
+            p.append(positions[keep])
+        t, u, p = np.concatenate(t), np.concatenate(u), np.concatenate(p)
+        order = np.lexsort((p, u))
+        t, u, p = t[order].tolist(), u[order], p[order].tolist()
+        bounds = np.flatnonzero(np.diff(u)) + 1
+        for start, end in zip(np.append(0, bounds), np.append(bounds, len(u))):
+            yield (int(u[start]), pair_idx), list(zip(t[start:end], p[start:end]))
+
+    def query_uriids(
+        self, pairs: List[Pair], masks: list, hosts: Set[str] = None, stats=None
+    ) -> Dict[int, List[Pair]]:
+        host_ids = None if hosts is None else self.index.host_ids(hosts)
+
+        def partitions():
+            for i, pair_masks in enumerate(masks):
+                tokenids = set(token for mask in pair_masks for token, _ in mask)
+                if tokenids:
+                    yield from self._partitions(i, tokenids, host_ids)
+
+        start = perf_counter()
+        batch_stats = None if stats is None else {"pairs": len(pairs)}
+        uriid_dict = self.match_partitions(partitions(), pairs, masks, batch_stats)
+        if stats is not None:
+            batch_stats["execution_time"] = perf_counter() - start
+            stats["batches"].append(batch_stats)
+        return uriid_dict
+
+    def resolve_uris(
+        self, uriid_dict: Dict[int, List[Pair]], session=None
+    ) -> Dict[str, List[Pair]]:
+        url_dict = defaultdict(list)
+        for uriid in sorted(uriid_dict):
+            uri_pairs = url_dict[self.index.uri(uriid)]
+            uri_pairs.extend(p for p in uriid_dict[uriid] if p not in uri_pairs)
+        return dict(url_dict)
+
+    def frequent_hosts(self, pairs: List[Pair], tau: int) -> Set[str]:
+        pairs = list(pairs)
+        tokens = set.union(*map(lambda x: x.tokens, pairs), set())
+        unknown_tokens = self.update_token_dict(tokens)
+        if unknown_tokens:
+            self.remove_unresolved_pairs(pairs, unknown_tokens)
+
+        host_counts = defaultdict(int)
+        for pair_masks in self.create_masks(pairs):
+            tokenids = set(token for mask in pair_masks for token, _ in mask)
+            if tokenids:
+                candidates, _ = self._candidates(tokenids)
+                for host_id in np.unique(self.index.uri_hosts[candidates]):
+                    host_counts[host_id] += 1
+        return set(self.index.hosts[h] for h, cnt in host_counts.items() if cnt >= tau)
@@ -1,6 +1,10 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import logging
-from typing import Dict, List, Set, Tuple
+from math import log
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlsplit
 
 from wpdxf.utils.settings import Settings
 from wpdxf.wrapping.objects.pairs import Example, Pair, Query
@@ -13,39 +17,135 @@ def _tuple_interval(t, named: bool = False) -> str:
         return ("%s, " * len(t))[:-2]
 
 
-__SESSION_TYPES__ = ("postgres",)  # ("postgres", "vertica") "vertica" deprecated
+# Maximal number of uriids resolved by a single statement.
+RESOLVE_CHUNK_SIZE = 10000
+
+__SESSION_TYPES__ = ("postgres", "sqlite")  # "vertica" deprecated
 
 
 class QueryExecutor:
-    def __init__(self, session_type="postgres", max_rel_tf: float = None) -> None:
+    def __init__(
+        self,
+        session_type="postgres",
+        max_rel_tf: float = None,
+        num_workers: int = 0,
+        batch_size: int = 1,
+        max_uris_per_pair: int = 0,
+        max_uris: int = 0,
+        instrument: bool = False,
+        explain: bool = False,
+        use_bigrams: bool = False,
+        parallel_workers: int = None,
+        shard: int = 0,
+    ) -> None:
+        """Resolves pairs into the uris that contain them, based on the corpus' token postings.
+
+        Args:
+            session_type (str, optional): One of __SESSION_TYPES__, "sqlite" uses the embedded 
+                database at SQLITE_DB (see SQLiteDBSession). Defaults to "postgres".
+            max_rel_tf (float, optional): Tokens with a higher relative term frequency are ignored. Defaults to 0.01.
+            num_workers (int, optional): If greater than 0, the posting queries are split into 
+                independent batches that run concurrently on a pool of 'num_workers' connections. 
+                Otherwise, a single statement is sent over a single connection. Defaults to 0.
+            batch_size (int, optional): Number of pairs per batch in concurrent mode. Defaults to 1.
+            max_uris_per_pair (int, optional): Maximal number of uris kept per pair by 'query_pairs', 
+                0 for no limit (see 'cap_pair_uris'). Defaults to 0.
+            max_uris (int, optional): Maximal number of uris of a collected result, 0 for no limit. 
+                Not applied by 'query_pairs', the collector caps its merged result (cached and queried 
+                pairs) once (see 'cap_uris'). Defaults to 0.
+            instrument (bool, optional): Record statistics (timings, rows, dropped tokens) for each call 
+                of 'query_pairs' and append them to the run's ReportWriter. Defaults to False.
+            explain (bool, optional): Additionally record the query plan of each posting query 
+                (see the session's 'explain'). On Postgres, this executes each query twice. 
+                Implies 'instrument'. Defaults to False.
+            use_bigrams (bool, optional): Restrict the posting query of each pair with adjacent tokens 
+                to the uris that contain its rarest adjacent token pair (see 'rarest_bigram'). 
+                Requires the bigram index of the session (see 'create_bigrams'), plain postings are 
+                queried while it is incomplete (see the session's 'bigrams_complete'). Defaults to False.
+            parallel_workers (int, optional): Postgres only, max_parallel_workers_per_gather of all connections, 
+                e.g. to scan the partitions of a partitioned 'token_uri_mapping' in parallel 
+                (see 'partition_postings'). Defaults to None (server setting).
+            shard (int, optional): Postgres only, the database to query if POSTGRES_CONFIG is a list of shards. 
+                See ShardedQueryExecutor to query all of them. Defaults to 0.
+        """
+        self.session = None
+        self.pool = None
+        self.parallel_workers = parallel_workers
+        self.shard = shard
+        self.open_session(session_type, num_workers)
+
+        self.max_abs_tf = Settings().MAX_CORPUS_FREQ
+        self.max_rel_tf = max_rel_tf or 0.01
+        self.num_workers = num_workers
+        self.batch_size = max(batch_size, 1)
+        self.max_uris_per_pair = max_uris_per_pair
+        self.max_uris = max_uris
+        self.explain = explain
+        self.instrument = instrument or explain
+        self.use_bigrams = use_bigrams
+
+        self.token_dict = {}
+        self.token_counts = {}
+        # Tokens known to the corpus, but ignored due to max_rel_tf
+        self.dropped_tokens = set()
+        # (first_tokenid, second_tokenid) -> number of occurrences in the corpus
+        self.bigram_counts = {}
+
+    def open_session(self, session_type: str, num_workers: int):
         assert session_type in __SESSION_TYPES__
         if session_type == "postgres":
-            from wpdxf.db.PostgresDBSession import PostgresDBSession
+            from wpdxf.db.PostgresDBSession import PostgresDBPool, PostgresDBSession
 
-            self.session = PostgresDBSession()
+            self.session = PostgresDBSession(
+                parallel_workers=self.parallel_workers, shard=self.shard
+            )
+            if num_workers > 0:
+                self.pool = PostgresDBPool(num_workers, self.parallel_workers, self.shard)
+        elif session_type == "sqlite":
+            from wpdxf.db.SQLiteDBSession import SQLiteDBPool, SQLiteDBSession
+
+            self.session = SQLiteDBSession()
+            if num_workers > 0:
+                self.pool = SQLiteDBPool(num_workers)
         # elif session_type == "vertica":
         #     from db.VerticaDBSession import VerticaDBSession
         #     session = VerticaDBSession()
 
-        self.max_abs_tf = Settings().MAX_CORPUS_FREQ
-        self.max_rel_tf = max_rel_tf or 0.01
+    def corpus_version(self) -> str:
+        """See the session's 'corpus_version'."""
+        return self.session.corpus_version()
 
-        self.token_dict = {}
+    def cache_namespace(self) -> str:
+        """Identifies the results of 'query_pairs': the corpus (and its version) and all parameters 
+        that change them. Cached results of another namespace are never used (see URLCache).
+        'max_uris' is not part of it, it does not change the result of any pair.
+        """
+        return (
+            f"{self.corpus_version()}?max_rel_tf={self.max_rel_tf}&max_abs_tf={self.max_abs_tf}"
+            f"&max_uris_per_pair={self.max_uris_per_pair}"
+        )
 
-    def update_token_dict(self, tokens: Set[str]) -> Set[str]:
-        def rel_tf(term_freq):
-            return term_freq / self.max_abs_tf
+    def add_token(self, token: str, tokenid: int, term_count: int, pruned: bool = False):
+        """Registers a token of the corpus, unless its relative term frequency exceeds max_rel_tf
+        or its postings were pruned (see the session's 'prune_postings'). Either way, the token is dropped,
+        results therefore do not depend on the threshold the corpus was pruned with.
+        """
+        if not pruned and term_count / self.max_abs_tf < self.max_rel_tf:
+            self.token_dict[token] = tokenid
+            self.token_counts[token] = term_count
+        else:
+            self.dropped_tokens.add(token)
 
-        tokens -= set(self.token_dict)
+    def update_token_dict(self, tokens: Set[str]) -> Set[str]:
+        tokens -= set(self.token_dict) | self.dropped_tokens
         if not tokens:
             return set()
         _interval = _tuple_interval(tokens)
-        stmt = f"SELECT token, tokenid, term_count FROM tokens WHERE token IN ({_interval}) GROUP BY tokenid, token"
+        stmt = f"SELECT token, tokenid, term_count, pruned FROM tokens WHERE token IN ({_interval})"
         with self.session.execute(stmt, tuple(tokens)) as cur:
-            for token, tokenid, cnt in cur:
+            for token, tokenid, cnt, pruned in cur:
                 tokens.remove(token)
-                if rel_tf(cnt) < self.max_rel_tf:
-                    self.token_dict[token] = tokenid
+                self.add_token(token, tokenid, cnt, bool(pruned))
         return tokens
 
     def remove_unresolved_pairs(self, pairs: List[Pair], unknown_tokens: Set[str]):
@@ -70,44 +170,187 @@ class QueryExecutor:
             masks.append(mask)
         return masks
 
-    def create_query(self, masks):
+    def _host_filter(self, hosts: Set[str]) -> Tuple[str, dict]:
+        host_dict = {f"host{i}": host for i, host in enumerate(sorted(hosts))}
+        stmt = f"AND uriid IN (SELECT uriid FROM uris WHERE netloc IN ({_tuple_interval(host_dict, True)}))"
+        return stmt, host_dict
+
+    @staticmethod
+    def mask_bigrams(pair_masks) -> Set[Tuple[int, int]]:
+        """Adjacent token pairs (tokens at consecutive positions) of a pair's masks."""
+        return set(
+            (first, second)
+            for mask in pair_masks
+            for (first, first_pos), (second, second_pos) in zip(mask, mask[1:])
+            if second_pos - first_pos == 1
+        )
+
+    def update_bigram_counts(self, masks: list):
+        if not self.session.bigrams_complete():
+            # Bigrams missing from an incomplete index might still occur, no pair is restricted.
+            logging.warning("The bigram index is incomplete (see 'create_bigrams'), it is not used.")
+            self.bigram_counts.clear()
+            return
+        bigrams = set.union(*map(self.mask_bigrams, masks), set())
+        bigrams -= set(self.bigram_counts)
+        if not bigrams:
+            return
+        _interval = ", ".join(["(%s, %s)"] * len(bigrams))
+        stmt = f"SELECT first_tokenid, second_tokenid, bigram_count FROM bigrams WHERE (first_tokenid, second_tokenid) IN ({_interval})"
+        # Bigrams that are not part of the index do not occur in the corpus.
+        self.bigram_counts.update(dict.fromkeys(bigrams, 0))
+        params = tuple(tokenid for bigram in bigrams for tokenid in bigram)
+        with self.session.execute(stmt, params) as cur:
+            for first, second, cnt in cur:
+                self.bigram_counts[(first, second)] = cnt
+
+    def rarest_bigram(self, pair_masks) -> Optional[Tuple[int, int]]:
+        """A uri can only match a pair if it contains every adjacent token pair of the pair's masks, 
+        the rarest one is the most selective filter.
+
+        Returns:
+            Optional[Tuple[int, int]]: The rarest (known) bigram or None, if the masks have no adjacent tokens.
+        """
+        bigrams = [b for b in self.mask_bigrams(pair_masks) if b in self.bigram_counts]
+        if not bigrams:
+            return None
+        return min(bigrams, key=lambda b: (self.bigram_counts[b], b))
+
+    def create_query(
+        self, masks, indices: Sequence[int] = None, hosts: Set[str] = None
+    ):
         token_pairs = []
         total_tokens = 0
-        for i, pair_masks in enumerate(masks):
+        if indices is None:
+            indices = range(len(masks))
+        bigram_dict = {}
+        for i in indices:
+            pair_masks = masks[i]
             pair_tokens = tuple(token for mask in pair_masks for token, _ in mask)
             total_tokens += len(pair_tokens)
-            if pair_tokens:
-                token_pairs.append((i, pair_tokens))
+            if not pair_tokens:
+                continue
+            bigram = self.rarest_bigram(pair_masks) if self.use_bigrams else None
+            if bigram is not None:
+                if self.bigram_counts[bigram] == 0:
+                    continue  # No uri contains the pair.
+                bigram_dict[f"b{i}_0"], bigram_dict[f"b{i}_1"] = bigram
+            token_pairs.append((i, pair_tokens))
+        host_stmt, host_dict = ("", {}) if hosts is None else self._host_filter(hosts)
+
+        def bigram_stmt(i):
+            if f"b{i}_0" not in bigram_dict:
+                return ""
+            return f"""
+    AND uriid IN (SELECT uriid FROM bigram_uri_mapping 
+        WHERE first_tokenid = %(b{i}_0)s AND second_tokenid = %(b{i}_1)s)"""
+
+        # Members are wrapped as subqueries (instead of parentheses), which keeps them ordered
+        # and is understood by Postgres and SQLite.
         stmt = " UNION ALL ".join(
             [
                 f"""\
-(SELECT tokenid, position, uri, {i}::integer FROM(
-    SELECT tokenid, position, uriid 
+SELECT * FROM (SELECT tokenid, position, uriid, {i} AS pair_idx
     FROM token_uri_mapping
-    WHERE tokenid IN ({_tuple_interval(tokens, True)})
-    ORDER BY uriid, position
-) S JOIN uris USING(uriid))"""
+    WHERE tokenid IN ({_tuple_interval(tokens, True)}) {host_stmt}{bigram_stmt(i)}
+    ORDER BY uriid, position) AS p{i}"""
                 for i, tokens in token_pairs
             ]
         )
         logging.info(stmt)
         logging.info(f"Total Tokens: {total_tokens}")
         stmt_dict = {str(token): token for _, tokens in token_pairs for token in tokens}
+        stmt_dict.update(host_dict)
+        stmt_dict.update(bigram_dict)
         return stmt, stmt_dict
 
+    def frequent_hosts(self, pairs: List[Pair], tau: int) -> Set[str]:
+        """Computes (inside the database) the hosts that might match at least 'tau' distinct pairs.
+        A uri can only match a pair if it contains all of the pair's (resolved) tokens, 
+        therefore the per-host counts are upper bounds of the counts after window matching 
+        and a host that misses 'tau' here will not reach it in URITree.reduce either.
+
+        Args:
+            pairs (List[Pair]): Usually the examples.
+            tau (int): Minimal number of distinct pairs per host.
+
+        Returns:
+            Set[str]: netlocs of all hosts that pass 'tau'.
+        """
+        pairs = list(pairs)
+        tokens = set.union(*map(lambda x: x.tokens, pairs), set())
+        unknown_tokens = self.update_token_dict(tokens)
+        if unknown_tokens:
+            self.remove_unresolved_pairs(pairs, unknown_tokens)
+
+        stmt, stmt_dict, num_pairs = self._pair_uriids_query(pairs)
+        if num_pairs < tau:
+            return set()
+        stmt = f"""\
+SELECT netloc FROM ({stmt}) P JOIN uris USING(uriid)
+GROUP BY netloc
+HAVING COUNT(DISTINCT pair_idx) >= %(tau)s"""
+        logging.info(stmt)
+        stmt_dict["tau"] = tau
+        with self.session.execute(stmt, stmt_dict) as cur:
+            return set(netloc for netloc, in cur)
+
+    def host_pairs(self, pairs: List[Pair]) -> Dict[str, Set[Pair]]:
+        """The pairs each host might match (see 'frequent_hosts'), for pairs with resolved tokens.
+
+        Returns:
+            Dict[str, Set[Pair]]: netloc -> pairs
+        """
+        stmt, stmt_dict, num_pairs = self._pair_uriids_query(pairs)
+        if not num_pairs:
+            return {}
+        stmt = f"SELECT DISTINCT netloc, pair_idx FROM ({stmt}) P JOIN uris USING(uriid)"
+        logging.info(stmt)
+        host_dict = defaultdict(set)
+        with self.session.execute(stmt, stmt_dict) as cur:
+            for netloc, pair_idx in cur:
+                host_dict[netloc].add(pairs[pair_idx])
+        return dict(host_dict)
+
+    def _pair_uriids_query(self, pairs: List[Pair]) -> Tuple[str, dict, int]:
+        """A statement selecting (uriid, pair_idx) of all uris that contain all (resolved) tokens of a pair.
+
+        Returns:
+            Tuple[str, dict, int]: The statement, its parameters and the number of pairs with resolved tokens.
+        """
+        token_pairs = []
+        for i, pair_masks in enumerate(self.create_masks(pairs)):
+            pair_tokens = set(token for mask in pair_masks for token, _ in mask)
+            if pair_tokens:
+                token_pairs.append((i, pair_tokens))
+
+        stmt = " UNION ALL ".join(
+            [
+                f"""\
+SELECT uriid, {i} AS pair_idx
+    FROM token_uri_mapping
+    WHERE tokenid IN ({_tuple_interval(tokens, True)})
+    GROUP BY uriid
+    HAVING COUNT(DISTINCT tokenid) = {len(tokens)}"""
+                for i, tokens in token_pairs
+            ]
+        )
+        stmt_dict = {str(token): token for _, tokens in token_pairs for token in tokens}
+        return stmt, stmt_dict, len(token_pairs)
+
     def yield_partition(self, cursor):
-        key = None
+        """Groups the (sorted) rows of a posting query into (key, [(tokenid, position), ...]) partitions.
+        A result without rows (e.g. a pooled batch whose pairs match no uri) yields nothing.
+        """
+        key, partition = None, []
         for tokenid, position, *_key in cursor:
-            if key is None:  # Initial value
-                key = _key
-                partition = [(tokenid, position)]
-            elif key != _key:  # New partition
+            if key is not None and key != _key:  # New partition
                 yield key, partition
-                key = _key
-                partition = [(tokenid, position)]
-            else:  # Same partition
-                partition.append((tokenid, position))
-        yield key, partition
+                partition = []
+            key = _key
+            partition.append((tokenid, position))
+        if partition:  # Skip empty results
+            yield key, partition
 
     def drop_offset(self, window: List[Tuple[int, int]]):
         if not window:
@@ -115,50 +358,360 @@ class QueryExecutor:
         offset = window[0][1]
         return tuple((tok, pos - offset) for tok, pos in window)
 
+    def explain_query(self, stmt: str, stmt_dict: dict, session=None) -> dict:
+        """Explains the statement, the details depend on the session type (see 'explain' of each session).
+
+        Returns:
+            dict: At least the query plan ("plan"), Postgres adds planning and execution time (ms).
+        """
+        session = session or self.session
+        return session.explain(stmt, stmt_dict)
+
     def filter_query_result(
-        self, stmt: str, stmt_dict: dict, pairs: List[Pair], masks: list
-    ) -> Dict[str, List[Pair]]:
+        self,
+        stmt: str,
+        stmt_dict: dict,
+        pairs: List[Pair],
+        masks: list,
+        session=None,
+        stats: dict = None,
+    ) -> Dict[int, List[Pair]]:
+        """Executes the posting query and matches the pairs' masks against each (uriid, pair) partition.
+        Matching is based on the integer uriids, uri strings are resolved afterwards (see 'resolve_uris').
+
+        Args:
+            stats (dict, optional): If given, it is updated with the query's instrumentation 
+                (see 'instrument'). Defaults to None.
+
+        Returns:
+            Dict[int, List[Pair]]: uriid -> matched pairs
+        """
+        session = session or self.session
+        if stats is not None and self.explain:
+            stats.update(self.explain_query(stmt, stmt_dict, session))
+
+        start = perf_counter()
+        with session.execute(stmt, stmt_dict) as cur:
+            execution_time = perf_counter() - start
+            # print(cur.query.decode())
+            uriid_dict = self.match_partitions(
+                self.yield_partition(cur), pairs, masks, stats
+            )
+
+        if stats is not None:
+            stats.update(
+                execution_time=execution_time,
+                filter_time=perf_counter() - start - execution_time,
+            )
+        return uriid_dict
+
+    def match_partition(
+        self, partition: List[Tuple[int, int]], pair: Pair, pair_masks: tuple
+    ) -> bool:
+        """Slides a window over the position ordered postings (tokenid, position) of a single uri
+        and checks whether they contain the pair, i.e. its input mask and (for examples) its output mask.
+        """
+
         def contains_pair(matches, pair) -> bool:
             return len(matches) == 1 and isinstance(pair, Query) or len(matches) == 2
 
+        matches = set()
+        pair_masks = tuple(enumerate(pair_masks))
+        max_size = max(len(mask) for _, mask in pair_masks)
+        min_size = min(len(mask) for _, mask in pair_masks)
+
+        for i in range(len(partition) - min_size + 1):
+            window = partition[i : i + max_size]
+            if not window:
+                continue
+            window = self.drop_offset(window)
+            for mask_idx, mask in pair_masks:
+                if window[: len(mask)] == mask:
+                    matches.add(mask_idx)
+            if contains_pair(matches, pair):
+                return True
+        return False
+
+    def match_partitions(
+        self, partitions, pairs: List[Pair], masks: list, stats: dict = None
+    ) -> Dict[int, List[Pair]]:
+        """Matches the pairs' masks against each ((uriid, pair_idx), partition), see 'match_partition'.
+
+        Returns:
+            Dict[int, List[Pair]]: uriid -> matched pairs
+        """
+        rows, discarded_rows, num_partitions = 0, 0, 0
+        uriid_dict = defaultdict(list)
+        for (uriid, pair_idx), partition in partitions:
+            rows += len(partition)
+            num_partitions += 1
+            pair = pairs[pair_idx]
+            if self.match_partition(partition, pair, masks[pair_idx]):
+                uriid_dict[uriid].append(pair)
+            else:
+                discarded_rows += len(partition)
+
+        if stats is not None:
+            stats.update(
+                rows=rows,
+                discarded_rows=discarded_rows,
+                partitions=num_partitions,
+                matched_partitions=sum(map(len, uriid_dict.values())),
+            )
+        return dict(uriid_dict)
+
+    def resolve_uris(
+        self, uriid_dict: Dict[int, List[Pair]], session=None
+    ) -> Dict[str, List[Pair]]:
+        """Replaces the uriids of the (already filtered) query result with their uri strings.
+        Only uriids that survived the window matching are looked up.
+
+        Args:
+            uriid_dict (Dict[int, List[Pair]]): uriid -> matched pairs
+
+        Returns:
+            Dict[str, List[Pair]]: uri -> matched pairs
+        """
+        session = session or self.session
         url_dict = defaultdict(list)
-        with self.session.execute(stmt, stmt_dict) as cur:
-            # print(cur.query.decode())
-            for (url, pair_idx), partition in self.yield_partition(cur):
-                matches = set()
-                pair = pairs[pair_idx]
-
-                pair_masks = tuple(enumerate(masks[pair_idx]))
-                max_size = max(len(mask) for _, mask in pair_masks)
-                min_size = min(len(mask) for _, mask in pair_masks)
-
-                for i in range(len(partition) - min_size + 1):
-                    window = partition[i : i + max_size]
-                    if not window:
-                        continue
-                    window = self.drop_offset(window)
-                    for mask_idx, mask in pair_masks:
-                        if window[: len(mask)] == mask:
-                            matches.add(mask_idx)
-                    if contains_pair(matches, pair):
-                        url_dict[url].append(pair)
-                        break
+        uriids = list(uriid_dict)
+        for i in range(0, len(uriids), RESOLVE_CHUNK_SIZE):
+            chunk = uriids[i : i + RESOLVE_CHUNK_SIZE]
+            stmt = f"SELECT uriid, uri FROM uris WHERE uriid IN ({_tuple_interval(chunk)})"
+            with session.execute(stmt, tuple(chunk)) as cur:
+                for uriid, uri in cur:
+                    # Distinct uriids might share the same uri (e.g. crawled in multiple archives).
+                    uri_pairs = url_dict[uri]
+                    uri_pairs.extend(p for p in uriid_dict[uriid] if p not in uri_pairs)
         return dict(url_dict)
 
-    def query_pairs(self, pairs: List[Pair]) -> Dict[str, List[Pair]]:
+    def query_pairs(
+        self, pairs: List[Pair], hosts: Set[str] = None
+    ) -> Dict[str, List[Pair]]:
+        """Collects all uris that match any of the given pairs.
+
+        Args:
+            pairs (List[Pair]): Examples and/or queries. Pairs with unknown tokens are removed.
+            hosts (Set[str], optional): If given, only uris of these hosts (netlocs) are considered. 
+                Defaults to None.
+
+        Returns:
+            Dict[str, List[Pair]]: uri -> matched pairs
+        """
+        if hosts is not None and not hosts:
+            return {}
+
+        start = perf_counter()
         tokens = set.union(*map(lambda x: x.tokens, pairs), set())
-        unknown_tokens = self.update_token_dict(tokens)
+        stats = {"pairs": len(pairs), "tokens": len(tokens)} if self.instrument else None
+        unknown_tokens = self.update_token_dict(set(tokens))
 
         if unknown_tokens:
             self.remove_unresolved_pairs(pairs, unknown_tokens)
 
+        if stats is not None:
+            stats.update(
+                unknown_tokens=sorted(unknown_tokens),
+                dropped_tokens=sorted(tokens & self.dropped_tokens),
+                resolved_pairs=len(pairs),
+                hosts=None if hosts is None else len(hosts),
+                batches=[],
+            )
+
         if not pairs:
+            self.write_stats(stats, start)
             return {}
 
+        url_dict = self.query_resolved(pairs, hosts, stats)
+        if self.max_uris_per_pair > 0:
+            url_dict = self.cap_pair_uris(url_dict)
+        self.write_stats(stats, start)
+        return url_dict
+
+    def query_resolved(
+        self, pairs: List[Pair], hosts: Set[str] = None, stats=None
+    ) -> Dict[str, List[Pair]]:
+        """Queries and resolves the uris of pairs whose tokens are resolved (see 'update_token_dict').
+
+        Returns:
+            Dict[str, List[Pair]]: uri -> matched pairs
+        """
         masks = self.create_masks(pairs)
+        if self.use_bigrams:
+            self.update_bigram_counts(masks)
+        uriid_dict = self.query_uriids(pairs, masks, hosts, stats)
+
+        resolve_start = perf_counter()
+        url_dict = self.resolve_uris(uriid_dict)
+        if stats is not None:
+            stats.update(
+                resolve_time=perf_counter() - resolve_start,
+                uriids=len(uriid_dict),
+                uris=len(url_dict),
+            )
+        return url_dict
 
-        stmt, stmt_dict = self.create_query(masks)
+    def query_uriids(
+        self, pairs: List[Pair], masks: list, hosts: Set[str] = None, stats=None
+    ) -> Dict[int, List[Pair]]:
+        """Runs the posting queries of all pairs, concurrently if a pool is available (see 'query_pooled').
+
+        Returns:
+            Dict[int, List[Pair]]: uriid -> matched pairs
+        """
+        if self.pool is not None:
+            return self.query_pooled(pairs, masks, hosts, stats)
+
+        stmt, stmt_dict = self.create_query(masks, hosts=hosts)
         if not stmt:
             return {}
+        batch_stats = None if stats is None else {"pairs": len(pairs)}
+        uriid_dict = self.filter_query_result(
+            stmt, stmt_dict, pairs, masks, stats=batch_stats
+        )
+        if stats is not None:
+            stats["batches"].append(batch_stats)
+        return uriid_dict
+
+    def write_stats(self, stats: dict, start: float):
+        if stats is None:
+            return
+        from wpdxf.utils.report import ReportWriter
+
+        stats["total_time"] = perf_counter() - start
+        batches = stats.get("batches", [])
+        for key in ("rows", "discarded_rows"):
+            stats[key] = sum(batch.get(key, 0) for batch in batches)
+        ReportWriter().append_query_stats(stats)
+
+    def pair_weight(self, pair: Pair) -> float:
+        """The rarity of a pair, i.e. the sum of the idf of its resolved tokens."""
+        return sum(
+            log(self.max_abs_tf / max(self.token_counts[token], 1))
+            for token in pair.tokens
+            if token in self.token_counts
+        )
+
+    def rank_uris(self, url_dict: Dict[str, List[Pair]]) -> List[str]:
+        """Ranks the uris of a query result from most to least promising, based on:
+        1) The number of distinct pairs matched by the uri's host.
+        2) The number of distinct pairs matched by the uri itself.
+        3) The rarity of the matched pairs' tokens (see 'pair_weight').
+        The uri itself is used as tie-breaker to keep the ranking deterministic.
+
+        Args:
+            url_dict (Dict[str, List[Pair]]): uri -> matched pairs
+
+        Returns:
+            List[str]: All uris of url_dict, best first.
+        """
+        host_pairs = defaultdict(set)
+        for uri, uri_pairs in url_dict.items():
+            host_pairs[urlsplit(uri).netloc].update(uri_pairs)
+
+        weights = {}
+
+        def _key(uri):
+            uri_pairs = set(url_dict[uri])
+            weight = 0
+            for pair in uri_pairs:
+                if pair not in weights:
+                    weights[pair] = self.pair_weight(pair)
+                weight += weights[pair]
+            host = len(host_pairs[urlsplit(uri).netloc])
+            return (-host, -len(uri_pairs), -weight, uri)
+
+        return sorted(url_dict, key=_key)
+
+    def cap_pair_uris(self, url_dict: Dict[str, List[Pair]]) -> Dict[str, List[Pair]]:
+        """Keeps at most 'max_uris_per_pair' uris for each pair of a query result.
+        The uris of a pair are ranked on their own, independent of the other pairs of the batch
+        (the result of a pair is cached): uris of hosts with more uris of the pair first,
+        the uri itself is used as tie-breaker.
+
+        Args:
+            url_dict (Dict[str, List[Pair]]): uri -> matched pairs
+
+        Returns:
+            Dict[str, List[Pair]]: The capped url_dict.
+        """
+        pair_uris = defaultdict(list)
+        for uri, uri_pairs in url_dict.items():
+            for pair in uri_pairs:
+                pair_uris[pair].append(uri)
+
+        kept = set()
+        for pair, uris in pair_uris.items():
+            if len(uris) > self.max_uris_per_pair:
+                host_counts = Counter(urlsplit(uri).netloc for uri in uris)
+                uris = sorted(uris, key=lambda uri: (-host_counts[urlsplit(uri).netloc], uri))
+                uris = uris[: self.max_uris_per_pair]
+            kept.update((pair, uri) for uri in uris)
+
+        result = {}
+        for uri, uri_pairs in url_dict.items():
+            uri_pairs = [pair for pair in uri_pairs if (pair, uri) in kept]
+            if uri_pairs:
+                result[uri] = uri_pairs
+        if len(result) < len(url_dict):
+            logging.info(f"Capped query result from {len(url_dict)} to {len(result)} uris (per pair).")
+        return result
+
+    def cap_uris(self, url_dict: Dict[str, Set[Pair]]) -> Dict[str, Set[Pair]]:
+        """Keeps the 'max_uris' best ranked uris (see 'rank_uris') of a collected result.
+        Applied once to the merged result of all pairs (see ResourceCollector.collect_pairs).
+
+        Args:
+            url_dict (Dict[str, Set[Pair]]): uri -> matched pairs
+
+        Returns:
+            Dict[str, Set[Pair]]: The capped url_dict.
+        """
+        if self.max_uris <= 0 or len(url_dict) <= self.max_uris:
+            return url_dict
+        ranking = self.rank_uris(url_dict)
+        logging.info(f"Capped query result from {len(url_dict)} to {self.max_uris} uris.")
+        return {uri: url_dict[uri] for uri in ranking[: self.max_uris]}
+
+    def query_pooled(
+        self, pairs: List[Pair], masks: list, hosts: Set[str] = None, stats=None
+    ) -> Dict[int, List[Pair]]:
+        """The posting query of a pair does not depend on any other pair.
+        Therefore, pairs are split into batches of 'batch_size' pairs, 
+        each batch is queried (and filtered) on its own pooled connection 
+        and the resulting uriid_dicts are merged afterwards.
+
+        Args:
+            pairs (List[Pair]): Pairs with resolved tokens.
+            masks (list): The pairs' masks, as created by 'create_masks'.
+            hosts (Set[str], optional): See 'query_pairs'.
+            stats (dict, optional): If given, the instrumentation of each batch is appended to stats["batches"].
+
+        Returns:
+            Dict[int, List[Pair]]: uriid -> matched pairs, equal to the non-concurrent result.
+        """
+
+        def _query_batch(indices):
+            stmt, stmt_dict = self.create_query(masks, indices, hosts)
+            if not stmt:
+                return {}
+            batch_stats = None if stats is None else {"pairs": len(indices)}
+            with self.pool.session() as session:
+                result = self.filter_query_result(
+                    stmt, stmt_dict, pairs, masks, session, batch_stats
+                )
+            if batch_stats is not None:
+                stats["batches"].append(batch_stats)
+            return result
+
+        batches = [
+            range(i, min(i + self.batch_size, len(pairs)))
+            for i in range(0, len(pairs), self.batch_size)
+        ]
 
-        return self.filter_query_result(stmt, stmt_dict, pairs, masks)
+        uriid_dict = defaultdict(list)
+        with ThreadPoolExecutor(self.num_workers) as executor:
+            for batch_result in executor.map(_query_batch, batches):
+                for uriid, uriid_pairs in batch_result.items():
+                    uriid_dict[uriid].extend(uriid_pairs)
+        return dict(uriid_dict)
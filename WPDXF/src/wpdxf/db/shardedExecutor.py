@@ -0,0 +1,163 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Callable, Dict, List, Set
+
+from wpdxf.db.queryGenerator import QueryExecutor
+from wpdxf.wrapping.objects.pairs import Pair
+
+
+class ShardedQueryExecutor(QueryExecutor):
+    """Implements 'query_pairs' on top of several corpus shards, each holding a subset of the archives
+    (see PostgresDBSession(shard=...)). Each shard is queried by its own QueryExecutor,
+    all shards are queried concurrently and their results are merged (scatter-gather).
+
+    Token ids are local to a shard, term counts are summed over all shards.
+    Therefore, tokens are dropped (see 'max_rel_tf') based on their frequency in the whole corpus.
+    """
+
+    def __init__(
+        self,
+        shards: List[QueryExecutor] = None,
+        session_type: str = "postgres",
+        max_rel_tf: float = None,
+        max_uris_per_pair: int = 0,
+        max_uris: int = 0,
+        instrument: bool = False,
+        explain: bool = False,
+        **kwargs,
+    ) -> None:
+        """
+        Args:
+            shards (List[QueryExecutor], optional): The executors of all shards, their max_rel_tf is ignored.
+                Defaults to None, a QueryExecutor for each database in POSTGRES_CONFIG.
+            explain (bool, optional): Record the query plan of each posting query of each shard
+                (see QueryExecutor). Implies 'instrument'. Defaults to False.
+            kwargs: Passed to the QueryExecutor of each shard (if shards is None),
+                e.g. num_workers, use_bigrams or parallel_workers.
+        """
+        self.shards = shards
+        self.shard_kwargs = kwargs
+        # Read by 'open_session', before QueryExecutor.__init__ sets it.
+        self.explain = explain
+        super().__init__(
+            session_type,
+            max_rel_tf=max_rel_tf,
+            max_uris_per_pair=max_uris_per_pair,
+            max_uris=max_uris,
+            instrument=instrument,
+            explain=explain,
+        )
+
+    def open_session(self, session_type: str, num_workers: int):
+        if self.shards is None:
+            from wpdxf.db.PostgresDBSession import POSTGRES_SHARDS
+
+            self.shards = [
+                QueryExecutor(session_type, shard=i, explain=self.explain, **self.shard_kwargs)
+                for i in range(len(POSTGRES_SHARDS))
+            ]
+        for shard in self.shards:
+            # Tokens are only dropped globally (see 'update_token_dict').
+            shard.max_rel_tf = float("inf")
+            shard.explain = shard.explain or self.explain
+            shard.instrument = shard.instrument or shard.explain
+
+    def corpus_version(self) -> str:
+        return ",".join(self.map_shards(lambda shard: shard.corpus_version()))
+
+    def map_shards(self, func: Callable[[QueryExecutor], object]) -> list:
+        """Applies 'func' to each shard concurrently.
+
+        Returns:
+            list: The results, in the order of 'shards'.
+        """
+        with ThreadPoolExecutor(len(self.shards)) as executor:
+            return list(executor.map(func, self.shards))
+
+    def update_token_dict(self, tokens: Set[str]) -> Set[str]:
+        tokens -= set(self.token_dict) | self.dropped_tokens
+        if not tokens:
+            return set()
+        self.map_shards(lambda shard: shard.update_token_dict(set(tokens)))
+
+        for token in sorted(tokens):
+            if any(token in shard.dropped_tokens for shard in self.shards):
+                # The postings of the token were pruned in a shard (their max_rel_tf is infinite),
+                # its results would be incomplete, it is dropped in all shards.
+                tokens.remove(token)
+                self.dropped_tokens.add(token)
+                for shard in self.shards:
+                    if shard.token_dict.pop(token, None) is not None:
+                        shard.dropped_tokens.add(token)
+                continue
+            tokenids = tuple(shard.token_dict.get(token) for shard in self.shards)
+            if all(tokenid is None for tokenid in tokenids):
+                continue
+            tokens.remove(token)
+            term_count = sum(shard.token_counts.get(token, 0) for shard in self.shards)
+            self.add_token(token, tokenids, term_count)
+            if token in self.dropped_tokens:
+                for shard in self.shards:
+                    if shard.token_dict.pop(token, None) is not None:
+                        shard.dropped_tokens.add(token)
+        return tokens
+
+    def shard_pairs(self, shard: QueryExecutor, pairs: List[Pair]) -> List[Pair]:
+        """The pairs that might occur in a shard, i.e. it contains all of their (not dropped) tokens."""
+        return [
+            pair
+            for pair in pairs
+            if all(
+                token in shard.token_dict
+                for token in pair.tokens
+                if token in self.token_dict
+            )
+        ]
+
+    def query_resolved(
+        self, pairs: List[Pair], hosts: Set[str] = None, stats=None
+    ) -> Dict[str, List[Pair]]:
+        def _query_shard(shard):
+            shard_pairs = self.shard_pairs(shard, pairs)
+            if not shard_pairs:
+                return {}, None
+            shard_stats = None if stats is None else {"batches": []}
+            return shard.query_resolved(shard_pairs, hosts, shard_stats), shard_stats
+
+        start = perf_counter()
+        url_dict = defaultdict(list)
+        uriids = 0
+        for i, (shard_dict, shard_stats) in enumerate(self.map_shards(_query_shard)):
+            # The same uri might be stored by multiple shards (from different archives).
+            for uri, uri_pairs in shard_dict.items():
+                url_pairs = url_dict[uri]
+                url_pairs.extend(p for p in uri_pairs if p not in url_pairs)
+            if shard_stats is not None:
+                uriids += shard_stats.get("uriids", 0)
+                for batch in shard_stats["batches"]:
+                    stats["batches"].append(dict(batch, shard=i))
+
+        if stats is not None:
+            stats.update(
+                shards_time=perf_counter() - start, uriids=uriids, uris=len(url_dict)
+            )
+        return dict(url_dict)
+
+    def frequent_hosts(self, pairs: List[Pair], tau: int) -> Set[str]:
+        pairs = list(pairs)
+        tokens = set.union(*map(lambda x: x.tokens, pairs), set())
+        unknown_tokens = self.update_token_dict(tokens)
+        if unknown_tokens:
+            self.remove_unresolved_pairs(pairs, unknown_tokens)
+        if len(pairs) < tau:
+            return set()
+
+        # A host might be stored by multiple shards, its pairs are merged before applying tau.
+        host_dict = defaultdict(set)
+        for shard_hosts in self.map_shards(
+            lambda shard: shard.host_pairs(self.shard_pairs(shard, pairs))
+        ):
+            for netloc, host_pairs in shard_hosts.items():
+                host_dict[netloc].update(host_pairs)
+        return set(netloc for netloc, host_pairs in host_dict.items() if len(host_pairs) >= tau)
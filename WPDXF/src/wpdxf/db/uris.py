@@ -0,0 +1,36 @@
+import re
+
+# scheme://host(:port)path(?query)#fragment
+URI_PATTERN = r"^[A-Za-z][A-Za-z0-9+.-]*://([^/?#]*)([^?#]*)(\?[^#]*)?"
+DEFAULT_PORT_PATTERN = r":(80|443)$"
+
+_uri_pattern = re.compile(URI_PATTERN)
+_default_port_pattern = re.compile(DEFAULT_PORT_PATTERN)
+
+# Postgres version of 'normalize_uri', created by PostgresDBSession.create_schema.
+URI_KEY_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION uri_key(uri VARCHAR) RETURNS VARCHAR AS $$
+    SELECT CASE WHEN m IS NULL THEN uri ELSE
+        regexp_replace(lower(m[1]), '{DEFAULT_PORT_PATTERN}', '')
+        || regexp_replace(m[2], '/+$', '')
+        || coalesce(m[3], '')
+    END
+    FROM regexp_match(uri, '{URI_PATTERN}') AS m
+$$ LANGUAGE SQL IMMUTABLE STRICT
+"""
+
+
+def normalize_uri(uri: str) -> str:
+    """The key under which a uri is stored (once) in the corpus.
+    Variants of the same document share a key: the scheme (http/https), default ports,
+    the case of the host, trailing slashes and the fragment are ignored.
+
+    Example:
+        "HTTPS://www.Ex.com:443/a/b/?q=1#top" -> "www.ex.com/a/b?q=1"
+    """
+    m = _uri_pattern.match(uri)
+    if m is None:
+        return uri
+    host, path, query = m.groups()
+    host = _default_port_pattern.sub("", host.lower())
+    return host + path.rstrip("/") + (query or "")
@@ -1,3 +1,4 @@
+import json
 import logging
 from difflib import SequenceMatcher
 from os import makedirs
@@ -41,6 +42,7 @@ class ReportWriter(metaclass=Singleton):
         self.rootdir = self.make_rootdir(dirname)
         self.logfile = join(self.rootdir, "logfile.log")
         self.logger = replace_filehandler(self.logfile)
+        self.query_stats_file = None
 
     def __enter__(self):
         return self
@@ -154,6 +156,16 @@ class ReportWriter(metaclass=Singleton):
             for key, values in table.items():
                 f.write(f"{key}: {values}\n")
 
+    def append_query_stats(self, stats: dict):
+        """Appends the instrumentation of a single DB request (see QueryExecutor) 
+        as a JSON line to 'queries.jsonl'. The file is linked in 'report.txt' on first use.
+        """
+        if self.query_stats_file is None:
+            self.query_stats_file = join(self.rootdir, "queries.jsonl")
+            self.append_kwargs_info("Query Statistics", file=self.query_stats_file)
+        with open(self.query_stats_file, "a+") as f:
+            f.write(json.dumps(stats, default=str) + "\n")
+
     def append_em_scores(self, iteration, answer_scores, table_scores, delta):
         with open(join(self.rootdir, "em.txt"), "a+") as f:
             f.write(
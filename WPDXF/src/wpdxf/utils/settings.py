@@ -18,6 +18,9 @@ class Settings:
             "TERM_STORE",
             "MAP_STORE",
             "URL_CACHE",
+            "SQLITE_DB",
+            "POSTING_INDEX",
+            "CDX_INDEX",
             "ERROR_PATH",
             "LOG_PATH",
         ]
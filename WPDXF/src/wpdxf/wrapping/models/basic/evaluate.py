@@ -115,7 +115,7 @@ class BasicEvaluator:
     def _evaluate_initial(
         self, wp: WebPage, pairs: List[Pair]
     ) -> Dict[Pair, List[etree._Element]]:
-        tree = etree.HTML(wp.html)
+        tree = wp.tree()
         return {
             pair: xpath(self.input_xpath, {}, tree, term=regex.escape(pair.inp))
             for pair in pairs
@@ -3,6 +3,9 @@ from traceback import format_exc
 from typing import Dict, Iterable, List, Set, Tuple
 
 from lxml import etree
+from wpdxf.corpus.retrieval.warc.fetch import MAX_GAP
+from wpdxf.corpus.retrieval.warc.prefetch import HTMLPrefetcher
+from wpdxf.corpus.retrieval.warc.warcrecord import get_htmls
 from wpdxf.wrapping.objects.pairs import Pair
 from wpdxf.wrapping.objects.webpage import WebPage
 
@@ -16,6 +19,24 @@ class Resource:
         self._xpath: str = None
         self._vars: Dict[str, str] = {}
 
+    def fetch_html(self, prefetcher: HTMLPrefetcher = None, max_gap: int = MAX_GAP):
+        """Retrieves the html of all webpages at once (see get_htmls), 
+        instead of one request per webpage when its html is accessed first.
+        If a prefetcher is given, the webpages might have been retrieved in the background already.
+        The cleaned trees of webpages retrieved by this call are handed to the webpages (see WebPage.tree)."""
+        webpages = [wp for wp in self.webpages if wp._html is None]
+        if not webpages:
+            return
+        uris = [wp.uri for wp in webpages]
+        trees = {}
+        if prefetcher:
+            htmls = prefetcher.get_htmls(uris, trees)
+        else:
+            htmls = get_htmls(uris, max_gap, trees)
+        for wp in webpages:
+            wp._html = htmls[wp.uri]
+            wp._tree = trees.get(wp.uri)
+
     def remove_webpage(self, wp):
         self.webpages.remove(wp)
 
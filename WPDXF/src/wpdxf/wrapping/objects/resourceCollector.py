@@ -1,140 +1,155 @@
-import os
+import logging
 from collections import defaultdict
-from hashlib import sha1
+from heapq import heappush, heapreplace
 from typing import Dict, List, Set, Tuple
 
 from wpdxf.db.queryGenerator import QueryExecutor
 from wpdxf.utils.report import ReportWriter
-from wpdxf.utils.settings import Settings
-from wpdxf.utils.utils import compress_file, decompress_file
-from wpdxf.wrapping.objects.pairs import Example, Pair, Query
-from wpdxf.wrapping.objects.uritree import URITree
-
-
-def pair_to_cache_key(p: Pair):
-    k0, k1 = (p.inp, "") if isinstance(p, Query) else p.pair
-    return f"{sha1(k0.encode()).hexdigest()}_{sha1(k1.encode()).hexdigest()}"
-
-
-def cache_key_to_pair(k: Tuple[str, str]):
-    return Query(*k) if k[1] == "" else Example(*k)
+from wpdxf.wrapping.objects.pairs import Pair
+from wpdxf.wrapping.objects.uritree import URITree, popcount
+from wpdxf.wrapping.objects.urlCache import URLCache
 
 
 class ResourceCollector:
-    def __init__(self, query_executor, tau=2, limit=100) -> None:
+    def __init__(
+        self, query_executor, tau=2, limit=100, prefilter_hosts=False, cache: URLCache = None
+    ) -> None:
+        """Collects the uris matched by examples and queries and groups them into resources.
+
+        Args:
+            query_executor (QueryExecutor): Executor used to query uncached pairs.
+            tau (int, optional): Minimal number of distinct examples per resource. Defaults to 2.
+            limit (int, optional): Maximal number of resources (groups), 0 for no limit. Defaults to 100.
+            prefilter_hosts (bool, optional): If set, the hosts that match at least 'tau' examples are 
+                determined inside the DB first and uris are only retrieved for these hosts. 
+                Host-restricted results are not written to the cache. Defaults to False.
+            cache (URLCache, optional): Cache of the uris per pair. Defaults to None (an unbounded URLCache).
+        """
         self.query_executor: QueryExecutor = query_executor
         self.tau = tau
         self.limit = limit
+        self.prefilter_hosts = prefilter_hosts
 
-        self.cache_path = Settings().URL_CACHE
-        _, _, values_in_cache = next(os.walk(self.cache_path), (None, None, set()))
-        self.values_in_cache = set(values_in_cache)
+        self.cache = cache or URLCache()
+        self.namespace = None
 
     def collect(self, examples, queries):
-        def _collect(pairs):
-            cached_pairs = [
-                p for p in pairs if pair_to_cache_key(p) in self.values_in_cache
-            ]
-            unseen_pairs = [p for p in pairs if p not in cached_pairs]
-
-            url_dict = defaultdict(lambda: set())
-            self.collect_from_corpus(unseen_pairs, url_dict)
-            self.store_to_cache(url_dict)
-            self.collect_from_cache(cached_pairs, url_dict)
-            return url_dict
-
         rw = ReportWriter()
+        # Cached results of another corpus version or other query parameters are not used.
+        self.namespace = self.query_executor.cache_namespace()
         uritree = URITree()
 
-        url_dict = _collect(examples)
+        hosts = None
+        if self.prefilter_hosts:
+            with rw.start_timer("DB Host Prefilter"):
+                hosts = self.query_executor.frequent_hosts(examples, self.tau)
+
+        url_dict = self.collect_pairs(examples, hosts)
         for uri, examples in url_dict.items():
             if examples:
                 uritree.add_uri(uri, examples, {})
 
         uritree.reduce(self.tau)
 
-        url_dict = _collect(queries)
+        if self.prefilter_hosts:
+            # Queries are only added to existing hosts (allow_new=False).
+            hosts = set(uritree.root_nodes)
+        url_dict = self.collect_pairs(queries, hosts)
         for uri, queries in url_dict.items():
             uritree.add_uri(uri, {}, queries, allow_new=False)
 
         rw.write_query_result(uritree.to_dict())
+        logging.info(f"URL cache: {self.cache.stats()}")
 
         groups = self.group_uritree(uritree)
         rw.write_uri_groups(groups)
 
         return groups
 
+    def collect_pairs(self, pairs: List[Pair], hosts: Set[str] = None) -> Dict[str, Set[Pair]]:
+        """The uris matched by 'pairs', taken from the cache or (for uncached pairs) queried from the corpus.
+        The result is capped to the executor's 'max_uris' best uris (see QueryExecutor.cap_uris).
+
+        Args:
+            pairs (List[Pair]): Examples or queries.
+            hosts (Set[str], optional): If set, only uris of these hosts are queried. Defaults to None.
+
+        Returns:
+            Dict[str, Set[Pair]]: uri -> matched pairs
+        """
+        if self.namespace is None:
+            self.namespace = self.query_executor.cache_namespace()
+        in_cache = self.cache.cached(self.namespace, pairs)
+        cached_pairs = [p for p in pairs if p in in_cache]
+        unseen_pairs = [p for p in pairs if p not in in_cache]
+
+        url_dict = defaultdict(lambda: set())
+        self.collect_from_corpus(unseen_pairs, url_dict, hosts)
+        if hosts is None:
+            # Results restricted to some hosts are incomplete, they must not be cached.
+            self.store_to_cache(url_dict, unseen_pairs)
+        self.collect_from_cache(cached_pairs, url_dict)
+        # The total cap applies to the merged result, cached pairs are capped as well.
+        return self.query_executor.cap_uris(url_dict)
+
     def collect_from_cache(self, pairs: List[Pair], url_dict: defaultdict):
-        for pair in pairs:
-            key = pair_to_cache_key(pair)
-            cachefile = os.path.join(self.cache_path, key)
-            content = decompress_file(cachefile)
-            for url in content.split("\n")[:-1]:
-                url_dict[url].add(pair)
-
-    def store_to_cache(self, url_dict: dict):
-        cache_dict = defaultdict(list)
-        for url, pairs in url_dict.items():
-            for pair in pairs:
-                cache_dict[pair].append(url)
-        for pair, urls in cache_dict.items():
-            self._store_to_cache(pair, urls)
-
-    def _store_to_cache(self, pair: Pair, urls: List[str]):
-        key = pair_to_cache_key(pair)
-        cachefile = os.path.join(self.cache_path, key)
-        content = decompress_file(cachefile)
-        content += "\n".join(urls) + "\n"
-        compress_file(cachefile, content)
-
-        self.values_in_cache.add(key)
+        if not pairs:
+            return
+        for url, url_pairs in self.cache.get(self.namespace, pairs).items():
+            url_dict[url].update(url_pairs)
+
+    def store_to_cache(self, url_dict: dict, pairs: List[Pair] = ()):
+        """Caches the uris of the queried 'pairs', pairs without any uri are cached as well.
+        'url_dict' must not be capped in total (see QueryExecutor.cap_uris), only per pair.
+        """
+        self.cache.put(self.namespace, pairs, url_dict)
 
     def collect_from_corpus(
-        self, pairs: List[Pair], url_dict: defaultdict
+        self, pairs: List[Pair], url_dict: defaultdict, hosts: Set[str] = None
     ) -> Dict[str, Set[Pair]]:
         if not pairs:
             return
 
         rw = ReportWriter()
         with rw.start_timer("DB Request"):
-            update_dict = self.query_executor.query_pairs(pairs)
-        url_dict.update(update_dict)
-
-    def _create_masks(self, pairs: List[Pair], token_dict: Dict[str, int]) -> Dict:
-        masks = {}
-        for pair in pairs:
-            masks[(pair, 0)] = tuple(
-                (token_dict[token], pos) for token, pos in pair.tok_inp
-            )
-            if isinstance(pair, Example):
-                masks[(pair, 1)] = tuple(
-                    (token_dict[token], pos) for token, pos in pair.tok_out
-                )
-        return masks
+            update_dict = self.query_executor.query_pairs(pairs, hosts)
+        for url, url_pairs in update_dict.items():
+            url_dict[url].update(url_pairs)
 
     def group_uritree(self, uritree: URITree) -> List[Tuple[str, List[str]]]:
-        """Groups the given uris into "WebResources". Grouping is based on common uris and 
-        the individual uris' matches (decision depends on 'resource_filter').
+        """Groups the given uris into "WebResources" (see URITreeNode.decompose) and selects 
+        the 'limit' resources that match the most queries over all hosts.
+        All resources of a host match a subset of the queries of its root, hosts that can not 
+        reach the selected resources are not decomposed.
 
         Args:
-            uris (Dict[str, Tuple[Set[int], Set[int]]]): A uri -> matches mapping (uris)
-            resource_filter ([type]): A filter that can be applied to bfs_filter.
+            uritree (URITree): The uris and their matches.
 
         Returns:
             List[Tuple[str, List[str]]]: A list of resources, each represented by a (partial) uri and all uris included in the resource.
+                Sorted by the number of matched queries (ties in the order of the hosts and of their decomposition).
         """
-
-        groups = []
-        for tree in uritree.root_nodes.values():
-            filter_result = tree.decompose(self.tau)
-            # filter_result = tree.bfs_filter(_resource_filter)
-            groups.extend(filter_result)
-            if self.limit > 0 and len(groups) >= self.limit:
-                break
-
-        if self.limit > 0:
-            groups = [
-                (t.path(), [l.uri for l in t.leaves()])
-                for t in sorted(groups, key=lambda t: -len(t.q_matches))
-            ]
-        return groups
+        # Min-heap of the best resources: (matched queries, -host, -position, node).
+        heap = []
+        trees = sorted(
+            enumerate(uritree.root_nodes.values()), key=lambda x: -popcount(x[1].q_bits)
+        )
+        for host, tree in trees:
+            if self.limit > 0 and len(heap) >= self.limit:
+                bound = (popcount(tree.q_bits), -host)
+                if bound[0] < heap[0][0]:
+                    # Hosts are sorted by their bound.
+                    break
+                if bound < heap[0][:2]:
+                    continue
+            for pos, node in enumerate(tree.decompose(self.tau)):
+                item = (popcount(node.q_bits), -host, -pos, node)
+                if self.limit <= 0 or len(heap) < self.limit:
+                    heappush(heap, item)
+                elif item[:3] > heap[0][:3]:
+                    heapreplace(heap, item)
+
+        return [
+            (node.path(), [l.uri for l in node.leaves()])
+            for *_, node in sorted(heap, key=lambda x: x[:3], reverse=True)
+        ]
@@ -1,4 +1,5 @@
-from typing import Dict, List, Set, Tuple
+from sys import intern
+from typing import Dict, Hashable, Iterable, List, Set, Tuple
 from urllib.parse import urlsplit
 
 from wpdxf.wrapping.objects.pairs import Example, Query
@@ -14,10 +15,14 @@ def uri_to_list(uri: str):
     return us.netloc, path
 
 
-def all_pw_disjoint(matches: List[set]) -> bool:
-    # All sets are pairwise disjunct,
-    # if there exists no duplicates between the already seen values and the current set.
-    _union = set()
+# Number of set bits of a bitset (int.bit_count requires Python 3.10).
+popcount = getattr(int, "bit_count", lambda bits: bin(bits).count("1"))
+
+
+def all_pw_disjoint(matches: Iterable[int]) -> bool:
+    # All bitsets are pairwise disjunct,
+    # if there exists no duplicates between the already seen values and the current bitset.
+    _union = 0
     for m in matches:
         if m & _union:
             return False
@@ -25,9 +30,40 @@ def all_pw_disjoint(matches: List[set]) -> bool:
     return True
 
 
+class PairIds:
+    """Maps the pairs (examples and queries) of a uri tree to dense integer ids,
+    such that the matches of a node are stored as a bitset (an int, bit i is set if pair i matches).
+    """
+
+    __slots__ = ("ids", "pairs")
+
+    def __init__(self) -> None:
+        self.ids: Dict[Hashable, int] = {}
+        self.pairs: List[Hashable] = []
+
+    def to_bits(self, pairs: Iterable[Hashable]) -> int:
+        bits = 0
+        for pair in pairs:
+            pid = self.ids.get(pair)
+            if pid is None:
+                pid = self.ids[pair] = len(self.pairs)
+                self.pairs.append(pair)
+            bits |= 1 << pid
+        return bits
+
+    def to_set(self, bits: int) -> set:
+        result = set()
+        while bits:
+            lowest = bits & -bits
+            result.add(self.pairs[lowest.bit_length() - 1])
+            bits ^= lowest
+        return result
+
+
 class URITree:
     def __init__(self) -> None:
         self.root_nodes = {}
+        self.pair_ids = PairIds()
 
     def __str__(self) -> str:
         return "\n".join(str(node) for node in self.root_nodes.values())
@@ -37,7 +73,7 @@ class URITree:
         if host not in self.root_nodes:
             if not allow_new:
                 return
-            root = URITreeNode(host, None)
+            root = URITreeNode(host, None, self.pair_ids)
             self.root_nodes[host] = root
         else:
             root = self.root_nodes[host]
@@ -46,7 +82,7 @@ class URITree:
 
     def reduce(self, tau):
         self.root_nodes = {
-            k: v for k, v in self.root_nodes.items() if len(v.ex_matches) >= tau
+            k: v for k, v in self.root_nodes.items() if popcount(v.ex_bits) >= tau
         }
 
     def to_dict(self):
@@ -57,12 +93,49 @@ class URITree:
 
 
 class URITreeNode:
-    def __init__(self, label, parent) -> None:
-        self.label = label
+    """A step of the uri paths in a uri tree. The matches of a node are stored as bitsets of pair ids
+    (see PairIds), which are shared by all nodes of a tree; 'ex_matches' and 'q_matches' decode them.
+
+    The leaves of a tree are listed once, in traversal order, by its root ('_leaves'), such that
+    the leaves of each node are the slice [leaf_start:leaf_end] of this list (see 'leaves').
+    The list is rebuilt after paths were added. Paths are computed once per node.
+    """
+
+    __slots__ = (
+        "label",
+        "parent",
+        "children",
+        "ex_bits",
+        "q_bits",
+        "uri",
+        "pair_ids",
+        "leaf_start",
+        "leaf_end",
+        "_leaves",
+        "_path",
+    )
+
+    def __init__(self, label, parent, pair_ids: PairIds = None) -> None:
+        self.label = intern(label)
         self.parent = parent
         self.children = dict()
-        self.ex_matches = set()
-        self.q_matches = set()
+        self.ex_bits = 0
+        self.q_bits = 0
+        self.uri = None
+        if pair_ids is None:
+            pair_ids = parent.pair_ids if parent is not None else PairIds()
+        self.pair_ids = pair_ids
+        self.leaf_start = self.leaf_end = 0
+        self._leaves = None
+        self._path = None
+
+    @property
+    def ex_matches(self) -> set:
+        return self.pair_ids.to_set(self.ex_bits)
+
+    @property
+    def q_matches(self) -> set:
+        return self.pair_ids.to_set(self.q_bits)
 
     def __str__(self) -> str:
         return self.__str_off__()  # self.label + ": " + str(self.children.keys())
@@ -110,6 +183,7 @@ class URITreeNode:
             Dict[str, URITree]: A forest of uritrees, as a dict (keys are the values of the trees' roots).
         """
         forest = {}
+        pair_ids = PairIds()
         for uri, (ex_matches, q_matches) in candidates.items():
             u_split = urlsplit(uri)
             path = u_split.path.split("/")[1:]
@@ -120,7 +194,7 @@ class URITreeNode:
 
             tree = forest.get(u_split.netloc)
             if tree is None:
-                tree = URITreeNode(u_split.netloc, None)
+                tree = URITreeNode(u_split.netloc, None, pair_ids)
                 forest[u_split.netloc] = tree
 
             tree.add_path(*path, ex_matches=ex_matches, q_matches=q_matches, leaf=uri)
@@ -139,10 +213,10 @@ class URITreeNode:
         Returns:
             URITreeNode: The child with value 'label'.
         """
-        if label in self.children:
-            return self.children[label]
-        child = URITreeNode(label, self)
-        self.children[label] = child
+        child = self.children.get(label)
+        if child is None:
+            child = URITreeNode(label, self, self.pair_ids)
+            self.children[child.label] = child
         return child
 
     def add_path(
@@ -156,10 +230,13 @@ class URITreeNode:
             q_matches (Set[int]): Queries matched by the path's leaf.
             leaf (str): The leaf's uri.
         """
+        ex_bits = self.pair_ids.to_bits(ex_matches)
+        q_bits = self.pair_ids.to_bits(q_matches)
+        self.root()._leaves = None
         node = self
         while node:
-            node.ex_matches |= set(ex_matches)
-            node.q_matches |= set(q_matches)
+            node.ex_bits |= ex_bits
+            node.q_bits |= q_bits
             if args:
                 arg0, *args = args
                 node = node.add_child(arg0)
@@ -167,16 +244,45 @@ class URITreeNode:
                 node.uri = leaf
                 node = None
 
-    def leaves(self):
-        return self.bfs_filter(lambda n: len(n.children) == 0)
-
-    def path(self):
-        path = self.label
-        parent = self.parent
-        while parent:
-            path = parent.label + "/" + path
-            parent = parent.parent
-        return path
+    def root(self) -> "URITreeNode":
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node
+
+    def leaves(self) -> List["URITreeNode"]:
+        """The leaves below self, in the order of 'bfs_filter'."""
+        root = self.root()
+        if root._leaves is None:
+            root._index_leaves()
+        return root._leaves[self.leaf_start : self.leaf_end]
+
+    def _index_leaves(self):
+        # A single traversal (in the order of 'bfs_filter') numbers all leaves,
+        # the leaves of each subtree are numbered consecutively.
+        leaves = []
+        stack = [(self, False)]
+        while stack:
+            node, visited = stack.pop()
+            if visited:
+                node.leaf_end = len(leaves)
+            elif not node.children:
+                node.leaf_start = len(leaves)
+                leaves.append(node)
+                node.leaf_end = len(leaves)
+            else:
+                node.leaf_start = len(leaves)
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children.values())
+        self._leaves = leaves
+
+    def path(self) -> str:
+        if self._path is None:
+            if self.parent is None:
+                self._path = self.label
+            else:
+                self._path = self.parent.path() + "/" + self.label
+        return self._path
 
     def bfs_filter(self, filter_func) -> list:
         """Traverses the tree with BFS-strategy. 
@@ -200,12 +306,15 @@ class URITreeNode:
         return result
 
     def decompose(self, tau) -> list:
-        children = list(
-            filter(lambda n: len(n.ex_matches) >= tau, self.children.values())
-        )
+        children = [n for n in self.children.values() if popcount(n.ex_bits) >= tau]
+        if not children:
+            return [self]
         # If a decomposition would result in a loss of queries,
         # return node as resource
-        if not children or set.union(*[n.q_matches for n in children]) < self.q_matches:
+        q_bits = 0
+        for n in children:
+            q_bits |= n.q_bits
+        if q_bits != self.q_bits and q_bits | self.q_bits == self.q_bits:
             return [self]
 
         decomposition = [_n for c in children for _n in c.decompose(tau)]
@@ -213,7 +322,7 @@ class URITreeNode:
         # If decomposition leads to partitions that have all pairwise disjunct example sets,
         # return node as resource.
         if len(decomposition) > 1 and all_pw_disjoint(
-            map(lambda x: x.ex_matches, decomposition)
+            map(lambda x: x.ex_bits, decomposition)
         ):
             return [self]
 
@@ -0,0 +1,270 @@
+import logging
+import os
+import sqlite3
+from hashlib import sha1
+from os import path
+from time import time
+from typing import Dict, Iterable, List, Set, Tuple
+
+from wpdxf.utils.settings import Settings
+from wpdxf.utils.utils import decompress_file
+from wpdxf.wrapping.objects.pairs import Example, Pair, Query
+
+CACHE_DB = "url_cache.sqlite"
+# Maximal number of keys per statement (SQLite limits the number of parameters).
+CHUNK_SIZE = 500
+
+SCHEMA = (
+    # Each queried pair (also if it did not match any uri), per namespace (see QueryExecutor.cache_namespace).
+    # size is the number of entries of a pair: its row and its uris.
+    """CREATE TABLE IF NOT EXISTS pairs(
+        pairid INTEGER PRIMARY KEY, namespace VARCHAR NOT NULL, key VARCHAR NOT NULL,
+        size INTEGER NOT NULL, hits INTEGER NOT NULL DEFAULT 0, last_used REAL NOT NULL,
+        UNIQUE(namespace, key))""",
+    "CREATE TABLE IF NOT EXISTS pair_uris(pairid INTEGER NOT NULL, uri VARCHAR NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS pair_uris_idx ON pair_uris(pairid)",
+)
+
+# Order in which pairs are evicted.
+EVICTION_ORDER = {"lru": "last_used, pairid", "lfu": "hits, last_used, pairid"}
+
+
+def pair_to_cache_key(p: Pair):
+    k0, k1 = (p.inp, "") if isinstance(p, Query) else p.pair
+    return f"{sha1(k0.encode()).hexdigest()}_{sha1(k1.encode()).hexdigest()}"
+
+
+def cache_key_to_pair(k: Tuple[str, str]):
+    return Query(*k) if k[1] == "" else Example(*k)
+
+
+def _chunks(items: list) -> Iterable[list]:
+    for i in range(0, len(items), CHUNK_SIZE):
+        yield items[i : i + CHUNK_SIZE]
+
+
+class URLCache:
+    """The uris matched by each queried pair, stored in a single SQLite database (WAL mode) in URL_CACHE.
+    Opening the cache does not depend on its size, lookups and inserts are batched
+    and a pair's uris are written once (append-only).
+
+    Entries are stored per namespace, which identifies the corpus version and the query parameters
+    (see QueryExecutor.cache_namespace). Entries of any other namespace are never returned,
+    they are eventually evicted (or removed by 'purge').
+    """
+
+    def __init__(self, cache_path: str = None, limit: int = 0, eviction: str = "lru") -> None:
+        """
+        Args:
+            cache_path (str, optional): Directory of the cache. Defaults to None (URL_CACHE).
+            limit (int, optional): Maximal number of entries (a row per pair and per uri of a pair), 
+                0 for no limit. Defaults to 0.
+            eviction (str, optional): Pairs evicted first if the limit is exceeded, 
+                "lru" (least recently used) or "lfu" (least frequently used). Defaults to "lru".
+        """
+        assert eviction in EVICTION_ORDER
+        self.cache_path = cache_path or Settings().URL_CACHE
+        self.limit = limit
+        self.eviction = eviction
+        self.hits = 0
+        self.misses = 0
+        # Running number of entries, only rescanned once it exceeds the limit (see 'evict').
+        self._size = None
+        self._connection = None
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(self.cache_path, exist_ok=True)
+            self._connection = sqlite3.connect(path.join(self.cache_path, CACHE_DB))
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            columns = set(c for _, c, *_ in self._connection.execute("PRAGMA table_info(pairs)"))
+            if columns and "namespace" not in columns:
+                # Entries without namespace can not be validated, the former layout is dropped.
+                self._connection.execute("DROP TABLE pairs")
+                self._connection.execute("DROP TABLE pair_uris")
+            for stmt in SCHEMA:
+                self._connection.execute(stmt)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _pairids(self, namespace: str, keys: List[str]) -> Dict[str, int]:
+        pairids = {}
+        for chunk in _chunks(keys):
+            stmt = f"SELECT key, pairid FROM pairs WHERE namespace = ? AND key IN ({', '.join('?' * len(chunk))})"
+            pairids.update(self.connection.execute(stmt, [namespace, *chunk]))
+        return pairids
+
+    def cached(self, namespace: str, pairs: List[Pair]) -> Set[Pair]:
+        """The given pairs that are in the cache (a single lookup per CHUNK_SIZE pairs).
+        Counted as hits and misses (see 'stats').
+        """
+        key_dict = {pair_to_cache_key(p): p for p in pairs}
+        cached = set(key_dict[key] for key in self._pairids(namespace, list(key_dict)))
+        self.hits += len(cached)
+        self.misses += len(key_dict) - len(cached)
+        return cached
+
+    def get(self, namespace: str, pairs: List[Pair]) -> Dict[str, Set[Pair]]:
+        """The cached uris of the given pairs, marks the pairs as used.
+
+        Returns:
+            Dict[str, Set[Pair]]: uri -> matched pairs
+        """
+        key_dict = {pair_to_cache_key(p): p for p in pairs}
+        pair_dict = {
+            pairid: key_dict[key]
+            for key, pairid in self._pairids(namespace, list(key_dict)).items()
+        }
+        url_dict = {}
+        now = time()
+        with self.connection:
+            for chunk in _chunks(list(pair_dict)):
+                interval = ", ".join("?" * len(chunk))
+                stmt = f"SELECT pairid, uri FROM pair_uris WHERE pairid IN ({interval})"
+                for pairid, uri in self.connection.execute(stmt, chunk):
+                    url_dict.setdefault(uri, set()).add(pair_dict[pairid])
+                self.connection.execute(
+                    f"UPDATE pairs SET hits = hits + 1, last_used = ? WHERE pairid IN ({interval})",
+                    [now, *chunk],
+                )
+        return url_dict
+
+    def put(self, namespace: str, pairs: List[Pair], url_dict: Dict[str, Iterable[Pair]]):
+        """Stores the result of querying 'pairs' (pairs without any uri included).
+        Pairs that are cached already are not changed.
+
+        Args:
+            namespace (str): See QueryExecutor.cache_namespace.
+            pairs (List[Pair]): The queried pairs.
+            url_dict (Dict[str, Iterable[Pair]]): uri -> matched pairs, the query result.
+        """
+        pair_urls = {pair_to_cache_key(p): [] for p in pairs}
+        for url, url_pairs in url_dict.items():
+            for pair in url_pairs:
+                pair_urls.setdefault(pair_to_cache_key(pair), []).append(url)
+        self._put(namespace, pair_urls)
+
+    def _put(self, namespace: str, pair_urls: Dict[str, List[str]]):
+        new_keys = set(pair_urls) - set(self._pairids(namespace, list(pair_urls)))
+        if not new_keys:
+            return
+        now = time()
+        pairids = {}
+        with self.connection:
+            for key in new_keys:
+                # Another process may have stored the pair since the lookup, its entry is kept.
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO pairs(namespace, key, size, last_used) VALUES (?, ?, ?, ?)",
+                    (namespace, key, len(pair_urls[key]) + 1, now),
+                )
+                if cursor.rowcount:
+                    pairids[key] = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO pair_uris VALUES (?, ?)",
+                ((pairid, url) for key, pairid in pairids.items() for url in pair_urls[key]),
+            )
+        if self._size is not None:
+            self._size += sum(len(pair_urls[key]) + 1 for key in pairids)
+        self.evict(keep=set(pairids.values()))
+
+    def size(self) -> int:
+        """Number of entries in the cache (see 'limit')."""
+        (size,) = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM pairs").fetchone()
+        self._size = size
+        return size
+
+    def evict(self, keep: Set[int] = ()) -> int:
+        """Evicts pairs (see 'eviction') until the cache does not exceed its limit.
+
+        Args:
+            keep (Set[int], optional): Pairs that are not evicted, e.g. the ones just stored
+                (they were not used yet and would be evicted first by "lfu"). Defaults to ().
+
+        Returns:
+            int: Number of evicted pairs.
+        """
+        if self.limit <= 0:
+            return 0
+        if self._size is not None and self._size <= self.limit:
+            return 0
+        # Rescan, other processes may have evicted entries.
+        excess = self.size() - self.limit
+        if excess <= 0:
+            return 0
+        evicted = []
+        stmt = f"SELECT pairid, size FROM pairs ORDER BY {EVICTION_ORDER[self.eviction]}"
+        for pairid, size in self.connection.execute(stmt):
+            if pairid in keep:
+                continue
+            evicted.append(pairid)
+            excess -= size
+            if excess <= 0:
+                break
+        self._delete(evicted)
+        self._size = self.limit + excess
+        logging.info(f"Evicted {len(evicted)} pairs from the url cache.")
+        return len(evicted)
+
+    def purge(self, namespace: str) -> int:
+        """Removes all pairs of other namespaces than 'namespace', i.e. outdated results.
+
+        Returns:
+            int: Number of removed pairs.
+        """
+        stmt = "SELECT pairid FROM pairs WHERE namespace != ?"
+        purged = [pairid for pairid, in self.connection.execute(stmt, (namespace,))]
+        self._delete(purged)
+        self._size = None
+        logging.info(f"Purged {len(purged)} pairs from the url cache.")
+        return len(purged)
+
+    def _delete(self, pairids: List[int]):
+        with self.connection:
+            for chunk in _chunks(pairids):
+                interval = ", ".join("?" * len(chunk))
+                self.connection.execute(f"DELETE FROM pair_uris WHERE pairid IN ({interval})", chunk)
+                self.connection.execute(f"DELETE FROM pairs WHERE pairid IN ({interval})", chunk)
+
+    def stats(self) -> dict:
+        """Hits and misses of 'cached' (since the cache was created) and the current size."""
+        (pairs,) = self.connection.execute("SELECT COUNT(*) FROM pairs").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "pairs": pairs,
+            "entries": self.size(),
+        }
+
+    def import_legacy(self, namespace: str) -> int:
+        """Imports the files of the former cache layout (a gzip file of uris per pair,
+        named by 'pair_to_cache_key') in cache_path, the files are kept.
+        The files do not record the corpus they were queried from, 'namespace' must match it.
+
+        Returns:
+            int: Number of imported pairs.
+        """
+        pair_urls = {}
+        num_pairs = 0
+        for entry in os.scandir(self.cache_path):
+            if entry.is_file() and not entry.name.startswith(CACHE_DB):
+                content = decompress_file(entry.path)
+                pair_urls[entry.name] = content.split("\n")[:-1]
+            if len(pair_urls) >= CHUNK_SIZE:
+                self._put(namespace, pair_urls)
+                num_pairs += len(pair_urls)
+                pair_urls.clear()
+        self._put(namespace, pair_urls)
+        num_pairs += len(pair_urls)
+        logging.info(f"Imported {num_pairs} pairs into the url cache.")
+        return num_pairs
@@ -1,6 +1,7 @@
 from collections import defaultdict
 from typing import Dict, Set, Tuple
 
+from lxml import etree
 from lxml.etree import _Element
 from wpdxf.corpus.retrieval.warc.warcrecord import get_html
 from wpdxf.wrapping.objects.pairs import Pair
@@ -13,6 +14,7 @@ class WebPage:
         self._examples = defaultdict(set)
         self._queries = defaultdict(set)
         self._html: str = None
+        self._tree: _Element = None
         self._xpath_cache: Dict[_Element, XPath] = {}
 
     def __str__(self) -> str:
@@ -24,6 +26,14 @@ class WebPage:
             self._html = get_html(self.uri)
         return self._html
 
+    def tree(self) -> _Element:
+        """A parsed tree of the html. The cleaned tree of a freshly retrieved webpage (see Resource.fetch_html)
+        is handed out once instead of parsing the html again, each further call parses the html."""
+        tree, self._tree = self._tree, None
+        if tree is None:
+            tree = etree.HTML(self.html)
+        return tree
+
     @property
     def examples(self) -> Dict[Pair, Set[Tuple[_Element, _Element]]]:
         return dict(self._examples)
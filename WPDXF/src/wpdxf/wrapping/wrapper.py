@@ -3,13 +3,25 @@ from typing import Dict, List, Set, Tuple
 
 from lxml.etree import _ElementUnicodeResult
 from wpdxf.corpus.parsers.textparser import TextParser
+from wpdxf.corpus.retrieval.warc.prefetch import HTMLPrefetcher
 from wpdxf.utils.report import ReportWriter
 from wpdxf.wrapping.objects.pairs import Example, Query
 from wpdxf.wrapping.objects.resource import Resource
 from wpdxf.wrapping.objects.resourceCollector import ResourceCollector
 
 
-def wrap(examples, queries, query_executor, tau, evaluator, reducer, induction):
+def wrap(
+    examples,
+    queries,
+    query_executor,
+    tau,
+    evaluator,
+    reducer,
+    induction,
+    prefilter_hosts=False,
+    url_cache=None,
+    html_workers=8,
+):
     rw = ReportWriter()
 
     def tau_filter(resource: Resource):
@@ -19,67 +31,80 @@ def wrap(examples, queries, query_executor, tau, evaluator, reducer, induction):
     queries = [*map(Query, queries)]
 
     print("Collecting Resources")
-    resources = ResourceCollector(query_executor, tau).collect(examples, queries)
+    resources = ResourceCollector(
+        query_executor, tau, prefilter_hosts=prefilter_hosts, cache=url_cache
+    ).collect(examples, queries)
     print(f"Resulted in {len(resources)} resources")
     tables = {}
     rw.start_timer("Full Evaluation")
-    for i, _resource in enumerate(resources):
-        resource = Resource(*_resource)
-        print(f"Process Resource {i+1}: {resource.identifier}")
-
-        with rw.start_timer(f"Eval0: {resource.identifier}"):
-            evaluator.evaluate_initial(resource, examples, queries)
-        rw.append_resource_info(
-            f"Initial Evaluation: {resource.identifier}", resource.info()
-        )
-
-        if not tau_filter(resource):
-            continue
-
-        with rw.start_timer(f"Red0: {resource.identifier}"):
-            reducer.reduce_ambiguity(resource)
-        rw.append_resource_info(
-            f"Reduce Ambiguity: {resource.identifier}", resource.info()
-        )
-
-        if not tau_filter(resource):
-            continue
-
-        cnt = count()
-        while True:
-            # Wrapper Induction
-            iteration = next(cnt)
-            with rw.start_timer(f"Induction ({iteration}) {resource.identifier}"):
-                induction.induce(resource, examples)
+    prefetcher = HTMLPrefetcher(html_workers) if html_workers > 0 else None
+    try:
+        if prefetcher is not None:
+            # The pages of later resources are retrieved while earlier resources are evaluated.
+            prefetcher.submit(uri for _, uris in resources for uri in uris)
+        for i, _resource in enumerate(resources):
+            resource = Resource(*_resource)
+            print(f"Process Resource {i+1}: {resource.identifier}")
+            with rw.start_timer(f"HTML: {resource.identifier}"):
+                resource.fetch_html(prefetcher)
+
+            with rw.start_timer(f"Eval0: {resource.identifier}"):
+                evaluator.evaluate_initial(resource, examples, queries)
             rw.append_resource_info(
-                f"Induction ({iteration}): {resource.identifier}", resource.info()
+                f"Initial Evaluation: {resource.identifier}", resource.info()
             )
-            # Wrapper evaluation
-            with rw.start_timer(f"Eval ({iteration}) {resource.identifier}"):
-                eval_result = evaluator.evaluate(resource, examples, queries)
 
-            table = create_table(eval_result, examples, queries)
-            rw.append_query_evaluation(f"{iteration} - {resource.identifier}\n{resource._xpath}\n{resource._vars}", table)
-
-            table = reduce_table(table)
-            if len([*filter(lambda x: x[1] is not None, table)]) >= tau:
-                skip_resource = False
-                break
+            if not tau_filter(resource):
+                continue
 
-            with rw.start_timer(f"Red ({iteration}) {resource.identifier}"):
-                reducer.reduce(resource)
+            with rw.start_timer(f"Red0: {resource.identifier}"):
+                reducer.reduce_ambiguity(resource)
             rw.append_resource_info(
-                f"Red ({iteration}) {resource.identifier}", resource.info()
+                f"Reduce Ambiguity: {resource.identifier}", resource.info()
             )
 
             if not tau_filter(resource):
-                skip_resource = True
-                break
+                continue
 
-        if skip_resource:
-            continue
+            cnt = count()
+            while True:
+                # Wrapper Induction
+                iteration = next(cnt)
+                with rw.start_timer(f"Induction ({iteration}) {resource.identifier}"):
+                    induction.induce(resource, examples)
+                rw.append_resource_info(
+                    f"Induction ({iteration}): {resource.identifier}", resource.info()
+                )
+                # Wrapper evaluation
+                with rw.start_timer(f"Eval ({iteration}) {resource.identifier}"):
+                    eval_result = evaluator.evaluate(resource, examples, queries)
+
+                table = create_table(eval_result, examples, queries)
+                rw.append_query_evaluation(f"{iteration} - {resource.identifier}\n{resource._xpath}\n{resource._vars}", table)
+
+                table = reduce_table(table)
+                if len([*filter(lambda x: x[1] is not None, table)]) >= tau:
+                    skip_resource = False
+                    break
+
+                with rw.start_timer(f"Red ({iteration}) {resource.identifier}"):
+                    reducer.reduce(resource)
+                rw.append_resource_info(
+                    f"Red ({iteration}) {resource.identifier}", resource.info()
+                )
+
+                if not tau_filter(resource):
+                    skip_resource = True
+                    break
+
+            if skip_resource:
+                continue
 
-        tables[resource.identifier] = table
+            tables[resource.identifier] = table
+    finally:
+        # Pending retrievals are cancelled, also if the evaluation fails.
+        if prefetcher is not None:
+            prefetcher.close()
 
     rw.end_timer()
     return tables